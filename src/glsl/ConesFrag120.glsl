@@ -0,0 +1,64 @@
+#version 120
+
+/**
+ * Truncated cone imposter fragment shader.
+ */
+
+/*
+ * Copyright 2010 Howard Hughes Medical Institute.
+ * All rights reserved.
+ * Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+ * license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+ */
+
+varying vec3 pos;
+varying vec4 surface_color;
+
+// primary cone parameters
+varying float radius;
+varying vec3 center;
+varying float taper;
+varying float halfConeLength; // For truncating ends
+varying vec3 aHat; // unit cone axis
+
+// derived linear ray casting parameters, best computed in vertex/geometry shader
+varying float tAP, qe_c, qe_half_b;
+varying vec3 qe_undot_half_a;
+varying float normalScale;
+
+// prototypes defined in imposter_fns120.glsl
+bool cone_imposter_frag(
+        in vec3 surface_color,
+        in vec3 pos, // location of imposter geometry fragment
+        in vec3 aHat, // unit cone axis
+        in float halfConeLength,
+        in vec3 center,
+        in float taper,
+        in float tAP,
+        in float qe_c,
+        in float qe_half_b,
+        in vec3 qe_undot_half_a,
+        in float normalScale,
+        out vec4 fragColor,
+        out float fragDepth);
+
+void main() {
+
+    if ( ! cone_imposter_frag(
+            surface_color.rgb,
+            pos,
+            aHat,
+            halfConeLength,
+            center,
+            taper,
+            tAP,
+            qe_c,
+            qe_half_b,
+            qe_undot_half_a,
+            normalScale,
+            gl_FragColor,
+            gl_FragDepth) )
+    {
+        discard;
+    }
+}
@@ -34,12 +34,21 @@
  * SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
  */
 
-uniform vec4 color = vec4(0, 1, 0, 1); // one color for all cones
+#ifdef CONSERVATIVE_DEPTH
+// Promise that the ray-cast depth is never nearer than the hull depth, so
+// that the early depth test can reject hidden hull fragments before the
+// ray-cast. The host program defines CONSERVATIVE_DEPTH together with a hull
+// in front of the cone; see ConesGeom330.glsl.
+#extension GL_ARB_conservative_depth : require
+layout(depth_greater) out float gl_FragDepth;
+#endif
+
 uniform mat4 projectionMatrix; // needed for proper depth calculation
 uniform sampler2D lightProbe; // for image-based-lighting (IBL)
 
 
 in float fragRadius; // average radius of cone
+in vec4 surfaceColor; // color from node_color330.glsl
 in vec3 center; // center of cone, in camera frame
 in float taper; // change in radius per distance along cone axis
 in vec3 halfAxis;
@@ -55,7 +64,12 @@ in float normalScale;
 in float bViewAlongCone; // Is view angle less than taper angle?
 
 
-out vec4 fragColor;
+layout(location = 0) out vec4 fragColor;
+#ifdef DEFERRED
+// With DEFERRED defined, fragColor holds the unlit surface color, and
+// fragNormal the surface normal, in camera frame, for DeferredFrag330.glsl
+layout(location = 1) out vec4 fragNormal;
+#endif
 
 
 // forward declaraion of methods defined in imposter_fns330.glsl
@@ -122,11 +136,23 @@ void main() {
         normal = vec3(0, 0, 1); // slice core parallel to screen
     } /* */
 
+#ifdef CONSERVATIVE_DEPTH
+    // Keep the promise where the hull is not wholly in front of the surface,
+    // as near the edges of a wide field of view
+    gl_FragDepth = max(gl_FragDepth, gl_FragCoord.z);
+#endif
+
+#ifdef DEFERRED
+    // Lighting is applied later, once per pixel
+    fragColor = surfaceColor;
+    fragNormal = vec4(normal, 1);
+#else
     // illuminate the cone surface
-    vec3 reflectColor = mix(color.rgb, vec3(1,1,1), 0.5); // midway between metal and plastic.
+    vec3 reflectColor = mix(surfaceColor.rgb, vec3(1,1,1), 0.5); // midway between metal and plastic.
     fragColor = vec4(
-        image_based_lighting(s, normal, color.rgb, reflectColor, lightProbe),
-        // light_rig(s, normal, color.rgb),
-        color.a);
+        image_based_lighting(s, normal, surfaceColor.rgb, reflectColor, lightProbe),
+        // light_rig(s, normal, surfaceColor.rgb),
+        surfaceColor.a);
+#endif
 
 }
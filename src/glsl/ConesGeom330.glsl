@@ -45,9 +45,11 @@ layout(triangle_strip, max_vertices=12) out;
 
 
 in float geomRadius[]; // radius at end of cone as vertex attribute
+in vec4 geomColor[]; // color of each end of cone
 
 
 out float fragRadius; // average radius of cone
+out vec4 surfaceColor; // color of cone
 out vec3 center; // center of cone, in camera frame
 out float taper; // change in radius per distance along cone axis
 out vec3 halfAxis;
@@ -154,6 +156,8 @@ void main() {
     vec3 c2 = posIn1.xyz/posIn1.w; // center of larger cone end
     float r1 = geomRadius[0];
     float r2 = geomRadius[1];
+    // Lines run from parent to child, and each cone takes the color of its child node
+    surfaceColor = geomColor[1];
 
     // To make cones line up perfectly with the spheres, the ends
     // and radii need to be changed. Either on the CPU,
@@ -250,5 +254,9 @@ void main() {
             y * r2, 
             z * r2);
 
+#ifdef CONSERVATIVE_DEPTH
+    near_cone_hull(frame2348, frame1567); // in front of the cone, for depth_greater in ConesFrag330.glsl
+#else
     far_cone_hull(frame2348, frame1567); // near cone hull
+#endif
 }
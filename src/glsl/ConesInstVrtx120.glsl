@@ -0,0 +1,88 @@
+#version 120
+
+/**
+ * Instanced truncated cone imposter vertex shader.
+ *
+ * Every instance draws the same unit hull strip, with per instance
+ * attributes advancing once per cone (glVertexAttribDivisor). The hull box
+ * is oriented here, as in ConeSegment.generateBoundingGeometryImmediate(),
+ * instead of on the host. Outputs match ConesVrtx120.glsl, so
+ * ConesFrag120.glsl is used unchanged.
+ *
+ * Compact instances store the center as normalized 16 bit integers, which
+ * positionScale and positionOrigin map back to model coordinates, the half
+ * axis as a normalized 16 bit direction and a half float length, and the
+ * radius and taper as half floats.
+ */
+
+/*
+ * Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+ * license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+ */
+
+attribute vec3 hullCorner; // per vertex: corner of the unit cube, each coordinate +-1
+attribute vec3 instanceCenter; // per instance: cone center, before positionScale and positionOrigin
+attribute float instanceRadius; // per instance: radius at center
+attribute vec3 instanceAxis; // per instance: half axis, toward the smaller end, or its direction
+attribute float instanceAxisLength; // per instance: length of the half axis, or 1 with a full half axis
+attribute float instanceTaper; // per instance
+attribute vec4 instanceColor; // per instance
+
+// Decoding of instanceCenter; full float instances keep the defaults
+uniform vec3 positionOrigin = vec3(0, 0, 0);
+uniform vec3 positionScale = vec3(1, 1, 1);
+
+varying vec3 pos;
+varying vec4 surface_color;
+
+// primary cone parameters
+varying float radius;
+varying vec3 center;
+varying float taper;
+varying float halfConeLength; // For truncating ends
+varying vec3 aHat; // unit cone axis
+
+// derived linear ray casting parameters, best computed in vertex/geometry shader
+varying float tAP, qe_c, qe_half_b;
+varying vec3 qe_undot_half_a;
+varying float normalScale;
+
+// function prototypes from imposter_fns120.glsl
+void cone_linear_coeffs(vec3 center, float radius, vec3 axis, float taper, vec3 pos,
+    out float tAP, out float qe_c, out float qe_half_b, out vec3 qe_undot_half_a);
+
+void main() {
+    vec3 center_local = instanceCenter * positionScale + positionOrigin;
+    vec3 axis_local = instanceAxis * instanceAxisLength;
+    radius = instanceRadius;
+    taper = instanceTaper;
+
+    // Principal axes of the hull box, in model coordinates
+    float d = length(axis_local);
+    vec3 xHat = axis_local / d; // toward smaller end of cone
+    // To avoid numerical problems, try two different ways to create first orthogonal vector
+    vec3 yHat1 = cross(xHat, vec3(1, 0, 0));
+    vec3 yHat2 = cross(xHat, vec3(0, 0, 1));
+    vec3 yHat = normalize(dot(yHat1, yHat1) >= dot(yHat2, yHat2) ? yHat1 : yHat2);
+    vec3 zHat = cross(xHat, yHat);
+    // End radii, from the radius at the center
+    float r = radius - sign(hullCorner.x) * taper * d;
+    vec3 offset = hullCorner.x * d * xHat + r * (hullCorner.y * yHat + hullCorner.z * zHat);
+
+    vec4 pos1 = gl_ModelViewMatrix * vec4(center_local + offset, 1);
+    gl_Position = gl_ProjectionMatrix * pos1;
+    surface_color = instanceColor;
+
+    vec4 c = gl_ModelViewMatrix * vec4(center_local, 1);
+    center = c.xyz/c.w;
+
+    vec3 axis = (gl_ModelViewMatrix * vec4(axis_local, 0)).xyz;
+    halfConeLength = length(axis);
+
+    pos = pos1.xyz/pos1.w;
+    cone_linear_coeffs(center, radius, axis, taper, pos,
+        tAP, qe_c, qe_half_b, qe_undot_half_a);
+
+    aHat = normalize(axis);
+    normalScale  = 1.0 / sqrt(1.0 + taper*taper);
+}
@@ -0,0 +1,171 @@
+#version 330
+
+/**
+ * Cone imposter vertex shader without a geometry shader.
+ *
+ * Each instance is one cone, drawn as a 12 vertex triangle strip around the
+ * same bounding prism that ConesGeom330.glsl emits. The shader pulls the
+ * cone parameters, precomputed on the host, from buffer textures by
+ * gl_InstanceID, and places the strip corner selected by gl_VertexID.
+ */
+
+/* 
+ * Licensed under the Janelia Farm Research Campus Software Copyright 1.1
+ * 
+ * Copyright (c) 2014, Howard Hughes Medical Institute, All rights reserved.
+ * 
+ * Redistribution and use in source and binary forms, with or without 
+ * modification, are permitted provided that the following conditions are met:
+ * 
+ *     1. Redistributions of source code must retain the above copyright notice, 
+ *        this list of conditions and the following disclaimer.
+ *     2. Redistributions in binary form must reproduce the above copyright 
+ *        notice, this list of conditions and the following disclaimer in the 
+ *        documentation and/or other materials provided with the distribution.
+ *     3. Neither the name of the Howard Hughes Medical Institute nor the names 
+ *        of its contributors may be used to endorse or promote products derived 
+ *        from this software without specific prior written permission.
+ * 
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+ * AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, ANY 
+ * IMPLIED WARRANTIES OF MERCHANTABILITY, NON-INFRINGEMENT, OR FITNESS FOR A 
+ * PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR 
+ * CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+ * EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+ * PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+ * REASONABLE ROYALTIES; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS 
+ * SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+uniform mat4 modelViewMatrix = mat4(1);
+uniform mat4 projectionMatrix = mat4(1);
+uniform samplerBuffer cones; // two RGBA32F texels per cone, as CONE_TEXEL_DTYPE in neuron_renderer330.py
+uniform usamplerBuffer coneLines; // (parent, child) node indices of each cone
+uniform samplerBuffer colorValues; // node_color_fields() rows, one float per node
+uniform int colorValueOffset = 0; // first texel of the colorBy row of colorValues
+uniform usamplerBuffer drawOrder; // cone indices, nearest first
+uniform int drawOrderOffset = -1; // first texel of the cone order in drawOrder, or -1 to draw in cone order
+
+
+// The same outputs as ConesGeom330.glsl, for ConesFrag330.glsl
+out float fragRadius; // average radius of cone
+out vec4 surfaceColor; // color of cone
+out vec3 center; // center of cone, in camera frame
+out float taper; // change in radius per distance along cone axis
+out vec3 halfAxis;
+// the *linear* coefficients of the ray-tracing quadratic formula
+out float tAP; // cone ray-casting quadratic-formula linear (actually constant) coefficient
+out float qe_c; // cone ray-casting quadratic-formula linear coefficient
+out float qe_half_b; // cone ray-casting quadratic-formula linear coefficient
+out vec3 qe_undot_half_a; // cone ray-casting quadratic-formula linear coefficient
+out float halfConeLength;
+out vec3 aHat;
+out vec3 imposterPos; // location of imposter bounding geometry, in camera frame
+out float normalScale;
+out float bViewAlongCone; // Is view angle less than taper angle?
+
+
+vec4 node_color(float colorValue); // defined in node_color330.glsl
+// defined in imposter_fns330.glsl
+void cone_linear_coeffs(in vec3 center, in float radius, in vec3 axis, in float taper, in vec3 pos,
+        out float tAP, out float qe_c, out float qe_half_b, out vec3 qe_undot_half_a);
+
+
+// Corners of the bounding prism, as in ConesGeom330.glsl, in the order of
+// its far_cone_hull() and near_cone_hull() strips. Corners with x = -1
+// lie at the end of the prism that the x axis points away from.
+/*
+      2___________7                  
+      /|         /|
+     / |        / |                Y
+   3/_________1/  |                ^
+    | 8|_______|__|6               |
+    |  /       |  /                |
+    | /        | /                 /---->X
+    |/_________|/                 /
+    4          5                 /
+                                Z
+*/
+#ifdef CONSERVATIVE_DEPTH
+// near hull, in front of the cone, for depth_greater in ConesFrag330.glsl
+const vec3 hullStrip[12] = vec3[12](
+        vec3(+1,-1,-1), vec3(+1,+1,-1), vec3(+1,-1,+1), vec3(+1,+1,+1), // 6 7 5 1
+        vec3(-1,+1,+1), vec3(+1,+1,-1), vec3(-1,+1,-1), vec3(+1,-1,-1), // 3 7 2 6
+        vec3(-1,-1,-1), vec3(+1,-1,+1), vec3(-1,-1,+1), vec3(-1,+1,+1)); // 8 5 4 3
+#else
+// far hull
+const vec3 hullStrip[12] = vec3[12](
+        vec3(-1,-1,-1), vec3(-1,+1,-1), vec3(-1,-1,+1), vec3(-1,+1,+1), // 8 2 4 3
+        vec3(+1,+1,+1), vec3(-1,+1,-1), vec3(+1,+1,-1), vec3(-1,-1,-1), // 1 2 7 8
+        vec3(+1,-1,-1), vec3(-1,-1,+1), vec3(+1,-1,+1), vec3(+1,+1,+1)); // 6 4 5 1
+#endif
+
+
+void main() {
+    int cone = gl_InstanceID;
+    if (drawOrderOffset >= 0)
+        cone = int(texelFetch(drawOrder, drawOrderOffset + gl_InstanceID).r);
+    vec4 centerRadius = texelFetch(cones, 2 * cone);
+    vec4 axisTaper = texelFetch(cones, 2 * cone + 1);
+    // Lines run from parent to child, and each cone takes the color of its child node
+    int child = int(texelFetch(coneLines, cone).g);
+    surfaceColor = node_color(texelFetch(colorValues, colorValueOffset + child).r);
+
+    // The view independent terms were computed on the host, in model
+    // coordinates, so only need to follow the model view matrix here
+    vec4 c = modelViewMatrix * vec4(centerRadius.xyz, 1);
+    center = c.xyz/c.w; // centroid of cone
+    halfAxis = mat3(modelViewMatrix) * axisTaper.xyz; // toward the smaller end
+    fragRadius = length(modelViewMatrix[0].xyz) * centerRadius.w; // radius at cone center
+    taper = axisTaper.w;
+    halfConeLength = length(halfAxis);
+    aHat = halfAxis / halfConeLength;
+    normalScale = 1.0 / sqrt(1.0 + taper*taper);
+    float r1 = fragRadius - taper * halfConeLength; // radius at smaller end
+    float r2 = fragRadius + taper * halfConeLength; // radius at larger end
+
+    // Decide whether view direction is sort of "along" cone axis, or 
+    // sort of perpendicular to cone axis. Each case has different ray 
+    // casting consequences.
+    bViewAlongCone = 0; // default to false
+    if (abs(taper) > 1e-4) { // not for cylinders...
+        float cos_cone_angle = abs(cos(atan(r2 - r1, 2.0 * halfConeLength)));
+        vec3 cone_tip = center + aHat * fragRadius/taper;
+        float cos_view_angle = abs(dot(normalize(cone_tip), aHat));
+        if (cos_view_angle > cos_cone_angle) bViewAlongCone = 1; // true
+    }
+
+    // Local coordinate system of cone bounding box, as in ConesGeom330.glsl,
+    // with the "X" axis along the cone axis, generally toward the viewer
+    vec3 x = -aHat;
+    if (dot(x, center) > 0) {
+        x = -x; // point in opposite direction
+        // and keep each radius with its own end
+        float tmp = r1;
+        r1 = r2;
+        r2 = tmp;
+    }
+    // To minimize overdraw, y should point out of the screen
+    vec3 in_screen = cross(x, center);
+    vec3 y = normalize(cross(x, in_screen));
+    vec3 z = normalize(cross(x, y));
+    // Ensure coordinate axes are a) right handed and b) out of the screen
+    if (dot(z, center) > 0) z = -z;
+    if (dot(y, center) > 0) y = -y;
+    if (dot( cross(x, y), z) < 0) {
+        // swap y and z
+        vec3 temp = y;
+        y = z;
+        z = temp;
+    }
+
+    // Only this vertex of the hull strip is computed here
+    vec3 corner = hullStrip[gl_VertexID];
+    float r = corner.x < 0 ? r1 : r2;
+    imposterPos = center + mat3(halfConeLength * x, r * y, r * z) * corner;
+    gl_Position = projectionMatrix * vec4(imposterPos, 1);
+    cone_linear_coeffs(center, fragRadius, halfAxis, taper, imposterPos,
+        tAP, qe_c, qe_half_b, qe_undot_half_a);
+}
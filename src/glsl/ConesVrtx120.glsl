@@ -0,0 +1,56 @@
+#version 120
+
+/**
+ * Truncated cone imposter vertex shader, for bounding geometry from ConeSegment.generateBoundingGeometryImmediate().
+ */
+
+/*
+ * Copyright 2010 Howard Hughes Medical Institute.
+ * All rights reserved.
+ * Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+ * license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+ */
+
+varying vec3 pos;
+varying vec4 surface_color;
+
+// primary cone parameters
+varying float radius;
+varying vec3 center;
+varying float taper;
+varying float halfConeLength; // For truncating ends
+varying vec3 aHat; // unit cone axis
+
+// derived linear ray casting parameters, best computed in vertex/geometry shader
+varying float tAP, qe_c, qe_half_b;
+varying vec3 qe_undot_half_a;
+varying float normalScale;
+
+// function prototypes from imposter_fns120.glsl
+void cone_linear_coeffs(vec3 center, float radius, vec3 axis, float taper, vec3 pos,
+    out float tAP, out float qe_c, out float qe_half_b, out vec3 qe_undot_half_a);
+
+void main() {
+    // imposter geometry is sum of sphere center and normal
+    vec4 pos_local = vec4(gl_Vertex.xyz + gl_Normal.xyz, 1);
+    radius = gl_Vertex.w;
+
+    vec4 pos1 = gl_ModelViewMatrix * pos_local;
+    gl_Position = gl_ProjectionMatrix * pos1;
+    surface_color = gl_Color.rgba;
+
+    vec4 c = gl_ModelViewMatrix * vec4(gl_Vertex.xyz, 1);
+    center = c.xyz/c.w;
+
+    // Cone axis and taper are shoehorned into the texture coordinate
+    vec3 axis = (gl_ModelViewMatrix * vec4(gl_MultiTexCoord0.xyz, 0)).xyz;
+    halfConeLength = length(axis);
+    taper = gl_MultiTexCoord0.w;
+
+    pos = pos1.xyz/pos1.w;
+    cone_linear_coeffs(center, radius, axis, taper, pos,
+        tAP, qe_c, qe_half_b, qe_undot_half_a);
+
+    aHat = normalize(axis);
+    normalScale  = 1.0 / sqrt(1.0 + taper*taper);
+}
@@ -0,0 +1,89 @@
+#version 330
+
+/**
+ * Deferred lighting pass: lights each pixel of the imposter G-buffer once.
+ *
+ * The sphere and cone fragment shaders, compiled with DEFERRED defined, write
+ * only surface color, normal and depth. Only the nearest surface at each
+ * pixel survives the depth test, so this pass lights it once, however many
+ * imposters were ray-cast there.
+ */
+
+/* 
+ * Licensed under the Janelia Farm Research Campus Software Copyright 1.1
+ * 
+ * Copyright (c) 2014, Howard Hughes Medical Institute, All rights reserved.
+ * 
+ * Redistribution and use in source and binary forms, with or without 
+ * modification, are permitted provided that the following conditions are met:
+ * 
+ *     1. Redistributions of source code must retain the above copyright notice, 
+ *        this list of conditions and the following disclaimer.
+ *     2. Redistributions in binary form must reproduce the above copyright 
+ *        notice, this list of conditions and the following disclaimer in the 
+ *        documentation and/or other materials provided with the distribution.
+ *     3. Neither the name of the Howard Hughes Medical Institute nor the names 
+ *        of its contributors may be used to endorse or promote products derived 
+ *        from this software without specific prior written permission.
+ * 
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+ * AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, ANY 
+ * IMPLIED WARRANTIES OF MERCHANTABILITY, NON-INFRINGEMENT, OR FITNESS FOR A 
+ * PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR 
+ * CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+ * EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+ * PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+ * REASONABLE ROYALTIES; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS 
+ * SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+uniform sampler2D colorTexture; // unlit surface color
+uniform sampler2D normalTexture; // surface normal in camera frame; w is zero where nothing was drawn
+uniform sampler2D depthTexture;
+uniform sampler2D lightProbe;
+uniform mat4 projectionInverse; // from normalized device coordinates to camera frame
+uniform bool useLightRig = false; // light_rig() instead of image based lighting
+
+
+in vec2 texCoord;
+
+
+out vec4 fragColor;
+
+
+// methods defined in imposter_fns330.glsl
+vec3 light_rig(vec3 pos, vec3 normal, vec3 color);
+vec3 image_based_lighting(
+        vec3 pos, // surface position, in camera frame
+        vec3 normal, // surface normal, in camera frame
+        vec3 diffuseColor, 
+        vec3 reflectColor,
+        sampler2D lightProbe);
+
+
+void main() {
+    vec4 normal = texture(normalTexture, texCoord);
+    if (normal.w == 0)
+        discard; // no imposter covers this pixel
+    float depth = texture(depthTexture, texCoord).r;
+    vec4 surfaceColor = texture(colorTexture, texCoord);
+    // Surface position, in camera frame, from its depth
+    vec4 ndc = vec4(2.0 * vec3(texCoord, depth) - 1.0, 1);
+    vec4 eye = projectionInverse * ndc;
+    vec3 s = eye.xyz / eye.w;
+    vec3 n = normalize(normal.xyz);
+
+    if (useLightRig) {
+        fragColor = vec4(light_rig(s, n, surfaceColor.rgb), surfaceColor.a);
+    }
+    else {
+        vec3 reflectColor = mix(surfaceColor.rgb, vec3(1,1,1), 0.5); // midway between metal and plastic.
+        fragColor = vec4(
+            image_based_lighting(s, n, surfaceColor.rgb, reflectColor, lightProbe),
+            surfaceColor.a);
+    }
+    // So that the imposters hide, and are hidden by, other geometry
+    gl_FragDepth = depth;
+}
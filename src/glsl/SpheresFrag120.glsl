@@ -0,0 +1,37 @@
+#version 120
+
+/**
+ * Sphere imposter fragment shader.
+ */
+
+/*
+ * Copyright 2010 Howard Hughes Medical Institute.
+ * All rights reserved.
+ * Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+ * license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+ */
+
+varying vec4 pos1;
+varying vec4 surface_color;
+varying float radius;
+varying vec3 center;
+varying vec2 pc_c2;
+
+// defined in imposter_fns120.glsl
+vec2 sphere_nonlinear_coeffs(vec3 pos, vec2 pc_c2);
+vec3 sphere_surface_from_coeffs(vec3 pos, vec2 pc_c2, vec2 a2_d);
+vec3 light_rig(vec4 pos, vec3 normal, vec3 color);
+float fragDepthFromEyeXyz(vec3 eyeXyz);
+
+void main() {
+    vec3 pos = pos1.xyz/pos1.w;
+    vec2 a2_d = sphere_nonlinear_coeffs(pos, pc_c2);
+    if (a2_d.y <= 0)
+        discard; // Point does not intersect sphere
+    vec3 s = sphere_surface_from_coeffs(pos, pc_c2, a2_d);
+    vec3 normal = 1.0 / radius * (s - center);
+    gl_FragColor = vec4(
+        light_rig(vec4(s, 1), normal, surface_color.rgb),
+        1);
+    gl_FragDepth = fragDepthFromEyeXyz(s);
+}
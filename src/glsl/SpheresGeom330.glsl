@@ -39,16 +39,38 @@
 uniform mat4 projectionMatrix = mat4(1);
 
 
+// Choice of imposter hull strategies.
+// The host program selects one by defining HULL_STRATEGY right after the #version line.
+#define NEAR_HULL 1 // imposter in front of sphere (10 vertices)
+#define FAR_HULL 2 // imposter behind sphere (10 vertices)
+#define MID_HULL 3 // simpler geometry, imposter intersects sphere (6 vertices)
+#ifndef HULL_STRATEGY
+#define HULL_STRATEGY FAR_HULL
+#endif
+// With CONSERVATIVE_DEPTH defined, the near hull is always used, turned to
+// face the eye, so that the hull lies in front of the sphere surface
+// behind it, as the depth_greater layout in SpheresFrag330.glsl requires.
+#ifdef CONSERVATIVE_DEPTH
+#undef HULL_STRATEGY
+#define HULL_STRATEGY NEAR_HULL
+#endif
+
+
 layout(points) in; // input vertices are sphere centers
 // Create viewer-facing half-cube imposter geometry 
-// layout(triangle_strip, max_vertices=10) out;
-layout(triangle_strip, max_vertices=10) out; // only six vertices needed for "mid-hull" approach
+#if HULL_STRATEGY == MID_HULL
+layout(triangle_strip, max_vertices=6) out; // only six vertices needed for "mid-hull" approach
+#else
+layout(triangle_strip, max_vertices=10) out;
+#endif
 
 
 in float geomRadius[]; // sphere radius as vertex attribute
+in vec4 geomColor[]; // sphere color
 
 
 out float fragRadius; // pass radius of sphere to fragment shader
+out vec4 surfaceColor; // pass color of sphere to fragment shader
 out vec3 center; // center of sphere, in camera frame
 // the *linear* coefficients of the ray-tracing quadratic formula can be computed per-vertex, rather than per fragment.
 out float c2; // sphere ray-casting quadratic-formula linear (actually constant) coefficient cee-squared
@@ -105,7 +127,15 @@ const vec3 p8 = rotCorner * vec3(-1, -1, -1); // rear back corner
 */
 
 
+#ifdef CONSERVATIVE_DEPTH
+mat3 hullFrame; // turns corner p1 from +Z toward the eye, set in main()
+#endif
+
+
 void emit_one_vertex(vec3 offset) {
+#ifdef CONSERVATIVE_DEPTH
+    offset = hullFrame * offset;
+#endif
     imposterPos = center + geomRadius[0] * offset;
     gl_Position = projectionMatrix * vec4(imposterPos, 1);
     pc = dot(imposterPos, center);
@@ -183,11 +213,21 @@ void main() {
 #endif
     center = posIn.xyz/posIn.w; // sphere center is constant for all vertices
     fragRadius = geomRadius[0]; // sphere radius is constant for all vertices
+    surfaceColor = geomColor[0]; // and so is its color
     c2 = dot(center, center) - fragRadius*fragRadius; // 2*c coefficient is constant for all vertices
+#ifdef CONSERVATIVE_DEPTH
+    // Under perspective, +Z only faces the eye for spheres near the view axis
+    vec3 w = normalize(-center);
+    vec3 u = normalize(cross(abs(w.y) < 0.9 ? vec3(0, 1, 0) : vec3(1, 0, 0), w));
+    hullFrame = mat3(u, cross(w, u), w);
+#endif
 
-    // Choice of imposter hull strategies below
-    // NOTE: modify the above "layout(..., max_vertices=...) out;" statement to match your chosen hull strategy
-    // near_hull(); // imposter in front of sphere (10 vertices)
+    // Choice of imposter hull strategies, selected by HULL_STRATEGY above
+#if HULL_STRATEGY == NEAR_HULL
+    near_hull(); // imposter in front of sphere (10 vertices)
+#elif HULL_STRATEGY == MID_HULL
+    mid_hull(); // simpler geometry, imposter intersects sphere (6 vertices)
+#else
     far_hull(); // imposter behind sphere (10 vertices)
-    // mid_hull(); // simpler geometry, imposter intersects sphere (6 vertices)
+#endif
  }
@@ -0,0 +1,51 @@
+#version 120
+
+/**
+ * Instanced sphere imposter vertex shader.
+ *
+ * Every instance draws the same unit hull strip, with per instance
+ * attributes advancing once per sphere (glVertexAttribDivisor). Outputs
+ * match SpheresVrtx120.glsl, so SpheresFrag120.glsl is used unchanged.
+ *
+ * Compact instances store the center as normalized 16 bit integers, which
+ * positionScale and positionOrigin map back to model coordinates, and the
+ * radius as a half float.
+ */
+
+/*
+ * Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+ * license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+ */
+
+attribute vec3 hullCorner; // per vertex: corner of the unit cube, each coordinate +-1
+attribute vec3 instanceCenter; // per instance, before positionScale and positionOrigin
+attribute float instanceRadius; // per instance
+attribute vec4 instanceColor; // per instance
+
+// Decoding of instanceCenter; full float instances keep the defaults
+uniform vec3 positionOrigin = vec3(0, 0, 0);
+uniform vec3 positionScale = vec3(1, 1, 1);
+
+varying vec4 pos1;
+varying vec4 surface_color;
+
+varying float radius;
+varying vec2 pc_c2;
+varying vec3 center;
+
+// defined in imposter_fns120.glsl
+vec2 sphere_linear_coeffs(vec3 center, float radius, vec3 pos);
+
+void main() {
+    vec3 center_local = instanceCenter * positionScale + positionOrigin;
+    radius = instanceRadius;
+    vec4 pos_local = vec4(center_local + radius * hullCorner, 1);
+
+    pos1 = gl_ModelViewMatrix * pos_local;
+    gl_Position = gl_ProjectionMatrix * pos1;
+    surface_color = instanceColor;
+
+    vec4 c = gl_ModelViewMatrix * vec4(center_local, 1);
+    center = c.xyz/c.w;
+    pc_c2 = sphere_linear_coeffs(center, radius, pos1.xyz/pos1.w);
+}
@@ -0,0 +1,136 @@
+#version 330
+
+/**
+ * Sphere imposter vertex shader without a geometry shader.
+ *
+ * Each instance is one node, drawn as a triangle strip around the same
+ * half-cube hull that SpheresGeom330.glsl emits. The shader pulls the
+ * node position and radius from a buffer texture by gl_InstanceID, and
+ * places the strip corner selected by gl_VertexID.
+ */
+
+/* 
+ * Licensed under the Janelia Farm Research Campus Software Copyright 1.1
+ * 
+ * Copyright (c) 2014, Howard Hughes Medical Institute, All rights reserved.
+ * 
+ * Redistribution and use in source and binary forms, with or without 
+ * modification, are permitted provided that the following conditions are met:
+ * 
+ *     1. Redistributions of source code must retain the above copyright notice, 
+ *        this list of conditions and the following disclaimer.
+ *     2. Redistributions in binary form must reproduce the above copyright 
+ *        notice, this list of conditions and the following disclaimer in the 
+ *        documentation and/or other materials provided with the distribution.
+ *     3. Neither the name of the Howard Hughes Medical Institute nor the names 
+ *        of its contributors may be used to endorse or promote products derived 
+ *        from this software without specific prior written permission.
+ * 
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+ * AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, ANY 
+ * IMPLIED WARRANTIES OF MERCHANTABILITY, NON-INFRINGEMENT, OR FITNESS FOR A 
+ * PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR 
+ * CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+ * EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+ * PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+ * REASONABLE ROYALTIES; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY 
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT 
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS 
+ * SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+uniform mat4 modelViewMatrix = mat4(1);
+uniform mat4 projectionMatrix = mat4(1);
+uniform float radiusOffset = 0.0;
+uniform float radiusScale = 1.0;
+uniform samplerBuffer nodes; // position and radius, one RGBA32F texel per node
+uniform samplerBuffer colorValues; // node_color_fields() rows, one float per node
+uniform int colorValueOffset = 0; // first texel of the colorBy row of colorValues
+uniform usamplerBuffer drawOrder; // node indices, nearest first
+uniform int drawOrderOffset = -1; // first texel of the node order in drawOrder, or -1 to draw in node order
+
+
+// Choice of imposter hull strategies, as in SpheresGeom330.glsl.
+// The host program selects one by defining HULL_STRATEGY right after the #version line.
+#define NEAR_HULL 1 // imposter in front of sphere
+#define FAR_HULL 2 // imposter behind sphere
+#define MID_HULL 3 // simpler geometry, imposter intersects sphere
+#ifndef HULL_STRATEGY
+#define HULL_STRATEGY FAR_HULL
+#endif
+#ifdef CONSERVATIVE_DEPTH
+#undef HULL_STRATEGY
+#define HULL_STRATEGY NEAR_HULL
+#endif
+
+
+// The same outputs as SpheresGeom330.glsl, for SpheresFrag330.glsl
+out float fragRadius; // pass radius of sphere to fragment shader
+out vec4 surfaceColor; // pass color of sphere to fragment shader
+out vec3 center; // center of sphere, in camera frame
+// the *linear* coefficients of the ray-tracing quadratic formula
+out float c2; // sphere ray-casting quadratic-formula linear (actually constant) coefficient cee-squared
+out float pc; // sphere ray-casting quadratic-formula linear coefficient pos-dot-center
+out vec3 imposterPos; // location of imposter bounding geometry, in camera frame
+
+
+vec4 node_color(float colorValue); // defined in node_color330.glsl
+
+
+// The cube of SpheresGeom330.glsl, with corner 1,1,1 toward +Z
+const float cos_45 = sqrt(2)/2;
+const float sin_45 = sqrt(2)/2;
+const mat3 rotY45 = mat3(
+    cos_45, 0, sin_45,
+    0,   1,   0,
+    -sin_45, 0, cos_45);
+const float sin_foo = -1.0/sqrt(3);
+const float cos_foo = sqrt(2)/sqrt(3);
+const mat3 rotXfoo = mat3(
+    1,   0,   0,
+    0, cos_foo, -sin_foo,
+    0, sin_foo, cos_foo);
+const mat3 rotCorner = rotXfoo * rotY45;
+const vec3 p1 = rotCorner * vec3(+1,+1,+1); // corner oriented toward viewer
+const vec3 p2 = rotCorner * vec3(-1,+1,-1); // upper rear corner
+const vec3 p3 = rotCorner * vec3(-1,+1,+1); // upper left corner
+const vec3 p4 = rotCorner * vec3(-1,-1,+1); // lower left corner
+const vec3 p5 = rotCorner * vec3(+1,-1,+1); // lower rear corner
+const vec3 p6 = rotCorner * vec3(+1,-1,-1); // lower right corner
+const vec3 p7 = rotCorner * vec3(+1,+1,-1); // upper right corner
+const vec3 p8 = rotCorner * vec3(-1, -1, -1); // rear back corner
+
+// The two strips of each half-cube hull in SpheresGeom330.glsl become one,
+// joined by three degenerate triangles, which keep the winding of the second.
+// The host draws SPHERE_PULL_STRIP_LENGTHS in imposter_shaders.py vertices.
+#if HULL_STRATEGY == NEAR_HULL
+const vec3 hullStrip[11] = vec3[11](p2, p3, p1, p4, p5, p5, p5, p6, p1, p7, p2);
+#elif HULL_STRATEGY == MID_HULL
+const vec3 hullStrip[6] = vec3[6](p3, p4, p2, p5, p7, p6);
+#else
+const vec3 hullStrip[11] = vec3[11](p2, p3, p8, p4, p5, p5, p5, p6, p8, p7, p2);
+#endif
+
+
+void main() {
+    int node = gl_InstanceID;
+    if (drawOrderOffset >= 0)
+        node = int(texelFetch(drawOrder, drawOrderOffset + gl_InstanceID).r);
+    vec4 positionRadius = texelFetch(nodes, node);
+    surfaceColor = node_color(texelFetch(colorValues, colorValueOffset + node).r);
+    vec4 c = modelViewMatrix * vec4(positionRadius.xyz, 1);
+    center = c.xyz/c.w; // sphere center in camera frame
+    fragRadius = radiusOffset + radiusScale * positionRadius.w;
+    c2 = dot(center, center) - fragRadius*fragRadius;
+
+    vec3 offset = hullStrip[gl_VertexID];
+#ifdef CONSERVATIVE_DEPTH
+    // Turn corner p1 from +Z toward the eye, as in SpheresGeom330.glsl
+    vec3 w = normalize(-center);
+    vec3 u = normalize(cross(abs(w.y) < 0.9 ? vec3(0, 1, 0) : vec3(1, 0, 0), w));
+    offset = mat3(u, cross(w, u), w) * offset;
+#endif
+    imposterPos = center + fragRadius * offset;
+    gl_Position = projectionMatrix * vec4(imposterPos, 1);
+    pc = dot(imposterPos, center);
+}
@@ -0,0 +1,38 @@
+#version 120
+
+/**
+ * Sphere imposter vertex shader, for bounding geometry from Sphere.generateBoundingGeometryImmediate().
+ */
+
+/*
+ * Copyright 2010 Howard Hughes Medical Institute.
+ * All rights reserved.
+ * Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+ * license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+ */
+
+varying vec4 pos1;
+varying vec4 surface_color;
+
+varying float radius;
+varying vec2 pc_c2;
+varying vec3 center;
+
+// defined in imposter_fns120.glsl
+vec2 sphere_linear_coeffs(vec3 center, float radius, vec3 pos);
+
+void main() {
+    // imposter geometry is sum of sphere center and normal
+    vec4 pos_local = vec4(gl_Vertex.xyz + gl_Normal.xyz, 1);
+    radius = gl_Vertex.w;
+
+    pos1 = gl_ModelViewMatrix * pos_local;
+    gl_Position = gl_ProjectionMatrix * pos1;
+    surface_color = gl_Color.rgba;
+
+    // TODO - hard coding sphere parameters for the moment...
+    // radius = 1.0; // TODO - test non-1.0 values
+    vec4 c = gl_ModelViewMatrix * vec4(gl_Vertex.xyz, 1);
+    center = c.xyz/c.w;
+    pc_c2 = sphere_linear_coeffs(center, radius, pos1.xyz/pos1.w);
+}
@@ -40,14 +40,20 @@ uniform float radiusOffset = 0.0;
 uniform float radiusScale = 1.0;
 
 
-in vec3 position; // center of sphere
-in float radius; // radius of sphere
+layout(location = 0) in vec3 position; // center of sphere
+layout(location = 1) in float radius; // radius of sphere
+layout(location = 2) in float colorValue; // per node value selected for coloring
 
 
 out float geomRadius; // pass radius to geometry shader
+out vec4 geomColor; // pass node color to geometry shader
+
+
+vec4 node_color(float colorValue); // defined in node_color330.glsl
 
 
 void main() {
     gl_Position = modelViewMatrix * vec4(position, 1); // sphere center in camera frame
     geomRadius = radiusOffset + radiusScale * radius;
+    geomColor = node_color(colorValue);
 }
@@ -0,0 +1,39 @@
+#version 330
+
+/**
+ * Per node color lookup, linked into the vertex stage of the sphere and cone
+ * imposter programs. Switching between coloring schemes only changes the
+ * uniforms below and which per node value is bound to colorValue, so no
+ * geometry is regenerated or uploaded again.
+ */
+
+/*
+ * Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+ * license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+ */
+
+// Values of colorMode, as in COLOR_MODES in node_colors.py
+#define UNIFORM_COLOR 0 // every node has the color uniform
+#define TYPE_COLOR 1 // colorValue is an SWC type, indexing typeColors
+#define SCALAR_COLOR 2 // colorValue is mapped through colorRange onto colormap
+
+uniform vec4 color = vec4(0, 1, 0, 1); // one color for all nodes
+uniform int colorMode = UNIFORM_COLOR;
+uniform vec2 colorRange = vec2(0, 1); // colorValues at the two ends of colormap
+uniform sampler1D typeColors; // one texel per SWC type
+uniform sampler1D colormap;
+
+
+vec4 node_color(float colorValue) {
+    if (colorMode == TYPE_COLOR) {
+        int count = textureSize(typeColors, 0);
+        return texelFetch(typeColors, clamp(int(colorValue), 0, count - 1), 0);
+    }
+    if (colorMode == SCALAR_COLOR) {
+        float t = (colorValue - colorRange.x) / max(colorRange.y - colorRange.x, 1e-30);
+        // Sample from the center of the first texel to the center of the last
+        float size = float(textureSize(colormap, 0));
+        return texture(colormap, (0.5 + clamp(t, 0.0, 1.0) * (size - 1.0)) / size);
+    }
+    return color;
+}
@@ -0,0 +1,126 @@
+'''
+Compare sphere imposter hull strategies on a synthetic dense neuron, under software GL.
+
+For each strategy in SpheresGeom330.glsl this reports fragment shader
+invocations, fragments discarded by the ray-caster, fragments surviving
+the depth test, and frame time. Cones are not drawn, because the hull
+strategy only applies to spheres. The last row, "early", is the near hull
+with the conservative depth layout, where a driver may reject hidden
+fragments before the fragment shader runs. With --depth-sort, spheres
+are drawn front to back, so that fewer fragments pass the depth test.
+
+Example:
+    python bench_hull_strategy.py --nodes 100000 --frames 10
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import json
+import time
+
+from offscreen import OffscreenContext # must precede OpenGL imports
+from OpenGL.GL import *
+from OpenGL.GLU import *
+from OpenGL.GL.ARB.pipeline_statistics_query import GL_FRAGMENT_SHADER_INVOCATIONS_ARB
+import numpy
+
+from synthetic_swc import random_neuron
+from neuron_renderer330 import NeuronRenderer330
+from imposter_shaders import HULL_STRATEGIES, conservative_depth_supported
+from frame_stats import query_result
+
+
+def fragment_counts(draw):
+    "Fragment shader invocations and samples passed while calling draw()"
+    invocations, samples = glGenQueries(2)
+    glBeginQuery(GL_FRAGMENT_SHADER_INVOCATIONS_ARB, invocations)
+    glBeginQuery(GL_SAMPLES_PASSED, samples)
+    draw()
+    glEndQuery(GL_SAMPLES_PASSED)
+    glEndQuery(GL_FRAGMENT_SHADER_INVOCATIONS_ARB)
+    result = (query_result(invocations), query_result(samples))
+    glDeleteQueries(2, [invocations, samples])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--depth-sort", action="store_true", help="draw spheres front to back")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    context = OffscreenContext(args.width, args.height)
+    neuron = random_neuron(args.nodes, seed=args.seed)
+    renderer = NeuronRenderer330.fromNeuron(neuron)
+    renderer.showCones = False
+    renderer.depthSort = args.depth_sort
+
+    lo = neuron.xyz.min(axis=0)
+    hi = neuron.xyz.max(axis=0)
+    center = 0.5 * (lo + hi)
+    radius = 0.5 * numpy.linalg.norm(hi - lo)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(45.0, float(args.width)/float(args.height), 0.5 * radius, 5.0 * radius)
+    projection = glGetFloatv(GL_PROJECTION_MATRIX)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    glTranslatef(0, 0, -2.0 * radius)
+    glTranslatef(-center[0], -center[1], -center[2])
+    modelview = glGetFloatv(GL_MODELVIEW_MATRIX)
+    glEnable(GL_DEPTH_TEST)
+
+    def draw():
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        renderer.drawGL(modelview, projection)
+
+    print("Renderer: %s; %d spheres at %dx%d" % (context.renderer(), args.nodes, args.width, args.height))
+    print("%-6s %14s %14s %14s %12s" % ("hull", "shaded", "discarded", "depth passed", "frame ms"))
+    modes = [(strategy, strategy, False) for strategy in sorted(HULL_STRATEGIES)]
+    if conservative_depth_supported():
+        modes.append(("early", "near", True))
+    results = []
+    for label, strategy, conservative_depth in modes:
+        renderer.hullStrategy = strategy
+        renderer.conservativeDepth = conservative_depth
+        draw() # compile program, warm caches
+        context.finish()
+        # With depth test GL_ALWAYS, every fragment that is not discarded is counted as passed
+        glDepthFunc(GL_ALWAYS)
+        shaded, kept = fragment_counts(draw)
+        glDepthFunc(GL_LESS)
+        shaded_depth, passed = fragment_counts(draw)
+        frame_times = []
+        for frame in range(args.frames):
+            t0 = time.time()
+            draw()
+            context.finish()
+            frame_times.append(1000.0 * (time.time() - t0))
+        result = {
+                "hull": label,
+                "fragments_shaded": shaded,
+                "fragments_discarded": shaded - kept,
+                "fragments_depth_passed": passed,
+                "frame_ms_median": float(numpy.median(frame_times)),
+                "frame_ms_mean": float(numpy.mean(frame_times)), }
+        results.append(result)
+        print("%-6s %14d %14d %14d %12.2f" % (label, shaded, shaded - kept, passed,
+                result["frame_ms_median"]))
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"renderer": context.renderer(), "nodes": args.nodes,
+                    "width": args.width, "height": args.height, "depth_sort": args.depth_sort,
+                    "results": results},
+                    json_file, indent=2)
+    context.destroy()
+
+
+if __name__ == "__main__":
+    main()
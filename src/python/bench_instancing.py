@@ -0,0 +1,129 @@
+'''
+Compare immediate mode, VBO and instanced imposter drawing, under software GL.
+
+All these paths draw the same spheres and cones of a synthetic neuron with
+the GLSL 1.20 imposter shaders. The "compact" path is the instanced path
+with 16 bit integer positions and half float radii. The immediate path issues the same glBegin,
+glNormal, glTexCoord and glVertex calls per hull vertex as the
+generateBoundingGeometryImmediate() methods in imposter_immediate, from precomputed
+values, so it is a lower bound on the cost of that path. Also reports the
+bytes of vertex data each path needs per primitive.
+
+Example:
+    python bench_instancing.py --nodes 20000 --frames 10
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import time
+
+from offscreen import OffscreenContext # must precede OpenGL imports
+from OpenGL.GL import *
+from OpenGL.GLU import *
+from OpenGL.GL import shaders
+import numpy
+
+from synthetic_swc import random_neuron
+from imposter_geometry import neuron_cone_parameters, sphere_hull_vertices, cone_hull_vertices
+from imposter_geometry import HULL_STRIP_LENGTH, HULL_VERTEX_COUNT, IMPOSTER_VERTEX_DTYPE
+from imposter_geometry import SPHERE_INSTANCE_DTYPE, CONE_INSTANCE_DTYPE
+from imposter_geometry import COMPACT_SPHERE_INSTANCE_DTYPE, COMPACT_CONE_INSTANCE_DTYPE
+from imposter_shaders import sphere_shader120, cone_shader120
+from imposter_shaders import sphere_instanced_shader120, cone_instanced_shader120
+from imposter_vbo import SphereVboSet, ConeVboSet, SphereInstanceSet, ConeInstanceSet
+
+
+class ImmediateSet(object):
+    "Hull vertices sent one glVertex call at a time, as by generateBoundingGeometryImmediate()"
+    def __init__(self, vertices):
+        self.strips = vertices.reshape(-1, HULL_STRIP_LENGTH).tolist()
+
+    def drawGL(self):
+        for strip in self.strips:
+            glBegin(GL_TRIANGLE_STRIP)
+            for vertex, normal, texcoord in strip:
+                glNormal3f(*normal)
+                glTexCoord4f(*texcoord)
+                glVertex4f(*vertex)
+            glEnd()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-immediate", action="store_true",
+            help="leave out the immediate mode path, which is slow for many nodes")
+    args = parser.parse_args()
+
+    context = OffscreenContext(args.width, args.height)
+    neuron = random_neuron(args.nodes, seed=args.seed)
+    edges, cones = neuron_cone_parameters(neuron)
+    paths = []
+    if not args.skip_immediate:
+        paths.append(("immediate", sphere_shader120(), cone_shader120(),
+                ImmediateSet(sphere_hull_vertices(neuron.xyz, neuron.radius)),
+                ImmediateSet(cone_hull_vertices(cones)),
+                HULL_VERTEX_COUNT * IMPOSTER_VERTEX_DTYPE.itemsize,
+                HULL_VERTEX_COUNT * IMPOSTER_VERTEX_DTYPE.itemsize))
+    paths.append(("vbo", sphere_shader120(), cone_shader120(),
+            SphereVboSet(neuron.xyz, neuron.radius), ConeVboSet(cones),
+            HULL_VERTEX_COUNT * IMPOSTER_VERTEX_DTYPE.itemsize,
+            HULL_VERTEX_COUNT * IMPOSTER_VERTEX_DTYPE.itemsize))
+    paths.append(("instanced", sphere_instanced_shader120(), cone_instanced_shader120(),
+            SphereInstanceSet(neuron.xyz, neuron.radius), ConeInstanceSet(cones),
+            SPHERE_INSTANCE_DTYPE.itemsize, CONE_INSTANCE_DTYPE.itemsize))
+    paths.append(("compact", sphere_instanced_shader120(), cone_instanced_shader120(),
+            SphereInstanceSet(neuron.xyz, neuron.radius, compact=True), ConeInstanceSet(cones, compact=True),
+            COMPACT_SPHERE_INSTANCE_DTYPE.itemsize, COMPACT_CONE_INSTANCE_DTYPE.itemsize))
+
+    lo = (neuron.xyz - neuron.radius[:, None]).min(axis=0)
+    hi = (neuron.xyz + neuron.radius[:, None]).max(axis=0)
+    center = 0.5 * (lo + hi)
+    radius = 0.5 * numpy.linalg.norm(hi - lo)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(45.0, float(args.width)/float(args.height), 0.5 * radius, 5.0 * radius)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    glTranslatef(0, 0, -2.5 * radius)
+    glTranslatef(-center[0], -center[1], -center[2])
+    glEnable(GL_DEPTH_TEST)
+    glEnable(GL_CULL_FACE)
+    glClearColor(0.5, 0.5, 0.5, 0.0)
+
+    print("Renderer: %s; %d spheres, %d cones at %dx%d" % (
+            context.renderer(), len(neuron), len(cones), args.width, args.height))
+    print("%-10s %16s %14s %12s %12s" % ("path", "sphere bytes", "cone bytes", "frame ms", "submit ms"))
+    for name, sphere_shader, cone_shader, spheres, cone_set, sphere_bytes, cone_bytes in paths:
+        def draw():
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glColor3f(0.2, 0.5, 0.8)
+            shaders.glUseProgram(sphere_shader)
+            spheres.drawGL()
+            shaders.glUseProgram(cone_shader)
+            cone_set.drawGL()
+            shaders.glUseProgram(0)
+        draw() # upload buffers, warm caches
+        context.finish()
+        frame_times = []
+        submit_times = []
+        for frame in range(args.frames):
+            t0 = time.time()
+            draw()
+            t1 = time.time()
+            context.finish()
+            frame_times.append(1000.0 * (time.time() - t0))
+            submit_times.append(1000.0 * (t1 - t0))
+        print("%-10s %16d %14d %12.2f %12.2f" % (name, sphere_bytes, cone_bytes,
+                numpy.median(frame_times), numpy.median(submit_times)))
+    context.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+'''
+Measure frame time of the VBO imposter renderer, without a window or GPU.
+
+Example:
+    python bench_vbo.py --frames 50 ../../data/swc/EightNodeExample.swc
+    python bench_vbo.py --cull --zoom 20 big_neuron.swc
+    python bench_vbo.py --lod big_neuron.swc
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import time
+
+from offscreen import OffscreenContext # must precede OpenGL imports
+from OpenGL.GL import *
+from OpenGL.GLU import *
+from OpenGL.GL import shaders
+import numpy
+
+from swc_cache import load_swc_cached
+from imposter_geometry import neuron_cone_parameters
+from imposter_shaders import sphere_shader120, cone_shader120
+from imposter_vbo import SphereVboSet, ConeVboSet, LodVboSet
+from lod import NeuronLod
+
+
+def fit_to_view(neuron):
+    "Center and radius of a sphere enclosing all nodes of a neuron"
+    lo = (neuron.xyz - neuron.radius[:, None]).min(axis=0)
+    hi = (neuron.xyz + neuron.radius[:, None]).max(axis=0)
+    return 0.5 * (lo + hi), 0.5 * numpy.linalg.norm(hi - lo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("swc_files", nargs="+")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--cull", action="store_true",
+            help="draw only primitives in view frustum, using a bounding volume hierarchy")
+    parser.add_argument("--zoom", type=float, default=1.0,
+            help="narrow the field of view by this factor")
+    parser.add_argument("--lod", action="store_true",
+            help="simplify unbranched chains to within one pixel, using NeuronLod")
+    args = parser.parse_args()
+
+    context = OffscreenContext(args.width, args.height)
+    print("Renderer: %s" % context.renderer())
+    glClearColor(0.5, 0.5, 0.5, 0.0)
+    glEnable(GL_DEPTH_TEST)
+    glEnable(GL_CULL_FACE)
+    sphere_shader = sphere_shader120()
+    cone_shader = cone_shader120()
+
+    sets = []
+    for file_name in args.swc_files:
+        t0 = time.time()
+        neuron = load_swc_cached(file_name)
+        edges, cones = neuron_cone_parameters(neuron)
+        if args.lod:
+            lod_set = LodVboSet(NeuronLod.fromNeuron(neuron))
+            spheres, cone_set = lod_set.spheres, lod_set.cones
+        else:
+            lod_set = None
+            spheres = SphereVboSet(neuron.xyz, neuron.radius, cull=args.cull)
+            cone_set = ConeVboSet(cones, cull=args.cull)
+        spheres.uploadGL()
+        cone_set.uploadGL()
+        context.finish()
+        print("%s: %d spheres, %d cones, prepared in %.3f s" % (
+                file_name, len(neuron), len(edges), time.time() - t0))
+        sets.append((neuron, lod_set, spheres, cone_set))
+
+    center, radius = fit_to_view(sets[0][0])
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(45.0 / args.zoom, float(args.width)/float(args.height), 0.5 * radius, 5.0 * radius)
+    glMatrixMode(GL_MODELVIEW)
+
+    frame_times = []
+    drawn = []
+    for frame in range(args.frames):
+        t0 = time.time()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glLoadIdentity()
+        glTranslatef(0, 0, -2.5 * radius)
+        glRotatef(frame, 0, 1, 0)
+        glTranslatef(-center[0], -center[1], -center[2])
+        glColor3f(0.2, 0.5, 0.8)
+        for neuron, lod_set, spheres, cone_set in sets:
+            if lod_set is not None:
+                lod_set.selectGL()
+                shaders.glUseProgram(sphere_shader)
+                lod_set.drawSpheresGL()
+                shaders.glUseProgram(cone_shader)
+                lod_set.drawConesGL()
+            else:
+                shaders.glUseProgram(sphere_shader)
+                spheres.drawGL()
+                shaders.glUseProgram(cone_shader)
+                cone_set.drawGL()
+            # Relative to full resolution, one sphere per node and one cone per edge
+            drawn.append(float(spheres.drawn_count + cone_set.drawn_count)
+                    / max(1, 2 * len(neuron) - 1))
+        shaders.glUseProgram(0)
+        context.finish()
+        frame_times.append(time.time() - t0)
+    frame_times = numpy.array(frame_times) * 1000.0
+    print("Frame time over %d frames: mean %.2f ms, median %.2f ms, max %.2f ms" % (
+            len(frame_times), frame_times.mean(), numpy.median(frame_times), frame_times.max()))
+    print("Primitives drawn: mean %.1f%%" % (100.0 * numpy.mean(drawn)))
+    context.destroy()
+
+
+if __name__ == "__main__":
+    main()
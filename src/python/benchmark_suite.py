@@ -0,0 +1,330 @@
+'''
+Offscreen benchmark suite: time every render path on synthetic neurons of several sizes.
+
+For each size, a synthetic neuron is generated, written to a temporary SWC
+file and loaded back with load_swc(). Each render path then times these
+stages, in milliseconds:
+
+    load         parsing the SWC file (shared by all paths)
+    cones        cone segments of every edge, as objects or as arrays
+    build        vertex arrays and buffer objects on the CPU side
+    upload       copying them to GL, up to glFinish()
+    first_frame  the first frame drawn, which may compile or validate state
+    draw_p50     median of the following frames, each up to glFinish()
+    draw_p95     95th percentile of the same frames
+
+The paths are "immediate" (a Sphere object per node and a ConeSegment
+object per edge, as in the viewer, each sending its hull one glVertex call
+at a time from generateBoundingGeometryImmediate()), "vbo" (SphereVboSet
+and ConeVboSet with the GLSL 1.20 shaders), "330" (NeuronRenderer330, with
+geometry shaders) and "pull" (NeuronRenderer330 with vertexPulling,
+without geometry shaders). The cones stage of the immediate path times
+the construction of those objects, and that of the vbo path times
+neuron_cone_parameters(), which computes the same values for all edges at
+once. Results go to a JSON file; with --baseline, each timing is also
+compared to the same timing in an earlier results file.
+
+Example:
+    python benchmark_suite.py --sizes 1000 100000 --output before.json
+    python benchmark_suite.py --sizes 1000 100000 --baseline before.json
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import json
+import os
+import platform as host_platform # OpenGL.GL also exports a "platform"
+import shutil
+import sys
+import tempfile
+import time
+
+from offscreen import OffscreenContext # must precede OpenGL imports
+from OpenGL.GL import *
+from OpenGL.GLU import *
+from OpenGL.GL import shaders
+import numpy
+
+from swc import load_swc, write_swc
+from synthetic_swc import random_neuron, branching_neuron, RADIUS_DISTRIBUTIONS
+from imposter_geometry import neuron_cone_parameters
+from imposter_immediate import Sphere, ConeSegment
+from imposter_shaders import sphere_shader120, cone_shader120
+from imposter_vbo import SphereVboSet, ConeVboSet
+from neuron_renderer330 import NeuronRenderer330
+from frame_stats import FrameStats
+from bench_vbo import fit_to_view
+
+
+RESULTS_VERSION = 1
+RENDER_PATHS = ("immediate", "vbo", "330", "pull")
+GENERATORS = {
+        "random": random_neuron,
+        "branching": branching_neuron, }
+
+
+def _ms(t0):
+    return 1000.0 * (time.time() - t0)
+
+
+def generate_neuron(args, node_count):
+    "Synthetic neuron of node_count nodes, as chosen on the command line"
+    if args.generator == "branching":
+        return branching_neuron(node_count, branch_factor=args.branch_factor,
+                segment_length=args.segment_length, radius_range=tuple(args.radius_range),
+                seed=args.seed, radius_distribution=args.radius_distribution)
+    return random_neuron(node_count, branch_probability=args.branch_probability,
+            radius_range=tuple(args.radius_range), seed=args.seed,
+            radius_distribution=args.radius_distribution)
+
+
+def look_at_neuron(neuron, width, height):
+    "Set matrices so that the whole neuron fills the view"
+    center, radius = fit_to_view(neuron)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(45.0, float(width)/float(height), 0.5 * radius, 5.0 * radius)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    glTranslatef(0, 0, -2.5 * radius)
+    glTranslatef(-center[0], -center[1], -center[2])
+
+
+class ImmediatePath(object):
+    "Sphere and ConeSegment objects, each drawing its own hull one glVertex call at a time"
+    uses_cones = True # whether cone parameters are computed on the CPU
+
+    def __init__(self, programs):
+        self.sphere_shader, self.cone_shader = programs
+
+    def cones(self, neuron):
+        self.spheres = [Sphere(center, radius)
+                for center, radius in zip(neuron.xyz.tolist(), neuron.radius.tolist())]
+        self.cone_segments = []
+        for child, parent in neuron.edges().tolist():
+            try:
+                self.cone_segments.append(ConeSegment(self.spheres[parent], self.spheres[child]))
+            except (ValueError, ZeroDivisionError):
+                pass # one sphere encloses the other, so no cone joins them
+
+    def build(self, neuron):
+        pass # the objects draw themselves
+
+    def upload(self):
+        pass # nothing stays on the GPU between frames
+
+    def draw(self):
+        shaders.glUseProgram(self.sphere_shader)
+        for sphere in self.spheres:
+            sphere.generateBoundingGeometryImmediate()
+        shaders.glUseProgram(self.cone_shader)
+        for cone in self.cone_segments:
+            cone.generateBoundingGeometryImmediate()
+        shaders.glUseProgram(0)
+
+    def deleteGL(self):
+        pass
+
+
+class VboPath(ImmediatePath):
+    "SphereVboSet and ConeVboSet, through the GLSL 1.20 shaders"
+    def cones(self, neuron):
+        edges, self.cone_array = neuron_cone_parameters(neuron)
+
+    def build(self, neuron):
+        self.spheres = SphereVboSet(neuron.xyz, neuron.radius)
+        self.cone_set = ConeVboSet(self.cone_array)
+
+    def upload(self):
+        self.spheres.uploadGL()
+        self.cone_set.uploadGL()
+
+    def draw(self):
+        shaders.glUseProgram(self.sphere_shader)
+        self.spheres.drawGL()
+        shaders.glUseProgram(self.cone_shader)
+        self.cone_set.drawGL()
+        shaders.glUseProgram(0)
+
+    def deleteGL(self):
+        self.spheres.deleteGL()
+        self.cone_set.deleteGL()
+
+
+class Renderer330Path(object):
+    "NeuronRenderer330, whose geometry shaders build hulls and cones from the nodes"
+    uses_cones = False
+
+    def __init__(self, programs):
+        pass
+
+    def build(self, neuron):
+        self.renderer = NeuronRenderer330.fromNeuron(neuron)
+
+    def upload(self):
+        self.renderer.initGL()
+
+    def draw(self):
+        self.renderer.drawGL(glGetFloatv(GL_MODELVIEW_MATRIX), glGetFloatv(GL_PROJECTION_MATRIX))
+
+    def deleteGL(self):
+        self.renderer.deleteGL()
+
+
+class PulledRenderer330Path(Renderer330Path):
+    "NeuronRenderer330 with vertexPulling, whose vertex shaders read nodes and precomputed cones"
+    def build(self, neuron):
+        Renderer330Path.build(self, neuron)
+        self.renderer.vertexPulling = True
+
+
+PATH_CLASSES = {
+        "immediate": ImmediatePath,
+        "vbo": VboPath,
+        "330": Renderer330Path,
+        "pull": PulledRenderer330Path, }
+
+
+def run_path(path, neuron, context, frames):
+    "Time each stage of one render path, returning a dict of stage name to milliseconds"
+    timings = {}
+    if path.uses_cones:
+        t0 = time.time()
+        path.cones(neuron)
+        timings['cones'] = _ms(t0)
+    t0 = time.time()
+    path.build(neuron)
+    timings['build'] = _ms(t0)
+    t0 = time.time()
+    path.upload()
+    context.finish()
+    timings['upload'] = _ms(t0)
+    stats = FrameStats(history=None, gpu=False)
+    for frame in range(frames + 1):
+        stats.beginFrame()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glColor3f(0.2, 0.5, 0.8)
+        path.draw()
+        context.finish()
+        stats.endFrame()
+        if frame == 0:
+            timings['first_frame'] = stats.frames[0]['cpu_ms']
+            stats.reset()
+    draw = stats.summary()['cpu_ms']
+    if draw is not None:
+        timings['draw_p50'] = draw['p50']
+        timings['draw_p95'] = draw['p95']
+    path.deleteGL()
+    return timings
+
+
+def compare_results(baseline, results):
+    "Text table of each timing in results beside the same timing in baseline"
+    def key(row):
+        return (row['generator'], row['nodes'], row['path'], row['stage'])
+    old = dict((key(row), row['ms']) for row in baseline['results'])
+    lines = ["%10s %-10s %-12s %12s %12s %8s" % ("nodes", "path", "stage", "baseline ms", "ms", "ratio")]
+    for row in results['results']:
+        previous = old.get(key(row))
+        if previous is None or row['stage'] == 'error':
+            continue
+        ratio = row['ms'] / previous if previous > 0 else float('inf')
+        lines.append("%10d %-10s %-12s %12.3f %12.3f %8.3f" % (
+                row['nodes'], row['path'], row['stage'], previous, row['ms'], ratio))
+    if baseline.get('renderer') != results.get('renderer'):
+        lines.append("warning: baseline renderer was %s" % baseline.get('renderer'))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+            help="node counts of the synthetic neurons, for example 1000 up to 10000000")
+    parser.add_argument("--paths", nargs="+", choices=RENDER_PATHS, default=list(RENDER_PATHS))
+    parser.add_argument("--generator", choices=sorted(GENERATORS), default="branching")
+    parser.add_argument("--branch-factor", type=int, default=2,
+            help="child branches of each branch point, for the branching generator")
+    parser.add_argument("--segment-length", type=int, default=20,
+            help="nodes between branch points, for the branching generator")
+    parser.add_argument("--branch-probability", type=float, default=0.05,
+            help="chance that a node starts a new branch, for the random generator")
+    parser.add_argument("--radius-distribution", choices=RADIUS_DISTRIBUTIONS, default="taper")
+    parser.add_argument("--radius-range", type=float, nargs=2, default=[0.2, 2.0])
+    parser.add_argument("--immediate-max-nodes", type=int, default=50000,
+            help="skip the immediate path for larger neurons, which would take minutes per frame")
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    context = OffscreenContext(args.width, args.height)
+    glClearColor(0.5, 0.5, 0.5, 0.0)
+    glEnable(GL_DEPTH_TEST)
+    glEnable(GL_CULL_FACE)
+    # Compile shaders before timing anything
+    programs = (sphere_shader120(), cone_shader120())
+    warm_up = NeuronRenderer330.fromNeuron(random_neuron(10, seed=0))
+    warm_up.initGL()
+    warm_up.deleteGL()
+
+    results = {
+            'version': RESULTS_VERSION,
+            'renderer': context.renderer(),
+            'platform': host_platform.platform(),
+            'python': host_platform.python_version(),
+            'numpy': numpy.__version__,
+            'settings': vars(args),
+            'results': [], }
+    print("Renderer: %s" % results['renderer'])
+    print("%10s %-10s %-12s %12s" % ("nodes", "path", "stage", "ms"))
+    def record(nodes, path, stage, ms):
+        results['results'].append({'generator': args.generator, 'nodes': nodes,
+                'path': path, 'stage': stage, 'ms': ms})
+        print("%10d %-10s %-12s %12.3f" % (nodes, path, stage, ms))
+        sys.stdout.flush()
+
+    temp_dir = tempfile.mkdtemp(prefix="swcimposters_bench")
+    try:
+        for size in args.sizes:
+            file_name = os.path.join(temp_dir, "synthetic_%d.swc" % size)
+            write_swc(generate_neuron(args, size), file_name)
+            t0 = time.time()
+            neuron = load_swc(file_name)
+            load_ms = _ms(t0)
+            os.remove(file_name)
+            look_at_neuron(neuron, args.width, args.height)
+            for name in args.paths:
+                if name == "immediate" and size > args.immediate_max_nodes:
+                    continue
+                record(size, name, 'load', load_ms)
+                try:
+                    timings = run_path(PATH_CLASSES[name](programs), neuron, context, args.frames)
+                except (MemoryError, GLError) as exc:
+                    print("%10d %-10s failed: %s" % (size, name, exc))
+                    results['results'].append({'generator': args.generator, 'nodes': size,
+                            'path': name, 'stage': 'error', 'ms': 0.0, 'message': str(exc)})
+                    continue
+                for stage in ('cones', 'build', 'upload', 'first_frame', 'draw_p50', 'draw_p95'):
+                    if stage in timings:
+                        record(size, name, stage, timings[stage])
+            del neuron
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        context.destroy()
+
+    with open(args.output, "w") as out:
+        json.dump(results, out, indent=2)
+        out.write("\n")
+    print("Results written to %s" % args.output)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            print(compare_results(json.load(baseline_file), results))
+
+
+if __name__ == "__main__":
+    main()
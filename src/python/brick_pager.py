@@ -0,0 +1,466 @@
+'''
+Out-of-core rendering of large scenes, from spatial bricks paged in on demand.
+
+write_bricks() partitions the nodes of many SWC files into cubic bricks of
+one size, each stored as two flat binary files of sphere and cone records
+beside a JSON index of brick bounds. A cone belongs to the brick of its
+center, and brick bounds span both end spheres of each cone, so that every
+imposter of a brick lies inside its box.
+
+BrickPager keeps the bricks nearest the camera resident, as one pair of
+instanced sets per brick, within a memory budget in bytes. Each frame,
+updateGL() ranks every brick by whether its box meets the view frustum and
+then by its distance from the eye, fills the budget from that list,
+skipping any brick too large for what remains, and asks a background
+thread for the chosen bricks that are missing.
+The thread reads and converts bricks while the caller keeps drawing
+whatever is resident; updateGL() uploads at most uploads_per_frame of the
+bricks it has finished, and never waits for disk. When the budget is full,
+the least recently drawn bricks are evicted first.
+
+hits and misses count visible bricks that were and were not resident when
+a frame was drawn, and evictions counts bricks dropped to make room:
+
+    pager = BrickPager("bricks", budget=256 << 20)
+    ...
+    pager.updateGL(glGetFloatv(GL_MODELVIEW_MATRIX), glGetFloatv(GL_PROJECTION_MATRIX))
+    glUseProgram(sphere_instanced_shader120())
+    pager.drawSpheresGL()
+    glUseProgram(cone_instanced_shader120())
+    pager.drawConesGL()
+
+Example:
+    python brick_pager.py --output bricks --brick-size 128 *.swc
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy
+
+from swc_cache import load_swc_cached
+from imposter_geometry import neuron_cone_parameters
+from imposter_geometry import SPHERE_INSTANCE_DTYPE, CONE_INSTANCE_DTYPE
+from imposter_geometry import COMPACT_SPHERE_INSTANCE_DTYPE, COMPACT_CONE_INSTANCE_DTYPE
+from imposter_vbo import SphereInstanceSet, ConeInstanceSet
+from depth_sort import view_frame
+from spatial_index import frustum_planes
+
+
+BRICK_VERSION = 1
+BRICK_INDEX_NAME = "bricks.json"
+SPHERE_SUFFIX = ".spheres"
+CONE_SUFFIX = ".cones"
+DEFAULT_BRICK_SIZE = 128.0 # edge of a brick, in SWC units
+DEFAULT_BUDGET = 256 << 20 # bytes of resident instances
+DEFAULT_UPLOADS_PER_FRAME = 4 # bricks uploaded by one updateGL()
+
+# Records of the brick files, in SWC coordinates, little-endian
+BRICK_SPHERE_DTYPE = numpy.dtype([
+        ('center', '<f4', (3,)),
+        ('radius', '<f4'), ])
+BRICK_CONE_DTYPE = numpy.dtype([
+        ('center', '<f4', (3,)),
+        ('radius', '<f4'), # at the cone center
+        ('axis', '<f4', (3,)), # half axis, toward the smaller end
+        ('taper', '<f4'), ])
+
+
+def brick_path(directory, key, suffix):
+    "File name of the spheres or cones of the brick at integer grid position key"
+    return os.path.join(directory, "%d_%d_%d%s" % (tuple(key) + (suffix,)))
+
+
+def _append_bricks(directory, bricks, suffix, count_name, records, keys, lo, hi):
+    "Append records to the files of their bricks, and grow the counts and bounds of each brick"
+    if len(records) == 0:
+        return
+    unique, inverse = numpy.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = numpy.argsort(inverse, kind='stable')
+    stops = numpy.cumsum(numpy.bincount(inverse, minlength=len(unique)))
+    start = 0
+    for key, stop in zip(unique, stops):
+        rows = order[start:stop]
+        start = stop
+        key = tuple(int(k) for k in key)
+        with open(brick_path(directory, key, suffix), "ab") as brick_file:
+            brick_file.write(records[rows].tobytes())
+        brick = bricks.setdefault(key, {'spheres': 0, 'cones': 0,
+                'lo': numpy.full(3, numpy.inf), 'hi': numpy.full(3, -numpy.inf)})
+        brick[count_name] += len(rows)
+        brick['lo'] = numpy.minimum(brick['lo'], lo[rows].min(axis=0))
+        brick['hi'] = numpy.maximum(brick['hi'], hi[rows].max(axis=0))
+
+
+def write_bricks(file_names, directory, brick_size=DEFAULT_BRICK_SIZE):
+    '''
+    Partition the nodes and cones of SWC files into bricks in directory.
+
+    Files are read one at a time, through the swc_cache sidecars, and their
+    records appended to the brick files, so the scene never has to fit in
+    memory. Bricks already in directory are replaced. Returns the index,
+    as read_brick_index() does.
+    '''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name in os.listdir(directory):
+        if name == BRICK_INDEX_NAME or name.endswith(SPHERE_SUFFIX) or name.endswith(CONE_SUFFIX):
+            os.remove(os.path.join(directory, name))
+    bricks = {} # grid position -> counts and bounds
+    for file_name in file_names:
+        neuron = load_swc_cached(file_name)
+        xyz = numpy.asarray(neuron.xyz, dtype=numpy.float64)
+        radius = numpy.asarray(neuron.radius, dtype=numpy.float64)
+        lo = xyz - radius[:, None]
+        hi = xyz + radius[:, None]
+        spheres = numpy.empty(len(xyz), dtype=BRICK_SPHERE_DTYPE)
+        spheres['center'] = xyz
+        spheres['radius'] = radius
+        _append_bricks(directory, bricks, SPHERE_SUFFIX, 'spheres', spheres,
+                numpy.floor(xyz / brick_size).astype(numpy.int64), lo, hi)
+        edges, cones = neuron_cone_parameters(neuron)
+        # Degenerate cones are drawn by no renderer, so are not stored
+        finite = numpy.isfinite(cones['center']).all(axis=1) & numpy.isfinite(cones['axis']).all(axis=1)
+        edges = edges[finite]
+        cones = cones[finite]
+        records = numpy.empty(len(cones), dtype=BRICK_CONE_DTYPE)
+        for field in ('center', 'radius', 'axis', 'taper'):
+            records[field] = cones[field]
+        # A cone lies inside the convex hull of its two end spheres
+        _append_bricks(directory, bricks, CONE_SUFFIX, 'cones', records,
+                numpy.floor(cones['center'] / brick_size).astype(numpy.int64),
+                numpy.minimum(lo[edges[:, 0]], lo[edges[:, 1]]),
+                numpy.maximum(hi[edges[:, 0]], hi[edges[:, 1]]))
+    keys = sorted(bricks.keys())
+    index = {
+            'version': BRICK_VERSION,
+            'brick_size': float(brick_size),
+            'files': [os.path.abspath(name) for name in file_names],
+            'bricks': [{
+                    'key': list(key),
+                    'spheres': int(bricks[key]['spheres']),
+                    'cones': int(bricks[key]['cones']),
+                    'lo': [float(x) for x in bricks[key]['lo']],
+                    'hi': [float(x) for x in bricks[key]['hi']], } for key in keys], }
+    with open(os.path.join(directory, BRICK_INDEX_NAME), "w") as index_file:
+        json.dump(index, index_file, sort_keys=True)
+    return index
+
+
+def read_brick_index(directory):
+    "The index written by write_bricks(), as a dict"
+    with open(os.path.join(directory, BRICK_INDEX_NAME), "r") as index_file:
+        index = json.load(index_file)
+    if index.get('version') != BRICK_VERSION:
+        raise ValueError("%s: unsupported brick format version %r" % (directory, index.get('version')))
+    return index
+
+
+def read_brick(directory, key):
+    "(spheres, cones) records of one brick, as BRICK_SPHERE_DTYPE and BRICK_CONE_DTYPE arrays"
+    result = []
+    for suffix, dtype in ((SPHERE_SUFFIX, BRICK_SPHERE_DTYPE), (CONE_SUFFIX, BRICK_CONE_DTYPE)):
+        path = brick_path(directory, key, suffix)
+        if os.path.exists(path):
+            result.append(numpy.fromfile(path, dtype=dtype))
+        else:
+            result.append(numpy.empty(0, dtype=dtype))
+    return tuple(result)
+
+
+def boxes_in_frustum(lo, hi, planes):
+    "True for each of N axis aligned boxes, given as Nx3 corners, that may meet the frustum"
+    center = 0.5 * (lo + hi)
+    extent = 0.5 * (hi - lo)
+    inside = numpy.ones(len(lo), dtype=bool)
+    for plane in planes:
+        # Distance of the box corner furthest along the plane normal
+        reach = numpy.dot(center, plane[0:3]) + plane[3] + numpy.dot(extent, numpy.abs(plane[0:3]))
+        inside &= reach >= 0
+    return inside
+
+
+def box_distances(lo, hi, point):
+    "Distance from point to each of N axis aligned boxes, zero inside"
+    gap = numpy.maximum(numpy.maximum(lo - point, point - hi), 0.0)
+    return numpy.sqrt(numpy.einsum('ij,ij->i', gap, gap))
+
+
+def fill_budget(order, sizes, budget):
+    '''
+    The bricks of order, in turn, whose sizes fit in budget, as an index
+    array. A brick too large for what remains is skipped, and smaller
+    bricks after it still fill the budget. Each pass takes the longest
+    run that fits, so a frame costs a few vectorized passes, not one
+    Python step per brick.
+    '''
+    chosen = []
+    remaining = budget
+    rest = numpy.asarray(order)
+    while len(rest) > 0:
+        rest = rest[sizes[rest] <= remaining]
+        fits = numpy.cumsum(sizes[rest]) <= remaining
+        count = len(rest) if fits.all() else int(numpy.argmin(fits))
+        chosen.append(rest[:count])
+        remaining -= int(sizes[rest[:count]].sum())
+        rest = rest[count + 1:] # skips the brick that no longer fits
+    if len(chosen) == 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    return numpy.concatenate(chosen)
+
+
+class BrickPager(object):
+    "Keeps the bricks nearest the camera resident within a memory budget, reading them on a background thread"
+    def __init__(self, directory, budget=DEFAULT_BUDGET, center=None, scale=None, compact=True,
+            uploads_per_frame=DEFAULT_UPLOADS_PER_FRAME):
+        '''
+        budget is the most bytes of instance attributes kept resident.
+        center and scale place the scene, as in scene_loader.neuron_fit();
+        by default they fit the bounds of every brick. With compact,
+        bricks are stored as COMPACT_SPHERE_INSTANCE_DTYPE and
+        COMPACT_CONE_INSTANCE_DTYPE, each with its own origin and scale.
+        '''
+        self.directory = directory
+        self.index = read_brick_index(directory)
+        self.budget = budget
+        self.compact = compact
+        self.uploads_per_frame = uploads_per_frame
+        entries = self.index['bricks']
+        self.keys = [tuple(entry['key']) for entry in entries]
+        lo = numpy.array([entry['lo'] for entry in entries], dtype=numpy.float64).reshape(-1, 3)
+        hi = numpy.array([entry['hi'] for entry in entries], dtype=numpy.float64).reshape(-1, 3)
+        if center is None or scale is None:
+            if len(entries) > 0:
+                scene_lo, scene_hi = lo.min(axis=0), hi.max(axis=0)
+            else:
+                scene_lo = scene_hi = numpy.zeros(3)
+            center = 0.5 * (scene_lo + scene_hi)
+            scale = 4.0 / max(numpy.linalg.norm(scene_hi - scene_lo), 1e-6)
+        self.center = numpy.asarray(center, dtype=numpy.float64)
+        self.scale = float(scale)
+        # Brick boxes where they are drawn, after the scene transform
+        self.lo = (lo - self.center) * self.scale
+        self.hi = (hi - self.center) * self.scale
+        sphere_dtype, cone_dtype = SPHERE_INSTANCE_DTYPE, CONE_INSTANCE_DTYPE
+        if compact:
+            sphere_dtype, cone_dtype = COMPACT_SPHERE_INSTANCE_DTYPE, COMPACT_CONE_INSTANCE_DTYPE
+        self.brick_bytes = numpy.array([entry['spheres'] * sphere_dtype.itemsize
+                + entry['cones'] * cone_dtype.itemsize for entry in entries], dtype=numpy.int64)
+        # Brick index -> (SphereInstanceSet, ConeInstanceSet), least recently drawn first
+        self.resident = collections.OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0 # bricks read and uploaded
+        self.errors = [] # one message per brick that failed to load
+        self.visible = [] # resident bricks drawn this frame, nearest first
+        self._wanted = set() # bricks that fit in the budget this frame
+        self._failed = set()
+        # Shared with the loading thread, under _lock
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._requests = [] # brick indices to read, most important first
+        self._pending = set() # being read, or read and not yet uploaded
+        self._loaded = [] # (index, sets, error) read by the thread
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        "Number of bricks, resident or not"
+        return len(self.keys)
+
+    def _readBrick(self, index):
+        "Loading thread side: read one brick and build its instance sets, without OpenGL"
+        spheres, cones = read_brick(self.directory, self.keys[index])
+        center = (spheres['center'].astype(numpy.float64) - self.center) * self.scale
+        transformed = numpy.empty(len(cones), dtype=BRICK_CONE_DTYPE)
+        transformed['center'] = (cones['center'].astype(numpy.float64) - self.center) * self.scale
+        transformed['radius'] = cones['radius'] * self.scale
+        transformed['axis'] = cones['axis'] * self.scale
+        transformed['taper'] = cones['taper']
+        # The brick is the unit of culling, so its sets draw every primitive
+        return (SphereInstanceSet(center, spheres['radius'] * self.scale, compact=self.compact),
+                ConeInstanceSet(transformed, compact=self.compact))
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while not self._closed and len(self._requests) == 0:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                index = self._requests.pop(0)
+                self._pending.add(index)
+            sets, error = None, None
+            try:
+                sets = self._readBrick(index)
+            except Exception as exc:
+                error = "%s: %s" % (brick_path(self.directory, self.keys[index], ""), exc)
+            with self._lock:
+                self._loaded.append((index, sets, error))
+
+    def update(self, modelViewMatrix, projectionMatrix):
+        '''
+        Rank bricks for this view, count hits and misses, and ask the
+        loading thread for missing bricks; needs no OpenGL context.
+        '''
+        if len(self) == 0:
+            self.visible = []
+            return
+        planes = frustum_planes(modelViewMatrix, projectionMatrix)
+        eye = view_frame(modelViewMatrix)[0]
+        in_view = boxes_in_frustum(self.lo, self.hi, planes)
+        distance = box_distances(self.lo, self.hi, eye)
+        # Visible bricks nearest first, then the others, prefetched while budget remains
+        order = fill_budget(numpy.lexsort((distance, ~in_view)), self.brick_bytes, self.budget)
+        self._wanted = set(int(index) for index in order)
+        self.visible = []
+        missing = []
+        for index in order:
+            index = int(index)
+            if index in self.resident:
+                # Most recently used last, in the order of the OrderedDict
+                self.resident[index] = self.resident.pop(index)
+                if in_view[index]:
+                    self.visible.append(index)
+                    self.hits += 1
+            else:
+                if in_view[index]:
+                    self.misses += 1
+                if index not in self._failed:
+                    missing.append(index)
+        with self._wake:
+            self._requests = [index for index in missing if index not in self._pending]
+            if len(self._requests) > 0:
+                self._wake.notify()
+
+    def _evictGL(self, room):
+        "Evict least recently drawn bricks until room bytes are free, keeping bricks wanted this frame"
+        while len(self.resident) > 0 and self.resident_bytes + room > self.budget:
+            index = next(iter(self.resident))
+            if index in self._wanted:
+                break
+            for drawable in self.resident.pop(index):
+                drawable.deleteGL()
+            self.resident_bytes -= int(self.brick_bytes[index])
+            self.evictions += 1
+
+    def uploadGL(self, limit=None):
+        "Upload at most limit bricks that the loading thread has read; returns their indices"
+        with self._lock:
+            if limit is None:
+                limit = len(self._loaded)
+            arrived = self._loaded[:limit]
+            del self._loaded[:limit]
+        added = []
+        for index, sets, error in arrived:
+            if error is not None:
+                self.errors.append(error)
+                self._failed.add(index)
+            elif index in self._wanted and index not in self.resident:
+                self._evictGL(int(self.brick_bytes[index]))
+                for drawable in sets:
+                    drawable.uploadGL()
+                self.resident[index] = sets
+                self.resident_bytes += int(self.brick_bytes[index])
+                self.loads += 1
+                added.append(index)
+            # Bricks no longer wanted are dropped, and read again if the camera returns
+            with self._lock:
+                self._pending.discard(index)
+        return added
+
+    def updateGL(self, modelViewMatrix, projectionMatrix):
+        '''
+        Once per frame, before drawing: upload bricks read since the last
+        frame, then choose the bricks of this view. Never waits for disk.
+        '''
+        self.uploadGL(self.uploads_per_frame)
+        self.update(modelViewMatrix, projectionMatrix)
+
+    def visibleSets(self):
+        "(spheres, cones) instance sets of the resident bricks in view"
+        return [self.resident[index] for index in self.visible]
+
+    def drawSpheresGL(self):
+        "Draw the spheres of every resident brick in view; the caller binds sphere_instanced_shader120 first"
+        for spheres, cones in self.visibleSets():
+            spheres.drawGL()
+
+    def drawConesGL(self):
+        "Draw the cones of every resident brick in view; the caller binds cone_instanced_shader120 first"
+        for spheres, cones in self.visibleSets():
+            cones.drawGL()
+
+    def idle(self):
+        "True when the loading thread has no brick to read and none waiting for upload"
+        with self._lock:
+            return len(self._requests) == 0 and len(self._pending) == 0
+
+    def wait(self, interval=0.001):
+        "Block until the loading thread has read every requested brick"
+        while True:
+            with self._lock:
+                done = len(self._requests) == 0 and len(self._pending) == len(self._loaded)
+            if done:
+                return
+            time.sleep(interval)
+
+    def stats(self):
+        "Cache counters and residency, as a dict"
+        return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'loads': self.loads,
+                'resident_bricks': len(self.resident),
+                'resident_bytes': self.resident_bytes,
+                'budget': self.budget,
+                'bricks': len(self), }
+
+    def close(self):
+        "Stop the loading thread"
+        with self._wake:
+            self._closed = True
+            self._wake.notify_all()
+        self._thread.join()
+
+    def deleteGL(self):
+        for sets in self.resident.values():
+            for drawable in sets:
+                drawable.deleteGL()
+        self.resident.clear()
+        self.resident_bytes = 0
+        self.visible = []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Partition the nodes of many SWC files into spatial bricks on disk")
+    parser.add_argument("swc_files", nargs="+")
+    parser.add_argument("--output", required=True, help="directory of the brick files")
+    parser.add_argument("--brick-size", type=float, default=DEFAULT_BRICK_SIZE,
+            help="edge of each cubic brick, in SWC units")
+    args = parser.parse_args()
+    t0 = time.time()
+    index = write_bricks(args.swc_files, args.output, args.brick_size)
+    counts = numpy.array([(entry['spheres'], entry['cones']) for entry in index['bricks']],
+            dtype=numpy.int64).reshape(-1, 2)
+    print("%d files, %d spheres, %d cones in %d bricks, largest %d spheres, in %.3f s" % (
+            len(index['files']), counts[:, 0].sum(), counts[:, 1].sum(), len(counts),
+            counts[:, 0].max() if len(counts) > 0 else 0, time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+'''
+CPU reference ray caster for sphere and cone imposters.
+
+The functions in the first half of this module are NumPy ports of the
+intersection and shading functions in imposter_fns120.glsl, with the same
+names and the same arithmetic. Each operates on whole arrays of
+(pixel, primitive) pairs at once, so a tile of the image is ray cast in a
+handful of vectorized operations.
+
+CpuImposterRenderer builds a headless renderer on top of them. It uses the
+same conventions as the GLSL 1.20 shaders: centers and cone axes are
+transformed by the model view matrix, radii are not. It produces depth,
+normal and color images, for thumbnails on machines without a GPU and as a
+golden reference when changing the shaders.
+
+Example:
+    python cpu_raycast.py --size 512 neuron.swc thumbnail.png
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import struct
+import time
+import zlib
+
+import numpy
+
+from spatial_index import expand_ranges
+
+
+DEFAULT_COLOR = (0.2, 0.5, 0.8)
+DEFAULT_TILE_SIZE = 64 # pixels along each side of a tile
+DEFAULT_MAX_PAIRS = 1 << 19 # (pixel, primitive) pairs evaluated per vectorized batch
+
+# Values of the 'kind' entry of each primitive dict in a prepared scene
+SPHERES = 0
+CONES = 1
+
+
+def _dot(a, b):
+    return numpy.einsum('...i,...i->...', a, b)
+
+
+def _normalize(v):
+    return v / numpy.sqrt(_dot(v, v))[..., None]
+
+
+# Ports of imposter_fns120.glsl. Vector arguments are ...x3 arrays, scalars ... arrays.
+
+def light_rig(pos, normal, surface_color):
+    "Hard coded light system, identical to light_rig() in imposter_fns120.glsl"
+    ambient_light = numpy.array([0.2, 0.2, 0.2])
+    diffuse_light = numpy.array([0.8, 0.8, 0.8])
+    specular_light = numpy.array([0.8, 0.8, 0.8])
+    surfaceToLight = _normalize(numpy.array([-5.0, 3.0, 3.0]))
+    diffuseCoefficient = numpy.maximum(0.0, _dot(normal, surfaceToLight))
+    diffuse = diffuseCoefficient[..., None] * surface_color * diffuse_light
+    ambient = ambient_light * surface_color
+    surfaceToCamera = _normalize(-pos)
+    # Blinn-Phong specular model
+    H = _normalize(surfaceToLight + surfaceToCamera)
+    nDotH = numpy.maximum(0.0, _dot(normal, H))
+    specular = (nDotH**100)[..., None] * specular_light
+    return diffuse + specular + ambient
+
+
+def frag_depth_from_eye_xyz(eyeXyz, projectionMatrix, near=0.0, far=1.0):
+    "Window depth of eye coordinates, as fragDepthFromEyeXyz(); projectionMatrix in OpenGL order"
+    projection = numpy.asarray(projectionMatrix, dtype=numpy.float64).reshape(4, 4).T
+    clip_z = numpy.dot(eyeXyz, projection[2, 0:3]) + projection[2, 3]
+    clip_w = numpy.dot(eyeXyz, projection[3, 0:3]) + projection[3, 3]
+    ndc_depth = clip_z / clip_w
+    return ((far - near) * ndc_depth + near + far) / 2.0
+
+
+def sphere_linear_coeffs(center, radius, pos):
+    "(pc, c2) for each sphere and imposter position, as sphere_linear_coeffs()"
+    pc = _dot(pos, center)
+    c2 = _dot(center, center) - radius * radius
+    return pc, c2
+
+
+def sphere_nonlinear_coeffs(pos, pc, c2):
+    "(a2, discriminant); negative discriminants miss the sphere"
+    a2 = _dot(pos, pos)
+    discriminant = pc * pc - a2 * c2
+    return a2, discriminant
+
+
+def sphere_surface_from_coeffs(pos, pc, a2, discriminant):
+    "Near surface point of the sphere along each ray through pos"
+    left = pc / a2
+    right = numpy.sqrt(numpy.maximum(discriminant, 0.0)) / a2
+    alpha1 = left - right # near surface of sphere
+    return alpha1[..., None] * pos
+
+
+def sphere_imposter_frag(surface_color, pos, center, radius, projectionMatrix):
+    '''
+    Whole sphere fragment shader, as SpheresFrag120.glsl.
+
+    Returns (hit, color, depth, normal, surface); entries where hit is False
+    correspond to discarded fragments.
+    '''
+    pc, c2 = sphere_linear_coeffs(center, radius, pos)
+    a2, discriminant = sphere_nonlinear_coeffs(pos, pc, c2)
+    hit = discriminant > 0
+    s = sphere_surface_from_coeffs(pos, pc, a2, discriminant)
+    normal = (1.0 / radius)[..., None] * (s - center)
+    color = light_rig(s, normal, surface_color)
+    depth = frag_depth_from_eye_xyz(s, projectionMatrix)
+    return hit, color, depth, normal, s
+
+
+def cone_linear_coeffs(center, radius, axis, taper, pos):
+    "(tAP, qe_c, qe_half_b, qe_undot_half_a), as cone_linear_coeffs()"
+    x = _normalize(-axis) # minus is important...
+    qe_undot_half_a = numpy.cross(pos, x)
+    tAP = taper * _dot(x, pos)
+    tAC = taper * _dot(x, center)
+    xx, xy, xz = x[..., 0], x[..., 1], x[..., 2]
+    cx, cy, cz = center[..., 0], center[..., 1], center[..., 2]
+    qe_undot_b_part = numpy.stack([
+            cx * (-xy*xy - xz*xz) + cy * (xx*xy) + cz * (xx*xz),
+            cx * (xx*xy) + cy * (-xx*xx - xz*xz) + cz * (xy*xz),
+            cx * (xx*xz) + cy * (xy*xz) + cz * (-xx*xx - xy*xy), ], axis=-1)
+    qe_half_b = _dot(pos, qe_undot_b_part) - tAP * (radius - tAC)
+    cxa = numpy.cross(center, x)
+    qe_c = _dot(cxa, cxa) - radius * radius + (2*radius - tAC) * tAC
+    return tAP, qe_c, qe_half_b, qe_undot_half_a
+
+
+def cone_nonlinear_coeffs(tAP, qe_c, qe_half_b, qe_undot_half_a):
+    "(qe_half_a, discriminant); negative discriminants miss the cone"
+    qe_half_a = _dot(qe_undot_half_a, qe_undot_half_a) - tAP * tAP
+    discriminant = qe_half_b * qe_half_b - qe_half_a * qe_c
+    return qe_half_a, discriminant
+
+
+def cone_surface_from_coeffs(pos, qe_half_b, qe_half_a, discriminant):
+    "Near surface point of the infinite cone along each ray through pos"
+    left = -qe_half_b / qe_half_a
+    right = numpy.sqrt(numpy.maximum(discriminant, 0.0)) / qe_half_a
+    alpha1 = left - right
+    return alpha1[..., None] * pos
+
+
+def cone_imposter_frag(surface_color, pos, aHat, halfConeLength, center, taper,
+        tAP, qe_c, qe_half_b, qe_undot_half_a, normalScale, projectionMatrix):
+    '''
+    Port of cone_imposter_frag().
+
+    Returns (hit, color, depth, normal, surface); entries where hit is False
+    correspond to discarded fragments.
+    '''
+    qe_half_a, discriminant = cone_nonlinear_coeffs(tAP, qe_c, qe_half_b, qe_undot_half_a)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        s = cone_surface_from_coeffs(pos, qe_half_b, qe_half_a, discriminant)
+        cs = s - center
+        along = _dot(cs, aHat)
+        # Truncate cone geometry to prescribed ends
+        hit = (discriminant > 0) & (numpy.abs(along) <= halfConeLength)
+        n1 = _normalize(cs - along[..., None] * aHat)
+        normal = normalScale[..., None] * (n1 + taper[..., None] * aHat)
+        color = light_rig(s, normal, surface_color)
+        depth = frag_depth_from_eye_xyz(s, projectionMatrix)
+    return hit, color, depth, normal, s
+
+
+# Headless renderer
+
+def perspective(fovy, aspect, near, far):
+    "Projection matrix like gluPerspective(), in OpenGL column-major order"
+    f = 1.0 / numpy.tan(numpy.radians(fovy) / 2.0)
+    m = numpy.zeros((4, 4))
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2.0 * far * near / (near - far)
+    m[3, 2] = -1.0
+    return m.T
+
+
+def look_at(eye, center, up=(0.0, 1.0, 0.0)):
+    "Model view matrix like gluLookAt(), in OpenGL column-major order"
+    eye = numpy.asarray(eye, dtype=numpy.float64)
+    forward = _normalize(numpy.asarray(center, dtype=numpy.float64) - eye)
+    side = _normalize(numpy.cross(forward, up))
+    up = numpy.cross(side, forward)
+    m = numpy.eye(4)
+    m[0, 0:3] = side
+    m[1, 0:3] = up
+    m[2, 0:3] = -forward
+    m[0:3, 3] = -numpy.dot(m[0:3, 0:3], eye)
+    return m.T
+
+
+class RaycastImage(object):
+    "Depth, eye space normal and color buffers, bottom row first like OpenGL"
+    def __init__(self, width, height, background=(0.5, 0.5, 0.5)):
+        self.width = width
+        self.height = height
+        self.depth = numpy.ones(width * height) # window depth; 1.0 where nothing was hit
+        self.normal = numpy.zeros((width * height, 3))
+        self.color = numpy.empty((width * height, 3))
+        self.color[:] = background
+
+    def rgba8(self):
+        "Color as a height x width x 4 uint8 array, top row first, like OffscreenContext.readPixels()"
+        image = numpy.empty((self.height, self.width, 4), dtype=numpy.uint8)
+        color = numpy.clip(self.color, 0.0, 1.0).reshape(self.height, self.width, 3)
+        image[:, :, 0:3] = numpy.round(color * 255.0)[::-1]
+        image[:, :, 3] = 255
+        return image
+
+    def depthImage(self):
+        "Depth as a height x width array, top row first"
+        return self.depth.reshape(self.height, self.width)[::-1]
+
+
+class CpuImposterRenderer(object):
+    "Ray casts sphere and cone imposters on the CPU, tile by tile"
+    def __init__(self, width, height, tile_size=DEFAULT_TILE_SIZE, max_pairs=DEFAULT_MAX_PAIRS):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.max_pairs = max_pairs
+        self.background = (0.5, 0.5, 0.5)
+        self.modelViewMatrix = numpy.eye(4)
+        self.projectionMatrix = perspective(45.0, float(width) / height, 0.1, 100.0)
+        self.spheres = [] # (center, radius, color) arrays, in model coordinates
+        self.cones = [] # (cones, color)
+        self.pair_count = 0 # (pixel, primitive) pairs evaluated by the last render()
+
+    def setCamera(self, modelViewMatrix, projectionMatrix):
+        "Matrices in OpenGL column-major order, as from glGetFloatv() or look_at() and perspective()"
+        self.modelViewMatrix = numpy.asarray(modelViewMatrix, dtype=numpy.float64).reshape(4, 4)
+        self.projectionMatrix = numpy.asarray(projectionMatrix, dtype=numpy.float64).reshape(4, 4)
+
+    def addSpheres(self, center, radius, color=DEFAULT_COLOR):
+        "color is one RGB triple, or one per sphere"
+        center = numpy.asarray(center, dtype=numpy.float64).reshape(-1, 3)
+        radius = numpy.asarray(radius, dtype=numpy.float64).reshape(-1)
+        color = numpy.broadcast_to(numpy.asarray(color, dtype=numpy.float64), (len(radius), 3))
+        self.spheres.append((center, radius, color))
+
+    def addCones(self, cones, color=DEFAULT_COLOR):
+        "cones is a CONE_DTYPE array from cone_parameters(); color is one RGB triple, or one per cone"
+        color = numpy.broadcast_to(numpy.asarray(color, dtype=numpy.float64), (len(cones), 3))
+        self.cones.append((cones, color))
+
+    def addNeuron(self, neuron, color=DEFAULT_COLOR):
+        "All spheres and cones of an SwcNeuron"
+        from imposter_geometry import neuron_cone_parameters
+        edges, cones = neuron_cone_parameters(neuron)
+        self.addSpheres(neuron.xyz, neuron.radius, color)
+        self.addCones(cones, color)
+
+    def clear(self):
+        self.spheres = []
+        self.cones = []
+
+    def _eyeSpheres(self):
+        "Sphere parameters in eye coordinates, as after SpheresVrtx120.glsl"
+        if len(self.spheres) == 0:
+            return None
+        center, radius, color = [numpy.concatenate(a) for a in zip(*self.spheres)]
+        modelView = self.modelViewMatrix.T
+        center = numpy.dot(center, modelView[0:3, 0:3].T) + modelView[0:3, 3]
+        return {'center': center, 'radius': radius, 'color': color, 'bound': radius}
+
+    def _eyeCones(self):
+        "Cone parameters in eye coordinates, as after ConesVrtx120.glsl"
+        if len(self.cones) == 0:
+            return None
+        cones = numpy.concatenate([c for c, color in self.cones])
+        color = numpy.concatenate([color for c, color in self.cones])
+        keep = numpy.isfinite(cones['length']) & (cones['length'] > 0)
+        cones, color = cones[keep], color[keep]
+        modelView = self.modelViewMatrix.T
+        center = numpy.dot(cones['center'], modelView[0:3, 0:3].T) + modelView[0:3, 3]
+        axis = numpy.dot(cones['axis'], modelView[0:3, 0:3].T)
+        halfConeLength = numpy.sqrt(_dot(axis, axis))
+        taper = cones['taper']
+        return {'center': center, 'radius': cones['radius'], 'color': color,
+                'axis': axis, 'halfConeLength': halfConeLength, 'taper': taper,
+                'aHat': axis / halfConeLength[:, None],
+                'normalScale': 1.0 / numpy.sqrt(1.0 + taper * taper),
+                'bound': numpy.sqrt(halfConeLength**2 + cones['r2']**2)}
+
+    def _pixelRects(self, center, bound):
+        '''
+        Inclusive pixel rectangles (x0, x1, y0, y1) conservatively covering
+        each bounding sphere, or None entries for primitives that cannot be
+        visible.
+        '''
+        projection = self.projectionMatrix.T
+        w = -center[:, 2]
+        visible = w + bound > 0 # not entirely behind the camera
+        straddles = w - bound <= 1e-6 * numpy.maximum(1.0, bound)
+        rects = []
+        for axis, size in ((0, self.width), (1, self.height)):
+            # x/w is monotonic over the box [c - r, c + r] x [w - r, w + r] when w > r
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                lo_near = (center[:, axis] - bound) / (w - bound)
+                lo_far = (center[:, axis] - bound) / (w + bound)
+                hi_near = (center[:, axis] + bound) / (w - bound)
+                hi_far = (center[:, axis] + bound) / (w + bound)
+            lo = numpy.minimum(lo_near, lo_far)
+            hi = numpy.maximum(hi_near, hi_far)
+            # Projected coordinate to window coordinate
+            scale = projection[axis, axis]
+            offset = -projection[axis, 2] # off axis frustum shift
+            lo = ((scale * lo + offset) * 0.5 + 0.5) * size
+            hi = ((scale * hi + offset) * 0.5 + 0.5) * size
+            lo = numpy.where(straddles, 0, numpy.floor(lo - 0.5))
+            hi = numpy.where(straddles, size - 1, numpy.ceil(hi - 0.5))
+            lo = numpy.clip(numpy.nan_to_num(lo), 0, size - 1).astype(numpy.int64)
+            hi = numpy.clip(numpy.nan_to_num(hi), -1, size - 1).astype(numpy.int64)
+            visible &= (hi >= lo) & (hi >= 0)
+            rects.extend([lo, hi])
+        return visible, rects
+
+    def _rays(self, x, y):
+        "Point on the eye space ray through each pixel center, at z = -1"
+        projection = self.projectionMatrix.T
+        ndc_x = (x + 0.5) * (2.0 / self.width) - 1.0
+        ndc_y = (y + 0.5) * (2.0 / self.height) - 1.0
+        pos = numpy.empty((len(x), 3))
+        pos[:, 0] = (ndc_x + projection[0, 2]) / projection[0, 0]
+        pos[:, 1] = (ndc_y + projection[1, 2]) / projection[1, 1]
+        pos[:, 2] = -1.0
+        return pos
+
+    def tiles(self):
+        "(x0, y0, x1, y1) of every tile, half open"
+        t = self.tile_size
+        return [(x, y, min(x + t, self.width), min(y + t, self.height))
+                for y in range(0, self.height, t) for x in range(0, self.width, t)]
+
+    def _bin(self, primitives):
+        '''
+        Add the pixel rectangle of each primitive, and the primitives
+        overlapping each tile, to a dict of primitive arrays: primitives
+        overlapping tile i are tile_primitives[tile_bounds[i]:tile_bounds[i+1]].
+        '''
+        visible, (x0, x1, y0, y1) = self._pixelRects(primitives['center'], primitives['bound'])
+        index = numpy.flatnonzero(visible)
+        t = self.tile_size
+        tiles_x = (self.width + t - 1) // t
+        tx0, tx1 = x0[index] // t, x1[index] // t
+        ty0, ty1 = y0[index] // t, y1[index] // t
+        columns = tx1 - tx0 + 1
+        counts = columns * (ty1 - ty0 + 1)
+        owner = numpy.repeat(numpy.arange(len(index)), counts)
+        local = expand_ranges(numpy.zeros(len(counts), dtype=numpy.int64), counts)
+        tile = (ty0[owner] + local // columns[owner]) * tiles_x + tx0[owner] + local % columns[owner]
+        order = numpy.argsort(tile, kind='mergesort')
+        primitives['tile_primitives'] = index[owner[order]]
+        primitives['tile_bounds'] = numpy.searchsorted(tile[order], numpy.arange(len(self.tiles()) + 1))
+        primitives['x0'], primitives['x1'], primitives['y0'], primitives['y1'] = x0, x1, y0, y1
+        return primitives
+
+    def _tilePrimitives(self, primitives, tile_index):
+        bounds = primitives['tile_bounds']
+        return primitives['tile_primitives'][bounds[tile_index]:bounds[tile_index+1]]
+
+    def _tileAreas(self, primitives, primitive, tile):
+        "Pixels of each primitive's rectangle within one tile"
+        return ((numpy.minimum(primitives['x1'][primitive] + 1, tile[2])
+                    - numpy.maximum(primitives['x0'][primitive], tile[0]))
+                * (numpy.minimum(primitives['y1'][primitive] + 1, tile[3])
+                    - numpy.maximum(primitives['y0'][primitive], tile[1])))
+
+    def _pairs(self, primitives, primitive, tile):
+        "(primitive, x, y) for every pixel of each primitive's rectangle within one tile"
+        x0 = numpy.maximum(primitives['x0'][primitive], tile[0])
+        y0 = numpy.maximum(primitives['y0'][primitive], tile[1])
+        columns = numpy.minimum(primitives['x1'][primitive] + 1, tile[2]) - x0
+        counts = self._tileAreas(primitives, primitive, tile)
+        owner = numpy.repeat(numpy.arange(len(primitive)), counts)
+        local = expand_ranges(numpy.zeros(len(counts), dtype=numpy.int64), counts)
+        return primitive[owner], x0[owner] + local % columns[owner], y0[owner] + local // columns[owner]
+
+    def _shadeSpheres(self, spheres, index, pos):
+        return sphere_imposter_frag(spheres['color'][index], pos,
+                spheres['center'][index], spheres['radius'][index], self.projectionMatrix)
+
+    def _shadeCones(self, cones, index, pos):
+        center = cones['center'][index]
+        radius = cones['radius'][index]
+        taper = cones['taper'][index]
+        # The vertex shader computes these at hull vertices; they are linear in pos
+        tAP, qe_c, qe_half_b, qe_undot_half_a = cone_linear_coeffs(
+                center, radius, cones['axis'][index], taper, pos)
+        return cone_imposter_frag(cones['color'][index], pos,
+                cones['aHat'][index], cones['halfConeLength'][index], center, taper,
+                tAP, qe_c, qe_half_b, qe_undot_half_a, cones['normalScale'][index],
+                self.projectionMatrix)
+
+    def tileCost(self, scene, tile_index):
+        "Number of (pixel, primitive) pairs in one tile, as an estimate of its render time"
+        tile = self.tiles()[tile_index]
+        return sum(int(self._tileAreas(primitives, self._tilePrimitives(primitives, tile_index), tile).sum())
+                for primitives in scene)
+
+    def renderTile(self, image, tile_index, scene):
+        "Ray cast one tile of a scene from prepare() into image; returns the number of pairs evaluated"
+        tile = self.tiles()[tile_index]
+        pair_count = 0
+        for primitives in scene:
+            shade = self._shadeSpheres if primitives['kind'] == SPHERES else self._shadeCones
+            primitive = self._tilePrimitives(primitives, tile_index)
+            if len(primitive) == 0:
+                continue
+            # Split the primitives so that each batch has about max_pairs pixels
+            batch = numpy.cumsum(self._tileAreas(primitives, primitive, tile)) // self.max_pairs
+            splits = numpy.flatnonzero(numpy.diff(batch)) + 1
+            for chunk in numpy.split(primitive, splits):
+                index, x, y = self._pairs(primitives, chunk, tile)
+                pair_count += len(index)
+                hit, color, depth, normal, s = shade(primitives, index, self._rays(x, y))
+                # Near and far clipping, as for rasterized fragments
+                hit &= (s[:, 2] < 0) & (depth >= 0.0) & (depth <= 1.0)
+                self._depthTest(image, (y * self.width + x)[hit],
+                        depth[hit], color[hit], normal[hit])
+        return pair_count
+
+    def _depthTest(self, image, pixel, depth, color, normal):
+        closer = depth < image.depth[pixel]
+        pixel, depth = pixel[closer], depth[closer]
+        if len(pixel) == 0:
+            return
+        # Nearest fragment of each pixel in this batch
+        order = numpy.lexsort((depth, pixel))
+        first = numpy.ones(len(order), dtype=bool)
+        first[1:] = pixel[order][1:] != pixel[order][:-1]
+        nearest = numpy.flatnonzero(closer)[order[first]]
+        pixel = pixel[order[first]]
+        image.depth[pixel] = depth[order[first]]
+        image.color[pixel] = color[nearest]
+        image.normal[pixel] = normal[nearest]
+
+    def prepare(self):
+        '''
+        Transform and bin all primitives.
+
+        Returns the scene as a list of dicts of flat arrays, one per
+        primitive kind, as consumed by renderTile().
+        '''
+        scene = []
+        for kind, primitives in ((SPHERES, self._eyeSpheres()), (CONES, self._eyeCones())):
+            if primitives is None:
+                continue
+            primitives = self._bin(primitives)
+            primitives['kind'] = kind
+            scene.append(primitives)
+        return scene
+
+    def render(self):
+        "Ray cast every tile, returning a RaycastImage"
+        image = RaycastImage(self.width, self.height, self.background)
+        scene = self.prepare()
+        self.pair_count = 0
+        for tile_index in range(len(self.tiles())):
+            self.pair_count += self.renderTile(image, tile_index, scene)
+        return image
+
+
+def write_png(file_name, image):
+    "Write a height x width x 3 or 4 uint8 array, top row first, as an RGB PNG file"
+    image = numpy.ascontiguousarray(image[:, :, 0:3], dtype=numpy.uint8)
+    height, width = image.shape[0:2]
+    rows = numpy.zeros((height, 1 + 3 * width), dtype=numpy.uint8) # filter byte 0 per row
+    rows[:, 1:] = image.reshape(height, -1)
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+    with open(file_name, "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        png_file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        png_file.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        png_file.write(chunk(b"IEND", b""))
+
+
+def fit_camera(renderer, xyz, radius, fovy=30.0):
+    "Point renderer at the bounding box of all nodes, from the +Z side"
+    lo = (xyz - radius[:, None]).min(axis=0)
+    hi = (xyz + radius[:, None]).max(axis=0)
+    center = 0.5 * (lo + hi)
+    extent = 0.5 * numpy.linalg.norm(hi - lo)
+    distance = extent / numpy.sin(numpy.radians(fovy) / 2.0)
+    renderer.setCamera(look_at(center + [0, 0, distance], center),
+            perspective(fovy, float(renderer.width) / renderer.height,
+                    max(distance - extent, 1e-3 * distance), distance + extent))
+
+
+def main():
+    from swc import load_swc
+    parser = argparse.ArgumentParser(description="Render an SWC file to a PNG thumbnail, without a GPU")
+    parser.add_argument("swc_file")
+    parser.add_argument("png_file")
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args()
+    t0 = time.time()
+    neuron = load_swc(args.swc_file)
+    renderer = CpuImposterRenderer(args.size, args.size)
+    renderer.addNeuron(neuron)
+    fit_camera(renderer, neuron.xyz, neuron.radius)
+    image = renderer.render()
+    write_png(args.png_file, image.rgba8())
+    print("%s: %d nodes, %d pixel/primitive pairs, %.2f s" % (
+            args.png_file, len(neuron), renderer.pair_count, time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+'''
+Deferred shading of imposters: ray-cast into a G-buffer, then light each pixel once.
+
+The forward imposter programs light every fragment that survives the
+ray-cast, even those that a nearer imposter overwrites later, so lighting
+cost grows with the depth complexity of dense arbors. The deferred
+programs (NeuronRenderer330 with deferred=True) write only the unlit
+surface color, the surface normal and the depth into a GBuffer, and one
+full screen pass of DeferredFrag330.glsl then lights the nearest surface at
+each pixel:
+
+    gbuffer.beginGL()
+    for renderer in renderers:
+        renderer.deferred = True
+        renderer.drawGL(modelview, projection)
+    gbuffer.endGL()
+    gbuffer.resolveGL(projection)
+
+The lighting pass writes depth as well as color, so the lit imposters
+are depth tested against, and hide, other geometry in the frame.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+from OpenGL.GL import *
+import numpy
+
+from imposter_shaders import deferred_lighting_shader330
+from neuron_renderer330 import create_light_probe_texture
+
+
+# (internal format, format, type) of each G-buffer texture
+GBUFFER_FORMATS = (
+        (GL_RGBA8, GL_RGBA, GL_UNSIGNED_BYTE), # unlit surface color
+        (GL_RGBA16F, GL_RGBA, GL_FLOAT), # normal in camera frame; w is 1 where an imposter was drawn
+        (GL_DEPTH_COMPONENT32F, GL_DEPTH_COMPONENT, GL_FLOAT), )
+
+
+class GBuffer(object):
+    "Framebuffer of surface color, normal and depth textures, the size of the viewport"
+    def __init__(self):
+        self.framebuffer = None
+        self.textures = None # color, normal, depth
+        self.size = (0, 0)
+        self.useLightRig = False # light_rig() instead of image based lighting
+        self.program = None
+        self.vao = None
+        self.light_probe = None
+        self._previous_framebuffer = 0
+        self._previous_viewport = None
+
+    def _createGL(self, width, height):
+        self._deleteTargetsGL()
+        self.framebuffer = glGenFramebuffers(1)
+        self.textures = glGenTextures(len(GBUFFER_FORMATS))
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        attachments = (GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1, GL_DEPTH_ATTACHMENT)
+        for texture, attachment, (internal, data_format, data_type) in zip(
+                self.textures, attachments, GBUFFER_FORMATS):
+            glBindTexture(GL_TEXTURE_2D, texture)
+            # Nearest sampling, so that the lighting pass never blends two surfaces
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            glTexImage2D(GL_TEXTURE_2D, 0, internal, width, height, 0, data_format, data_type, None)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, attachment, GL_TEXTURE_2D, texture, 0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glDrawBuffers(2, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1])
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, self._previous_framebuffer)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            self._deleteTargetsGL()
+            raise RuntimeError("G-buffer framebuffer incomplete: 0x%x" % status)
+        self.size = (width, height)
+
+    def beginGL(self):
+        '''
+        Bind and clear the G-buffer, resized to the current viewport, so
+        that following deferred draws land in it.
+        '''
+        self._previous_framebuffer = int(glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING))
+        self._previous_viewport = [int(v) for v in glGetIntegerv(GL_VIEWPORT)]
+        width, height = self._previous_viewport[2:4]
+        if self.framebuffer is None or self.size != (width, height):
+            self._createGL(width, height)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.framebuffer)
+        glViewport(0, 0, width, height)
+        glClearBufferfv(GL_COLOR, 0, numpy.zeros(4, dtype=numpy.float32))
+        glClearBufferfv(GL_COLOR, 1, numpy.zeros(4, dtype=numpy.float32))
+        glClearBufferfv(GL_DEPTH, 0, numpy.ones(1, dtype=numpy.float32))
+
+    def endGL(self):
+        "Restore the framebuffer and viewport that were bound before beginGL()"
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self._previous_framebuffer)
+        glViewport(*self._previous_viewport)
+
+    def resolveGL(self, projectionMatrix):
+        '''
+        Light every pixel covered by an imposter into the current framebuffer.
+
+        projectionMatrix is the one the imposters were drawn with, in OpenGL
+        column-major order, as returned by glGetFloatv(GL_PROJECTION_MATRIX).
+        '''
+        if self.program is None:
+            self.program = deferred_lighting_shader330()
+            self.vao = glGenVertexArrays(1)
+            self.light_probe = create_light_probe_texture()
+        glUseProgram(self.program)
+        projection = numpy.asarray(projectionMatrix, dtype=numpy.float64).reshape(4, 4)
+        # Arrays from OpenGL are transposed, and so is their inverse
+        glUniformMatrix4fv(glGetUniformLocation(self.program, "projectionInverse"), 1, GL_FALSE,
+                numpy.linalg.inv(projection).astype(numpy.float32))
+        glUniform1i(glGetUniformLocation(self.program, "useLightRig"), int(self.useLightRig))
+        samplers = ("colorTexture", "normalTexture", "depthTexture", "lightProbe")
+        textures = list(self.textures) + [self.light_probe]
+        for unit, (name, texture) in enumerate(zip(samplers, textures)):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glUniform1i(glGetUniformLocation(self.program, name), unit)
+        glBindVertexArray(self.vao)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        glBindVertexArray(0)
+        for unit in reversed(range(len(textures))):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+    def _deleteTargetsGL(self):
+        if self.framebuffer is not None:
+            glDeleteTextures(self.textures)
+            glDeleteFramebuffers(1, [self.framebuffer])
+            self.framebuffer = None
+            self.textures = None
+            self.size = (0, 0)
+
+    def deleteGL(self):
+        self._deleteTargetsGL()
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            glDeleteTextures([self.light_probe])
+            self.vao = self.light_probe = None
+        # The program is shared through the ShaderManager, so is not deleted here
+        self.program = None
@@ -0,0 +1,111 @@
+'''
+Front-to-back ordering of imposter primitives, for early depth rejection.
+
+Imposter fragment shaders write gl_FragDepth, so a hidden fragment is only
+rejected after its ray-cast, and drawing in file order shades layer after
+layer of a dense arbor. Drawn nearest first, most hidden fragments fail
+the depth test against surfaces already drawn instead, and with the
+conservative depth programs they can fail before the ray-cast.
+
+DepthSorter keys each primitive by the view depth of its nearest point,
+quantized into DEPTH_BINS bins, so that the sort is NumPy's stable radix
+sort of 16 bit keys, linear in the number of primitives. Each sort starts
+from the previous order, and the order is kept until the camera turns or
+moves far enough to matter, so a slowly moving camera rarely pays for a
+sort at all.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import math
+
+import numpy
+
+
+DEPTH_BINS = 1 << 16 # one uint16 sort key per primitive
+DEFAULT_ANGLE_TOLERANCE = 2.0 # degrees the view direction may turn before a new sort
+DEFAULT_MOVE_TOLERANCE = 0.02 # fraction of the scene size the eye may move before a new sort
+
+
+def view_frame(modelViewMatrix):
+    '''
+    (eye, direction) in model coordinates, from a 4x4 modelview matrix in
+    OpenGL column-major order, as returned by glGetFloatv(GL_MODELVIEW_MATRIX).
+    direction is the unit vector the camera looks along.
+    '''
+    modelView = numpy.asarray(modelViewMatrix, dtype=numpy.float64).reshape(4, 4)
+    # Arrays from OpenGL are transposed, so the upper left block is the
+    # transpose of the rotation, and row 3 holds the translation
+    rotation_t = modelView[0:3, 0:3]
+    direction = -rotation_t[:, 2]
+    scale = numpy.linalg.norm(direction)
+    eye = -numpy.dot(rotation_t, modelView[3, 0:3]) / (scale * scale)
+    return eye, direction / scale
+
+
+def view_depths(centers, modelViewMatrix):
+    "Distance of each of Nx3 centers in front of the eye, along the view direction"
+    modelView = numpy.asarray(modelViewMatrix, dtype=numpy.float64).reshape(4, 4)
+    return -(numpy.dot(centers, modelView[0:3, 2]) + modelView[3, 2])
+
+
+def depth_keys(depths, bins=DEPTH_BINS):
+    "Depths quantized into bins equal steps between their minimum and maximum, as uint16"
+    if len(depths) == 0:
+        return numpy.zeros(0, dtype=numpy.uint16)
+    lo = depths.min()
+    span = max(float(depths.max() - lo), 1e-30)
+    keys = (depths - lo) * ((bins - 1) / span)
+    return numpy.clip(keys, 0, bins - 1).astype(numpy.uint16)
+
+
+class DepthSorter(object):
+    "Front-to-back order of primitives, sorted again only when the view changes enough"
+    def __init__(self, centers, radii=None,
+            angle_tolerance=DEFAULT_ANGLE_TOLERANCE, move_tolerance=DEFAULT_MOVE_TOLERANCE):
+        '''
+        centers (Nx3) and radii (N) bound each primitive; a primitive is
+        keyed by the depth of the near side of its bounding sphere.
+        '''
+        self.centers = numpy.asarray(centers, dtype=numpy.float64).reshape(-1, 3)
+        if radii is None:
+            radii = numpy.zeros(len(self.centers))
+        self.radii = numpy.asarray(radii, dtype=numpy.float64)
+        self.order = numpy.arange(len(self.centers), dtype=numpy.uint32)
+        self.min_cosine = math.cos(math.radians(angle_tolerance))
+        size = 0.0
+        if len(self.centers) > 0:
+            size = numpy.linalg.norm(self.centers.max(axis=0) - self.centers.min(axis=0))
+        self.move_distance = move_tolerance * max(size, 1e-6)
+        self.sort_count = 0 # sorts so far, for benchmarks
+        self._eye = None
+        self._direction = None
+
+    def __len__(self):
+        return len(self.centers)
+
+    def viewChanged(self, modelViewMatrix):
+        "True if the view has turned or moved past the tolerances since the last sort"
+        if self._eye is None:
+            return True
+        eye, direction = view_frame(modelViewMatrix)
+        if numpy.dot(direction, self._direction) < self.min_cosine:
+            return True
+        return numpy.linalg.norm(eye - self._eye) > self.move_distance
+
+    def sort(self, modelViewMatrix):
+        "Sort front to back for this view, starting from the previous order"
+        self._eye, self._direction = view_frame(modelViewMatrix)
+        depths = view_depths(self.centers[self.order], modelViewMatrix) - self.radii[self.order]
+        # A stable sort of uint16 keys is a radix sort in NumPy. Ties keep
+        # their previous order, so the order changes little between views.
+        self.order = self.order[numpy.argsort(depth_keys(depths), kind='stable')]
+        self.sort_count += 1
+
+    def update(self, modelViewMatrix):
+        "Sort if the view has changed enough; returns True if the order may have changed"
+        if not self.viewChanged(modelViewMatrix):
+            return False
+        self.sort(modelViewMatrix)
+        return True
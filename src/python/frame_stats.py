@@ -0,0 +1,287 @@
+'''
+Frame time profiling: CPU timers, GPU timer queries and draw counts per pass.
+
+A FrameStats object brackets each frame with beginFrame() and endFrame(),
+and each render pass within it with measure(name):
+
+    stats.beginFrame()
+    with stats.measure("spheres"):
+        spheres.drawGL()
+    stats.count("spheres", primitives=len(spheres), vertices=...)
+    stats.endFrame()
+
+Each pass records CPU time, GPU time from a GL_TIME_ELAPSED query, and the
+number of triangles the GPU rasterized, from a GL_PRIMITIVES_GENERATED
+query. GPU time of the whole frame comes from GL_TIMESTAMP queries at its
+ends. Query results are read back only once the GPU has them, a frame or
+two later, so profiling never stalls the pipeline; finishGL() waits for
+the rest. summary() reduces the last frames to FPS and percentiles, for an
+on-screen overlay, a printed report, or a JSON dump.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import collections
+import contextlib
+import ctypes
+import json
+import time
+
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v as raw_glGetQueryObjectui64v
+import numpy
+
+
+DEFAULT_HISTORY = 240 # frames kept for the rolling summary
+PERCENTILES = (50, 90, 95, 99)
+
+
+def query_result(query):
+    "64-bit result of a finished query object"
+    # The PyOpenGL wrapper of glGetQueryObjectui64v has no array type for
+    # GL_UNSIGNED_INT64, so call the raw entry point with a ctypes result
+    result = ctypes.c_uint64(0)
+    raw_glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(result))
+    return int(result.value)
+
+
+def query_available(query):
+    "True once the result of a query object can be read without waiting"
+    return bool(glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE))
+
+
+def timer_queries_supported():
+    "True if the current context has GL_TIME_ELAPSED and GL_TIMESTAMP queries"
+    version = glGetString(GL_VERSION).split()[0].split(b".")
+    if (int(version[0]), int(version[1])) >= (3, 3):
+        return True
+    return b"GL_ARB_timer_query" in (glGetString(GL_EXTENSIONS) or b"").split()
+
+
+def _statistics(values):
+    "Mean, max and PERCENTILES of a sequence of numbers, or None if empty"
+    if len(values) == 0:
+        return None
+    values = numpy.asarray(values, dtype=numpy.float64)
+    result = {'mean': float(values.mean()), 'max': float(values.max())}
+    for percentile, value in zip(PERCENTILES, numpy.percentile(values, PERCENTILES)):
+        result['p%d' % percentile] = float(value)
+    return result
+
+
+class FrameStats(object):
+    "Per frame and per pass timings and counts, over a rolling window of recent frames"
+    def __init__(self, history=DEFAULT_HISTORY, gpu=True):
+        '''
+        history is the number of frames kept, or None to keep every frame.
+        With gpu=False, or if the context lacks timer queries, only CPU
+        times and caller supplied counts are recorded.
+        '''
+        self.frames = collections.deque(maxlen=history) # finished frame records, oldest first
+        self.gpu = gpu and timer_queries_supported()
+        self.frame_count = 0
+        self._frame = None # record of the frame being drawn
+        self._frame_start = None
+        self._previous_start = None
+        self._pending = [] # (record, [(key, query), ...]) of frames awaiting GPU results
+        self._queries = [] # (key, query) of the frame being drawn
+        # Finished query objects for reuse, by target; a query object keeps
+        # the target it was first used with
+        self._free_queries = collections.defaultdict(list)
+        self._query_targets = {}
+
+    def _query(self, target):
+        free = self._free_queries[target]
+        if len(free) == 0:
+            free.extend(int(query) for query in glGenQueries(16))
+            self._query_targets.update((query, target) for query in free)
+        return free.pop()
+
+    def _release(self, query):
+        self._free_queries[self._query_targets[query]].append(query)
+
+    def beginFrame(self):
+        "Start timing a frame, and collect GPU results of earlier frames that are ready"
+        now = time.time()
+        self._collect(wait=False)
+        self._frame = {'frame': self.frame_count, 'passes': collections.OrderedDict()}
+        if self._previous_start is not None:
+            # Wall time between frame starts includes buffer swaps and idle time
+            self._frame['interval_ms'] = 1000.0 * (now - self._previous_start)
+        self._previous_start = now
+        self._frame_start = now
+        if self.gpu:
+            query = self._query(GL_TIMESTAMP)
+            glQueryCounter(query, GL_TIMESTAMP)
+            self._queries.append((('frame', 'begin'), query))
+
+    def endFrame(self):
+        "Stop timing the current frame"
+        frame = self._frame
+        frame['cpu_ms'] = 1000.0 * (time.time() - self._frame_start)
+        if self.gpu:
+            query = self._query(GL_TIMESTAMP)
+            glQueryCounter(query, GL_TIMESTAMP)
+            self._queries.append((('frame', 'end'), query))
+            self._pending.append((frame, self._queries))
+            self._queries = []
+        else:
+            self.frames.append(frame)
+        self._frame = None
+        self.frame_count += 1
+
+    def _pass(self, name):
+        passes = self._frame['passes']
+        if name not in passes:
+            passes[name] = {'cpu_ms': 0.0}
+        return passes[name]
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        "Context manager timing one render pass of the current frame; passes must not nest"
+        if self._frame is None:
+            yield # outside of a frame, for example during a resize
+            return
+        record = self._pass(name)
+        if self.gpu:
+            timer = self._query(GL_TIME_ELAPSED)
+            primitives = self._query(GL_PRIMITIVES_GENERATED)
+            glBeginQuery(GL_TIME_ELAPSED, timer)
+            glBeginQuery(GL_PRIMITIVES_GENERATED, primitives)
+        start = time.time()
+        try:
+            yield
+        finally:
+            record['cpu_ms'] += 1000.0 * (time.time() - start)
+            if self.gpu:
+                glEndQuery(GL_PRIMITIVES_GENERATED)
+                glEndQuery(GL_TIME_ELAPSED)
+                self._queries.append(((name, 'gpu_ms'), timer))
+                self._queries.append(((name, 'triangles'), primitives))
+
+    def count(self, name, primitives=0, vertices=0):
+        "Add imposter primitives and vertices submitted by a pass of the current frame"
+        if self._frame is None:
+            return
+        record = self._pass(name)
+        record['primitives'] = record.get('primitives', 0) + int(primitives)
+        record['vertices'] = record.get('vertices', 0) + int(vertices)
+
+    def _collect(self, wait):
+        "Move frames whose GPU queries have finished into the history, oldest first"
+        while len(self._pending) > 0:
+            frame, queries = self._pending[0]
+            # The last query of a frame finishes last
+            if not wait and not query_available(queries[-1][1]):
+                break
+            self._pending.pop(0)
+            results = {}
+            for (name, field), query in queries:
+                value = query_result(query)
+                self._release(query)
+                if name == 'frame':
+                    results[field] = value
+                    continue
+                record = frame['passes'][name]
+                if field == 'gpu_ms':
+                    value = 1e-6 * value # nanoseconds
+                record[field] = record.get(field, 0) + value
+            frame['gpu_ms'] = 1e-6 * (results['end'] - results['begin'])
+            self.frames.append(frame)
+
+    def finishGL(self):
+        "Wait for the GPU results of every finished frame"
+        self._collect(wait=True)
+
+    def reset(self):
+        "Forget every frame so far, for example after warming up"
+        self.finishGL()
+        self.frames.clear()
+        self.frame_count = 0
+        self._previous_start = None
+
+    def deleteGL(self):
+        self.finishGL()
+        queries = list(self._query_targets)
+        if len(queries) > 0:
+            glDeleteQueries(len(queries), queries)
+        self._free_queries.clear()
+        self._query_targets = {}
+
+    def summary(self):
+        '''
+        Statistics of the frames in the history, as a dict of plain values.
+
+        fps is from the intervals between frame starts. Each timing and
+        count, for the frame and for each pass, is reduced to its mean, max
+        and PERCENTILES; a pass missing from some frames counts as zero there.
+        '''
+        frames = list(self.frames)
+        intervals = [frame['interval_ms'] for frame in frames if 'interval_ms' in frame]
+        result = collections.OrderedDict()
+        result['frames'] = len(frames)
+        result['fps'] = 1000.0 / numpy.mean(intervals) if len(intervals) > 0 else None
+        for field in ('interval_ms', 'cpu_ms', 'gpu_ms'):
+            result[field] = _statistics([frame[field] for frame in frames if field in frame])
+        names = []
+        for frame in frames:
+            names.extend(name for name in frame['passes'] if name not in names)
+        result['passes'] = collections.OrderedDict()
+        for name in names:
+            records = [frame['passes'].get(name, {}) for frame in frames]
+            fields = collections.OrderedDict()
+            for field in ('cpu_ms', 'gpu_ms', 'triangles', 'primitives', 'vertices'):
+                if any(field in record for record in records):
+                    fields[field] = _statistics([record.get(field, 0) for record in records])
+            result['passes'][name] = fields
+        return result
+
+    def overlayLines(self):
+        "A few short lines for an on-screen display of the rolling summary"
+        summary = self.summary()
+        if summary['frames'] == 0:
+            return ["collecting frame statistics..."]
+        def ms(statistics):
+            if statistics is None:
+                return "   -  "
+            return "%6.2f" % statistics['p50']
+        lines = ["%5.1f fps  frame p50 %.2f p95 %.2f ms" % (
+                summary['fps'] or 0.0,
+                (summary['interval_ms'] or summary['cpu_ms'])['p50'],
+                (summary['interval_ms'] or summary['cpu_ms'])['p95'])]
+        lines.append("%-10s %7s %7s %10s %10s" % ("pass", "cpu ms", "gpu ms", "triangles", "imposters"))
+        for name, fields in summary['passes'].items():
+            lines.append("%-10s %7s %7s %10d %10d" % (name, ms(fields.get('cpu_ms')), ms(fields.get('gpu_ms')),
+                    fields['triangles']['p50'] if 'triangles' in fields else 0,
+                    fields['primitives']['p50'] if 'primitives' in fields else 0))
+        return lines
+
+    def report(self):
+        "Multi-line text table of the summary, for the console"
+        summary = self.summary()
+        lines = ["%d frames, %.1f fps" % (summary['frames'], summary['fps'] or 0.0)]
+        columns = ["mean"] + ["p%d" % percentile for percentile in PERCENTILES] + ["max"]
+        lines.append("%-22s" % "" + "".join("%10s" % column for column in columns))
+        rows = [("frame " + field, summary[field]) for field in ('interval_ms', 'cpu_ms', 'gpu_ms')]
+        for name, fields in summary['passes'].items():
+            rows.extend(("%s %s" % (name, field), statistics) for field, statistics in fields.items())
+        for label, statistics in rows:
+            if statistics is not None:
+                lines.append("%-22s" % label + "".join(
+                        "%10.3f" % statistics[column] for column in columns))
+        return "\n".join(lines)
+
+    def toJson(self, include_frames=True):
+        "JSON text of the summary and, optionally, of every frame in the history"
+        data = collections.OrderedDict()
+        data['gpu_timing'] = self.gpu
+        data['summary'] = self.summary()
+        if include_frames:
+            data['frames'] = list(self.frames)
+        return json.dumps(data, indent=2)
+
+    def writeJson(self, file_name, include_frames=True):
+        with open(file_name, "w") as out:
+            out.write(self.toJson(include_frames))
+            out.write("\n")
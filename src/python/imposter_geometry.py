@@ -0,0 +1,365 @@
+'''
+Vectorized imposter geometry for whole neurons.
+
+These functions compute, for N primitives at once, the same quantities that
+the Sphere and ConeSegment classes in imposter_immediate.py compute
+one object at a time.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+
+from vecmath import dots, norms, normalized, crosses
+
+
+# Final parameters of each truncated cone, matching the ConeSegment attributes
+CONE_DTYPE = numpy.dtype([
+        ('center', numpy.float64, (3,)),
+        ('axis', numpy.float64, (3,)), # half of the vector from larger end to smaller end
+        ('length', numpy.float64),
+        ('taper', numpy.float64),
+        ('radius', numpy.float64), # radius at cone center
+        ('r1', numpy.float64), # radius at smaller end
+        ('r2', numpy.float64), ]) # radius at larger end
+
+
+def cone_parameters(center1, radius1, center2, radius2, out=None):
+    '''
+    Compute the cone segments that exactly join N pairs of spheres.
+
+    center1 and center2 are Nx3 arrays, radius1 and radius2 length-N arrays.
+    Returns a structured array of CONE_DTYPE. Just like ConeSegment, ends are
+    swapped so that r2 is always the larger radius. Pairs with coincident
+    centers, or with one sphere inside the other, yield non-finite values.
+    '''
+    cs1 = numpy.atleast_2d(numpy.asarray(center1, dtype=numpy.float64))
+    cs2 = numpy.atleast_2d(numpy.asarray(center2, dtype=numpy.float64))
+    rs1 = numpy.atleast_1d(numpy.asarray(radius1, dtype=numpy.float64))
+    rs2 = numpy.atleast_1d(numpy.asarray(radius2, dtype=numpy.float64))
+    # Swap so r2 is always the largest
+    swap = (rs2 < rs1)[:, None]
+    cs1, cs2 = numpy.where(swap, cs2, cs1), numpy.where(swap, cs1, cs2)
+    rs1, rs2 = numpy.minimum(rs1, rs2), numpy.maximum(rs1, rs2)
+    if out is None:
+        out = numpy.empty(len(rs1), dtype=CONE_DTYPE)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # Shift cone parts to fit radius offset
+        delta = cs1 - cs2
+        d = norms(delta) # distance between sphere centers
+        # half cone angle, to just touch each sphere
+        sinAlpha = (rs2 - rs1) / d
+        cosAlpha = numpy.sqrt(1.0 - sinAlpha*sinAlpha)
+        # Actual cone terminal radii might be smaller than sphere radii
+        r1 = cosAlpha * rs1
+        r2 = cosAlpha * rs2
+        # Cone termini c1, c2 might not lie at sphere centers; they are
+        # shifted by sinAlpha * rs1, sinAlpha * rs2 along aHat = delta / d.
+        # Both shifts are parallel to delta, so the axis (c1 - c2) / 2
+        # and the centroid (c1 + c2) / 2 are formed without explicit termini.
+        shift1 = sinAlpha * rs1 / d
+        shift2 = sinAlpha * rs2 / d
+        out['axis'] = delta * (0.5 * (1.0 + shift1 - shift2))[:, None]
+        out['center'] = 0.5 * (cs1 + cs2) + delta * (0.5 * (shift1 + shift2))[:, None]
+        # Final cone parameters
+        length = d * (1.0 + shift1 - shift2)
+        out['length'] = length
+        out['taper'] = (r2 - r1) / length
+    out['radius'] = (r1 + r2) / 2.0
+    out['r1'] = r1
+    out['r2'] = r2
+    return out
+
+
+def neuron_cone_parameters(neuron):
+    '''
+    Cone parameters for every parent/child edge of an SwcNeuron.
+
+    Returns (edges, cones), where edges is the Nx2 array of (child, parent)
+    row indices from neuron.edges(), and cones[i] joins the spheres of edges[i].
+    Neurons read from an swc_cache file already hold both arrays.
+    '''
+    if neuron.edge_cones is not None:
+        return neuron.edge_cones
+    edges = neuron.edges()
+    xyz = neuron.xyz
+    radius = neuron.radius
+    cones = cone_parameters(
+            xyz[edges[:, 1]], radius[edges[:, 1]],
+            xyz[edges[:, 0]], radius[edges[:, 0]])
+    return edges, cones
+
+
+def transform_cones(cones, center, scale):
+    "Cone parameters after translating by -center and then scaling uniformly by scale"
+    result = cones.copy()
+    result['center'] = (cones['center'] - center) * scale
+    result['axis'] *= scale
+    for field in ('length', 'radius', 'r1', 'r2'):
+        result[field] *= scale
+    return result
+
+
+# Vertex layout of the GLSL 1.20 imposter shaders, as emitted by the
+# generateBoundingGeometryImmediate() methods:
+#   gl_Vertex: primitive center and radius
+#   gl_Normal: offset of this hull vertex from the center
+#   gl_MultiTexCoord0: cone half axis and taper (unused by spheres)
+IMPOSTER_VERTEX_DTYPE = numpy.dtype([
+        ('vertex', numpy.float32, (4,)),
+        ('normal', numpy.float32, (3,)),
+        ('texcoord', numpy.float32, (4,)), ])
+
+# Bounding box corners of one imposter primitive, as two triangle strips
+# of eight vertices each, in the order used by generateBoundingGeometryImmediate()
+HULL_STRIP_LENGTH = 8
+HULL_STRIP_CORNERS = numpy.array([
+        # bottom front top
+        [-1, -1, -1], [1, -1, -1], [-1, -1, 1], [1, -1, 1], # bottom
+        [-1, 1, 1], [1, 1, 1], # front
+        [-1, 1, -1], [1, 1, -1], # top
+        # left back right
+        [-1, -1, 1], [-1, 1, 1], [-1, -1, -1], [-1, 1, -1], # left
+        [1, -1, -1], [1, 1, -1], # back
+        [1, -1, 1], [1, 1, 1], # right
+        ], dtype=numpy.float64)
+HULL_VERTEX_COUNT = len(HULL_STRIP_CORNERS)
+
+# The same hull as one strip, for instanced drawing: the two strips above
+# joined by two degenerate triangles, which keep the winding of the second.
+UNIT_HULL_STRIP = numpy.concatenate([
+        HULL_STRIP_CORNERS[0:HULL_STRIP_LENGTH],
+        HULL_STRIP_CORNERS[HULL_STRIP_LENGTH - 1:HULL_STRIP_LENGTH + 1],
+        HULL_STRIP_CORNERS[HULL_STRIP_LENGTH:], ]).astype(numpy.float32)
+
+# Per instance attributes of SpheresInstVrtx120.glsl and ConesInstVrtx120.glsl,
+# which replace HULL_VERTEX_COUNT IMPOSTER_VERTEX_DTYPE vertices per primitive
+SPHERE_INSTANCE_DTYPE = numpy.dtype([
+        ('center', numpy.float32, (3,)),
+        ('radius', numpy.float32),
+        ('color', numpy.uint8, (4,)), ])
+CONE_INSTANCE_DTYPE = numpy.dtype([
+        ('center', numpy.float32, (3,)),
+        ('radius', numpy.float32), # at the cone center
+        ('axis', numpy.float32, (3,)), # half axis, toward the smaller end
+        ('taper', numpy.float32),
+        ('color', numpy.uint8, (4,)), ])
+
+# The same attributes in 12 and 24 bytes instead of 20 and 36: centers as
+# 16 bit integers, which the shaders map back to model coordinates with the
+# origin and scale of quantize_positions(), cone axes as 16 bit unit
+# directions and half float lengths, and radii and tapers as half floats
+COMPACT_SPHERE_INSTANCE_DTYPE = numpy.dtype([
+        ('center', numpy.int16, (3,)),
+        ('radius', numpy.float16),
+        ('color', numpy.uint8, (4,)), ])
+COMPACT_CONE_INSTANCE_DTYPE = numpy.dtype([
+        ('center', numpy.int16, (3,)),
+        ('radius', numpy.float16),
+        ('axis', numpy.int16, (3,)), # unit direction of the half axis
+        ('axis_length', numpy.float16), # length of the half axis
+        ('taper', numpy.float16),
+        ('padding', numpy.uint8, (2,)), # keeps color, and the stride, on 4 byte boundaries
+        ('color', numpy.uint8, (4,)), ])
+QUANTIZED_MAX = 32767 # stored value of a coordinate at origin + scale
+
+
+def _instance_colors(count, color):
+    "Nx4 unsigned bytes from one RGB(A) color, or one per instance, with components in [0, 1]"
+    if color is None:
+        color = (1.0, 1.0, 1.0, 1.0)
+    color = numpy.asarray(color, dtype=numpy.float64)
+    if color.shape[-1] == 3:
+        color = numpy.concatenate([color, numpy.ones(color.shape[:-1] + (1,))], axis=-1)
+    return numpy.broadcast_to(numpy.clip(numpy.round(255.0 * color), 0, 255), (count, 4))
+
+
+def sphere_instances(center, radius, color=None):
+    "SPHERE_INSTANCE_DTYPE attributes for N sphere imposters"
+    center = numpy.asarray(center)
+    radius = numpy.asarray(radius)
+    result = numpy.empty(len(radius), dtype=SPHERE_INSTANCE_DTYPE)
+    result['center'] = center
+    result['radius'] = radius
+    result['color'] = _instance_colors(len(radius), color)
+    return result
+
+
+def cone_instances(cones, color=None):
+    "CONE_INSTANCE_DTYPE attributes for N cone imposters"
+    result = numpy.empty(len(cones), dtype=CONE_INSTANCE_DTYPE)
+    for field in ('center', 'radius', 'axis', 'taper'):
+        result[field] = cones[field]
+    result['color'] = _instance_colors(len(cones), color)
+    return result
+
+
+def position_quantization(lo, hi):
+    '''
+    (origin, scale) of quantize_positions() for positions between the
+    corners lo and hi, as 3 element arrays. Each axis is scaled separately,
+    so that a long thin neuron keeps full precision across its width.
+    '''
+    lo = numpy.asarray(lo, dtype=numpy.float64)
+    hi = numpy.asarray(hi, dtype=numpy.float64)
+    origin = 0.5 * (lo + hi)
+    # Flat boxes still need a nonzero scale to divide by
+    scale = numpy.maximum(0.5 * (hi - lo), 1e-6 * max(1.0, numpy.abs(origin).max()))
+    return origin, scale
+
+
+def quantize_positions(xyz, origin, scale):
+    '''
+    Nx3 int16 from positions, with origin at 0 and origin + scale at
+    QUANTIZED_MAX. Steps are scale / QUANTIZED_MAX apart, about 15 nanometers
+    for a neuron one millimeter across.
+    '''
+    quantized = numpy.round((numpy.asarray(xyz, dtype=numpy.float64) - origin)
+            * (QUANTIZED_MAX / scale))
+    # Non-finite positions, as of degenerate cones, are stored at the origin
+    quantized[~numpy.isfinite(quantized)] = 0
+    return numpy.clip(quantized, -QUANTIZED_MAX, QUANTIZED_MAX).astype(numpy.int16)
+
+
+def dequantize_positions(quantized, origin, scale):
+    "Positions from quantize_positions(), as the instanced shaders decode them"
+    return quantized * (scale / QUANTIZED_MAX) + origin
+
+
+def compact_sphere_instances(center, radius, color=None):
+    '''
+    COMPACT_SPHERE_INSTANCE_DTYPE attributes for N sphere imposters.
+
+    Returns (instances, origin, scale), where origin and scale are the
+    positionOrigin and positionScale uniforms of SpheresInstVrtx120.glsl.
+    '''
+    center = numpy.asarray(center, dtype=numpy.float64).reshape(-1, 3)
+    radius = numpy.asarray(radius)
+    if len(center) > 0:
+        origin, scale = position_quantization(center.min(axis=0), center.max(axis=0))
+    else:
+        origin, scale = numpy.zeros(3), numpy.ones(3)
+    result = numpy.empty(len(radius), dtype=COMPACT_SPHERE_INSTANCE_DTYPE)
+    result['center'] = quantize_positions(center, origin, scale)
+    result['radius'] = radius
+    result['color'] = _instance_colors(len(radius), color)
+    return result, origin, scale
+
+
+def compact_cone_instances(cones, color=None):
+    '''
+    COMPACT_CONE_INSTANCE_DTYPE attributes for N cone imposters.
+
+    Returns (instances, origin, scale), as compact_sphere_instances() does.
+    Half axes are stored as a unit direction and a length rather than in
+    the scene's quantization box, so that short cones in a large scene keep
+    their orientation to about 1e-4 radians.
+    '''
+    axis = numpy.asarray(cones['axis'], dtype=numpy.float64)
+    # Degenerate cones have non-finite parameters, and are drawn by neither format
+    finite = numpy.isfinite(cones['center']).all(axis=1) & numpy.isfinite(axis).all(axis=1)
+    if finite.any():
+        origin, scale = position_quantization(cones['center'][finite].min(axis=0),
+                cones['center'][finite].max(axis=0))
+    else:
+        origin, scale = numpy.zeros(3), numpy.ones(3)
+    length = norms(axis)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        direction = axis / length[:, None]
+    result = numpy.zeros(len(cones), dtype=COMPACT_CONE_INSTANCE_DTYPE)
+    result['center'] = quantize_positions(cones['center'], origin, scale)
+    result['radius'] = cones['radius']
+    result['axis'] = quantize_positions(direction, 0.0, 1.0)
+    result['axis_length'] = length
+    result['taper'] = cones['taper']
+    result['color'] = _instance_colors(len(cones), color)
+    return result, origin, scale
+
+
+def cone_frames(cones):
+    '''
+    Principal axes of each cone bounding box, as three Nx3 arrays (xHat, yHat, zHat).
+
+    xHat points along the cone axis, toward the smaller end.
+    '''
+    axis = cones['axis']
+    xHat = normalized(axis)
+    # To avoid numerical problems, try two different ways to create first orthogonal vector
+    yHat1 = crosses(xHat, [1.0, 0.0, 0.0])
+    yHat2 = crosses(xHat, [0.0, 0.0, 1.0])
+    use1 = dots(yHat1, yHat1) >= dots(yHat2, yHat2)
+    yHat = numpy.where(use1[:, None], yHat1, yHat2)
+    yHat /= norms(yHat)[:, None]
+    zHat = crosses(xHat, yHat) # Third and final axis is simple
+    return xHat, yHat, zHat
+
+
+def sphere_hull_offsets(radius):
+    "Offsets of all HULL_VERTEX_COUNT hull vertices from each sphere center, as an NxVx3 array"
+    radius = numpy.asarray(radius, dtype=numpy.float64)
+    return radius[:, None, None] * HULL_STRIP_CORNERS[None, :, :]
+
+
+def cone_hull_offsets(cones):
+    "Offsets of all HULL_VERTEX_COUNT hull vertices from each cone center, as an NxVx3 array"
+    xHat, yHat, zHat = cone_frames(cones)
+    d = norms(cones['axis'])
+    cx = HULL_STRIP_CORNERS[:, 0]
+    cy = HULL_STRIP_CORNERS[:, 1]
+    cz = HULL_STRIP_CORNERS[:, 2]
+    # X axis points toward smaller end of cone
+    r = numpy.where(cx[None, :] > 0, cones['r1'][:, None], cones['r2'][:, None])
+    return ( (cx[None, :] * d[:, None])[:, :, None] * xHat[:, None, :]
+            + (cy[None, :] * r)[:, :, None] * yHat[:, None, :]
+            + (cz[None, :] * r)[:, :, None] * zHat[:, None, :] )
+
+
+def sphere_hull_vertices(center, radius):
+    "Packed IMPOSTER_VERTEX_DTYPE triangle strip vertices for N sphere imposters"
+    center = numpy.asarray(center)
+    radius = numpy.asarray(radius)
+    result = numpy.zeros((len(radius), HULL_VERTEX_COUNT), dtype=IMPOSTER_VERTEX_DTYPE)
+    result['vertex'][:, :, 0:3] = center[:, None, :]
+    result['vertex'][:, :, 3] = radius[:, None]
+    result['normal'] = sphere_hull_offsets(radius)
+    return result.reshape(-1)
+
+
+def cone_hull_vertices(cones):
+    "Packed IMPOSTER_VERTEX_DTYPE triangle strip vertices for N cone imposters"
+    result = numpy.empty((len(cones), HULL_VERTEX_COUNT), dtype=IMPOSTER_VERTEX_DTYPE)
+    result['vertex'][:, :, 0:3] = cones['center'][:, None, :]
+    result['vertex'][:, :, 3] = cones['radius'][:, None]
+    result['normal'] = cone_hull_offsets(cones)
+    result['texcoord'][:, :, 0:3] = cones['axis'][:, None, :]
+    result['texcoord'][:, :, 3] = cones['taper'][:, None]
+    return result.reshape(-1)
+
+
+def sphere_bounds(center, radius):
+    "Axis aligned (lo, hi) corners of each sphere imposter hull, as two Nx3 arrays"
+    center = numpy.asarray(center, dtype=numpy.float64)
+    radius = numpy.asarray(radius, dtype=numpy.float64)[:, None]
+    return center - radius, center + radius
+
+
+def cone_bounds(cones):
+    '''
+    Axis aligned (lo, hi) corners of each cone imposter hull, as two Nx3 arrays.
+
+    Equivalent to the extremes of cone_hull_offsets(), without forming all
+    HULL_VERTEX_COUNT corners: each end of the oriented hull box is a square
+    of half width r, whose axis aligned half extent is r * (|yHat| + |zHat|).
+    '''
+    xHat, yHat, zHat = cone_frames(cones)
+    d = norms(cones['axis'])[:, None]
+    spread = numpy.abs(yHat) + numpy.abs(zHat)
+    center = cones['center']
+    small_end = center + d * xHat # X axis points toward smaller end of cone
+    large_end = center - d * xHat
+    small = spread * cones['r1'][:, None]
+    large = spread * cones['r2'][:, None]
+    lo = numpy.minimum(small_end - small, large_end - large)
+    hi = numpy.maximum(small_end + small, large_end + large)
+    return lo, hi
@@ -0,0 +1,169 @@
+'''
+Spheres and cone segments as Python objects, drawn in immediate mode.
+
+Each object computes its own imposter parameters with Vec3 arithmetic, and
+generateBoundingGeometryImmediate() sends its bounding hull to GL one
+glVertex call at a time, for the GLSL 1.20 sphere and cone shaders. This
+is the original per object path of the viewer; imposter_geometry computes
+the same values for whole neurons at once.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import math
+
+from OpenGL.GL import *
+
+from vecmath import Vec3
+
+
+class ConeSegment():
+    # Cone segment that exactly joins two spheres
+    def __init__(self, sphere1, sphere2):
+        self.sphere1 = sphere1
+        self.sphere2 = sphere2
+        # Copies, because the vectors are updated in place below
+        cs1 = Vec3(sphere1.center)
+        cs2 = Vec3(sphere2.center)
+        rs1 = sphere1.radius
+        rs2 = sphere2.radius
+        # Swap so r2 is always the largest
+        if rs2 < rs1:
+            rs1, rs2 = rs2, rs1
+            cs1, cs2 = cs2, cs1
+        # Shift cone parts to fit radius offset
+        aHat = cs1 - cs2
+        d = aHat.norm() # distance between sphere centers
+        # half cone angle, to just touch each sphere
+        sinAlpha = (rs2 - rs1) / d;
+        cosAlpha = math.sqrt(1 - sinAlpha*sinAlpha)
+        # Actual cone terminal radii might be smaller than sphere radii
+        r1 = cosAlpha * rs1
+        r2 = cosAlpha * rs2
+        # Cone termini might not lie at sphere centers
+        aHat /= d
+        # Cone termini
+        c1 = cs1.addScaled(aHat, sinAlpha * rs1)
+        c2 = cs2.addScaled(aHat, sinAlpha * rs2)
+        # Final cone parameters
+        self.axis = c1 - c2
+        self.axis /= 2.0
+        self.length = self.axis.norm() * 2.0
+        self.center = c1
+        self.center += c2
+        self.center /= 2.0
+        self.taper = (r2 - r1) / self.length
+        self.radius = (r1 + r2) / 2.0
+        self.r1 = r1
+        self.r2 = r2
+
+    def generateBoundingGeometryImmediate(self):
+        "This method should be developed into a host imposter geometry example"
+        # TODO - correct this shape for cone
+        
+        # Compute principal axes of bounding geometry
+        d = self.axis.norm()
+        xHat = self.axis / d # X along cone axis
+        # Y along any orthogonal axis
+        # To avoid numerical problems, try two different ways to create first orthogonal vector
+        yHat1 = xHat.cross([1.0, 0.0, 0.0])
+        yHat2 = xHat.cross([0.0, 0.0, 1.0])
+        if yHat1.normSquared() >= yHat2.normSquared():
+            yHat = yHat1
+        else:
+            yHat = yHat2
+        yHat /= yHat.norm()
+        zHat = xHat.cross(yHat) # Third and final axis is simple
+        p = Vec3() # hull corner offset, reused for every corner
+        
+        # Draw bounding box geometry, three faces at a time
+        # Bottom front top
+        x = self.center[0]
+        y = self.center[1]
+        z = self.center[2]
+        glBegin(GL_TRIANGLE_STRIP)
+        for corner in [
+                    [-1, -1, -1], [1, -1, -1], [-1, -1, 1], [1, -1, 1], # bottom 
+                    [-1, 1, 1], [1, 1, 1], # front
+                    [-1, 1, -1], [1, 1, -1], # top
+                     ]:
+            # Encode imposter geometry offset from sphere center into normal attribute
+            # X axis points toward smaller end of cone
+            if corner[0] > 0:
+                r = self.r1 # smaller end
+            else:
+                r = self.r2 # larger end
+            p.set(0.0, 0.0, 0.0)
+            p.addScaled(xHat, corner[0] * d)
+            p.addScaled(yHat, corner[1] * r)
+            p.addScaled(zHat, corner[2] * r)
+            glNormal3f(p[0], p[1], p[2])
+            # Encode additional parameters, cone axis and taper, in texture coordinate,
+            # before glVertex4f, which takes the current texture coordinate
+            glTexCoord4f(self.axis[0], self.axis[1], self.axis[2], self.taper)
+            # Position attribute always contains cone centroid and central radius
+            glVertex4f(x, y, z, self.radius)
+        glEnd()
+        # left back right
+        glBegin(GL_TRIANGLE_STRIP)
+        for corner in [
+                    [-1, -1, 1], [-1, 1, 1], [-1, -1, -1], [-1, 1, -1], # left 
+                    [1, -1, -1], [1, 1, -1], # back 
+                    [1, -1, 1], [1, 1, 1] # right,
+                     ]:
+            # Encode imposter geometry offset from sphere center into normal attribute
+            # X axis points toward smaller end of cone
+            if corner[0] > 0:
+                r = self.r1 # smaller end
+            else:
+                r = self.r2 # larger end
+            p.set(0.0, 0.0, 0.0)
+            p.addScaled(xHat, corner[0] * d)
+            p.addScaled(yHat, corner[1] * r)
+            p.addScaled(zHat, corner[2] * r)
+            # Encode additional parameters, cone axis and taper, in texture coordinate
+            glTexCoord4f(self.axis[0], self.axis[1], self.axis[2], self.taper)
+            # Encode geometry offset from cone centroid in normal vector
+            glNormal3f(p[0], p[1], p[2])
+            # Position attribute always contains cone centroid and central radius
+            glVertex4f(x, y, z, self.radius)        
+        glEnd()
+
+
+class Sphere():
+    "Class representing a sphere to be rendered"
+    def __init__(self, center, radius):
+        self.center = center
+        self.radius = radius
+
+    def generateBoundingGeometryImmediate(self):
+        "This method should be developed into a host imposter geometry example"
+        # Draw bounding cube geometry, three faces at a time
+        # Bottom front top
+        x = self.center[0]
+        y = self.center[1]
+        z = self.center[2]
+        glBegin(GL_TRIANGLE_STRIP)
+        for corner in [
+                    [-1, -1, -1], [1, -1, -1], [-1, -1, 1], [1, -1, 1], # bottom 
+                    [-1, 1, 1], [1, 1, 1], # front
+                    [-1, 1, -1], [1, 1, -1], # top
+                     ]:
+            # Encode imposter geometry offset from sphere center into normal attribute
+            glNormal3f(corner[0]*self.radius, corner[1]*self.radius, corner[2]*self.radius)
+            # Position attribute always contains sphere center and radius
+            glVertex4f(x, y, z, self.radius)        
+        glEnd()
+        # left back right
+        glBegin(GL_TRIANGLE_STRIP)
+        for corner in [
+                    [-1, -1, 1], [-1, 1, 1], [-1, -1, -1], [-1, 1, -1], # left 
+                    [1, -1, -1], [1, 1, -1], # back 
+                    [1, -1, 1], [1, 1, 1] # right,
+                     ]:
+            # Encode imposter geometry offset from sphere center into normal attribute
+            glNormal3f(corner[0]*self.radius, corner[1]*self.radius, corner[2]*self.radius)
+            # Position attribute always contains sphere center and radius
+            glVertex4f(x, y, z, self.radius)        
+        glEnd()
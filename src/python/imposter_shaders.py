@@ -0,0 +1,177 @@
+'''
+Shader programs for the imposter renderers.
+
+All programs are built through one shared ShaderManager, so each GLSL file
+is read once, each shared function file is compiled once per stage, and
+linked programs are reused from the on-disk binary cache when possible.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+from OpenGL.GL import *
+
+from shader_manager import ShaderManager, GLSL_PATH, insert_defines
+
+
+_shader_manager = None
+
+
+def shader_manager():
+    "The ShaderManager for the current OpenGL context"
+    global _shader_manager
+    if _shader_manager is None:
+        _shader_manager = ShaderManager()
+    return _shader_manager
+
+
+def read_glsl(file_name):
+    "Contents of one shader source file from the glsl directory"
+    return shader_manager().source(file_name)
+
+
+def imposter_program120(vertex_file, fragment_file):
+    "Link an imposter shader program, with imposter_fns120.glsl in both stages"
+    return shader_manager().programFromFiles([
+            ("imposter_fns120.glsl", GL_VERTEX_SHADER),
+            (vertex_file, GL_VERTEX_SHADER),
+            ("imposter_fns120.glsl", GL_FRAGMENT_SHADER),
+            (fragment_file, GL_FRAGMENT_SHADER), ])
+
+
+def sphere_shader120():
+    "Sphere imposter program, consuming the IMPOSTER_VERTEX_DTYPE attribute layout"
+    return imposter_program120("SpheresVrtx120.glsl", "SpheresFrag120.glsl")
+
+
+def cone_shader120():
+    "Cone imposter program, consuming the IMPOSTER_VERTEX_DTYPE attribute layout"
+    return imposter_program120("ConesVrtx120.glsl", "ConesFrag120.glsl")
+
+
+def sphere_instanced_shader120():
+    "Sphere imposter program, drawn as instances of UNIT_HULL_STRIP with SPHERE_INSTANCE_DTYPE attributes"
+    return imposter_program120("SpheresInstVrtx120.glsl", "SpheresFrag120.glsl")
+
+
+def cone_instanced_shader120():
+    "Cone imposter program, drawn as instances of UNIT_HULL_STRIP with CONE_INSTANCE_DTYPE attributes"
+    return imposter_program120("ConesInstVrtx120.glsl", "ConesFrag120.glsl")
+
+
+def imposter_program330(vertex_file, geometry_file, fragment_file, defines=None):
+    '''
+    Link a geometry-shader imposter program.
+
+    node_color330.glsl is added to the vertex stage, and imposter_fns330.glsl
+    to the later stages.
+    '''
+    manager = shader_manager()
+    def main(file_name):
+        # Defines go only into the main files, so shared files are compiled once
+        return insert_defines(manager.source(file_name), defines)
+    fns = manager.source("imposter_fns330.glsl")
+    return manager.program([
+            (manager.source("node_color330.glsl"), GL_VERTEX_SHADER),
+            (main(vertex_file), GL_VERTEX_SHADER),
+            (fns, GL_GEOMETRY_SHADER),
+            (main(geometry_file), GL_GEOMETRY_SHADER),
+            (fns, GL_FRAGMENT_SHADER),
+            (main(fragment_file), GL_FRAGMENT_SHADER), ])
+
+
+# Values of HULL_STRATEGY in SpheresGeom330.glsl
+HULL_STRATEGIES = {
+        "near": "NEAR_HULL", # 10 vertices, in front of the sphere
+        "far": "FAR_HULL", # 10 vertices, behind the sphere
+        "mid": "MID_HULL", } # 6 vertices, intersecting the sphere
+
+
+def conservative_depth_supported():
+    "True if the current context can compile the conservative_depth programs"
+    version = glGetString(GL_VERSION).split()[0].split(b".")
+    if (int(version[0]), int(version[1])) >= (4, 2):
+        return True
+    return b"GL_ARB_conservative_depth" in (glGetString(GL_EXTENSIONS) or b"").split()
+
+
+def _mode_defines(conservative_depth, deferred):
+    '''
+    #defines of the 330 sphere and cone programs. CONSERVATIVE_DEPTH selects
+    a hull in front of the surface and the depth_greater layout of
+    gl_FragDepth; DEFERRED writes G-buffer outputs instead of lit colors.
+    '''
+    defines = {}
+    if conservative_depth:
+        defines["CONSERVATIVE_DEPTH"] = 1
+    if deferred:
+        defines["DEFERRED"] = 1
+    return defines
+
+
+def sphere_shader330(hull_strategy="far", conservative_depth=False, deferred=False):
+    '''
+    Sphere imposter program, drawn from GL_POINTS of position and radius.
+
+    With conservative_depth, hidden fragments can fail the depth test before
+    the ray-cast, and hull_strategy is ignored in favor of the near hull.
+    With deferred, the program draws into a deferred_shading.GBuffer.
+    '''
+    defines = {"HULL_STRATEGY": HULL_STRATEGIES[hull_strategy]}
+    defines.update(_mode_defines(conservative_depth, deferred))
+    return imposter_program330("SpheresVrtx330.glsl", "SpheresGeom330.glsl", "SpheresFrag330.glsl",
+            defines)
+
+
+def cone_shader330(conservative_depth=False, deferred=False):
+    "Cone imposter program, drawn from GL_LINES of position and radius; see sphere_shader330()"
+    return imposter_program330("ConesVrtx330.glsl", "ConesGeom330.glsl", "ConesFrag330.glsl",
+            _mode_defines(conservative_depth, deferred))
+
+
+def pulled_program330(vertex_file, fragment_file, defines=None):
+    '''
+    Link a vertex-pulling imposter program, without a geometry shader.
+
+    node_color330.glsl and imposter_fns330.glsl are added to the vertex
+    stage, and imposter_fns330.glsl to the fragment stage.
+    '''
+    manager = shader_manager()
+    fns = manager.source("imposter_fns330.glsl")
+    return manager.program([
+            (manager.source("node_color330.glsl"), GL_VERTEX_SHADER),
+            (fns, GL_VERTEX_SHADER),
+            (insert_defines(manager.source(vertex_file), defines), GL_VERTEX_SHADER),
+            (fns, GL_FRAGMENT_SHADER),
+            (insert_defines(manager.source(fragment_file), defines), GL_FRAGMENT_SHADER), ])
+
+
+# Triangle strip vertices per sphere of SpheresPullVrtx330.glsl, by hull strategy
+SPHERE_PULL_STRIP_LENGTHS = {"near": 11, "far": 11, "mid": 6}
+CONE_PULL_STRIP_LENGTH = 12 # triangle strip vertices per cone of ConesPullVrtx330.glsl
+
+
+def sphere_pull_shader330(hull_strategy="far", conservative_depth=False, deferred=False):
+    '''
+    Sphere imposter program that pulls nodes from buffer textures, drawn
+    as one instance of SPHERE_PULL_STRIP_LENGTHS[hull_strategy] triangle
+    strip vertices per sphere; options as in sphere_shader330().
+    '''
+    defines = {"HULL_STRATEGY": HULL_STRATEGIES[hull_strategy]}
+    defines.update(_mode_defines(conservative_depth, deferred))
+    return pulled_program330("SpheresPullVrtx330.glsl", "SpheresFrag330.glsl", defines)
+
+
+def cone_pull_shader330(conservative_depth=False, deferred=False):
+    "Cone imposter program that pulls precomputed cones from buffer textures; see sphere_pull_shader330()"
+    return pulled_program330("ConesPullVrtx330.glsl", "ConesFrag330.glsl",
+            _mode_defines(conservative_depth, deferred))
+
+
+def deferred_lighting_shader330():
+    "Full screen lighting pass over a deferred_shading.GBuffer, drawn as one triangle"
+    manager = shader_manager()
+    return manager.program([
+            (manager.source("DeferredVrtx330.glsl"), GL_VERTEX_SHADER),
+            (manager.source("imposter_fns330.glsl"), GL_FRAGMENT_SHADER),
+            (manager.source("DeferredFrag330.glsl"), GL_FRAGMENT_SHADER), ])
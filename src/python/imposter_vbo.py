@@ -0,0 +1,474 @@
+'''
+Imposter renderers that keep all primitive attributes in vertex buffer objects.
+
+Each set of spheres or cones is packed once into a single buffer of
+IMPOSTER_VERTEX_DTYPE vertices, in the same layout that
+generateBoundingGeometryImmediate() emits one call at a time, so the
+GLSL 1.20 sphere and cone shaders work unchanged. Each set is then drawn
+with one glMultiDrawArrays call per frame.
+
+Sets created with cull=True also build a BoundingVolumeHierarchy, store
+their primitives in its leaf order, and each frame draw only the strips of
+leaves that intersect the view frustum of the current fixed-function
+matrices.
+
+GrowingVboSet accepts more primitives while it is being drawn, as neurons
+finish loading, by doubling its buffer on the GPU when it fills up.
+
+SphereInstanceSet and ConeInstanceSet instead draw every primitive as an
+instance of one shared unit hull strip, with glDrawArraysInstanced, so that
+each primitive needs only its center, radius, axis and color rather than
+HULL_VERTEX_COUNT full vertices. With compact=True, they store those in
+the COMPACT_*_INSTANCE_DTYPE formats, of 16 bit integer positions and half
+float radii, which the same shaders decode.
+
+LodVboSet holds every level of a NeuronLod in one sphere set and one cone
+set, and draws the ranges of the level chosen for each chain this frame.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import ctypes
+
+from OpenGL.GL import *
+import numpy
+
+from imposter_geometry import IMPOSTER_VERTEX_DTYPE, HULL_STRIP_LENGTH, HULL_VERTEX_COUNT
+from imposter_geometry import sphere_hull_vertices, cone_hull_vertices
+from imposter_geometry import sphere_bounds, cone_bounds, cone_parameters
+from imposter_geometry import UNIT_HULL_STRIP, sphere_instances, cone_instances
+from imposter_geometry import compact_sphere_instances, compact_cone_instances
+from spatial_index import BoundingVolumeHierarchy, frustum_planes, expand_ranges
+
+
+class ImposterVboSet(object):
+    "Imposter hull vertices for many primitives, uploaded once and drawn in one call"
+    def __init__(self, vertices, bvh=None):
+        "If bvh is given, vertices must be in its leaf order"
+        assert vertices.dtype == IMPOSTER_VERTEX_DTYPE
+        self.vertices = vertices
+        self.vbo = None
+        self.bvh = bvh
+        self.culling = bvh is not None
+        self.drawn_count = 0 # primitives submitted by the last drawGL()
+        strip_count = len(vertices) // HULL_STRIP_LENGTH
+        # Two triangle strips per primitive, as in generateBoundingGeometryImmediate()
+        self.firsts = numpy.arange(strip_count, dtype=numpy.int32) * HULL_STRIP_LENGTH
+        self.counts = numpy.full(strip_count, HULL_STRIP_LENGTH, dtype=numpy.int32)
+
+    def __len__(self):
+        "Number of imposter primitives"
+        return len(self.vertices) // HULL_VERTEX_COUNT
+
+    def uploadGL(self):
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def updateGL(self, starts, stops):
+        "Upload the current vertices of primitives in half open ranges, with glBufferSubData"
+        if self.vbo is None:
+            self.uploadGL()
+            return
+        stride = IMPOSTER_VERTEX_DTYPE.itemsize * HULL_VERTEX_COUNT
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for start, stop in zip(starts, stops):
+            data = self.vertices[start * HULL_VERTEX_COUNT:stop * HULL_VERTEX_COUNT]
+            glBufferSubData(GL_ARRAY_BUFFER, int(start) * stride, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def bindGL(self):
+        "Point the fixed-function vertex, normal and texture coordinate arrays into the buffer"
+        if self.vbo is None:
+            self.uploadGL()
+        stride = IMPOSTER_VERTEX_DTYPE.itemsize
+        fields = IMPOSTER_VERTEX_DTYPE.fields
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(4, GL_FLOAT, stride, ctypes.c_void_p(fields['vertex'][1]))
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, stride, ctypes.c_void_p(fields['normal'][1]))
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glTexCoordPointer(4, GL_FLOAT, stride, ctypes.c_void_p(fields['texcoord'][1]))
+
+    def unbindGL(self):
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def rangeStrips(self, starts, stops):
+        "(firsts, counts) of the strips of the primitives in half open ranges"
+        strips_per_primitive = HULL_VERTEX_COUNT // HULL_STRIP_LENGTH
+        strips = expand_ranges(starts * strips_per_primitive, stops * strips_per_primitive)
+        return self.firsts[strips], self.counts[strips]
+
+    def visibleStrips(self):
+        "(firsts, counts) of the strips of primitives in leaves inside the current view frustum"
+        planes = frustum_planes(glGetFloatv(GL_MODELVIEW_MATRIX), glGetFloatv(GL_PROJECTION_MATRIX))
+        return self.rangeStrips(*self.bvh.cull(planes))
+
+    def drawGL(self):
+        "Draw every visible primitive; the caller binds sphere_shader or cone_shader first"
+        if self.culling and self.bvh is not None:
+            firsts, counts = self.visibleStrips()
+        else:
+            firsts, counts = self.firsts, self.counts
+        self._drawStrips(firsts, counts)
+
+    def drawRangesGL(self, starts, stops):
+        "Draw only the primitives in half open index ranges"
+        self._drawStrips(*self.rangeStrips(starts, stops))
+
+    def _drawStrips(self, firsts, counts):
+        self.drawn_count = len(counts) * HULL_STRIP_LENGTH // HULL_VERTEX_COUNT
+        if len(counts) == 0:
+            return
+        self.bindGL()
+        glMultiDrawArrays(GL_TRIANGLE_STRIP, firsts, counts, len(counts))
+        self.unbindGL()
+
+    def deleteGL(self):
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+
+
+class GrowingVboSet(ImposterVboSet):
+    '''
+    Imposter set that primitives can be appended to between frames.
+
+    Appended vertices are uploaded with glBufferSubData by the next drawGL().
+    When the buffer is full, a new one of twice the size is allocated and the
+    old contents are copied over on the GPU with glCopyBufferSubData, so
+    nothing already uploaded is sent again and no copy is kept in memory.
+    '''
+    def __init__(self, capacity=1 << 16):
+        "capacity is the initial size of the buffer, in vertices"
+        ImposterVboSet.__init__(self, numpy.empty(0, dtype=IMPOSTER_VERTEX_DTYPE))
+        self.capacity = capacity
+        self.uploaded_count = 0 # vertices already in the buffer
+        self.pending = [] # vertex arrays appended since the last upload
+        self.pending_count = 0
+
+    def __len__(self):
+        return (self.uploaded_count + self.pending_count) // HULL_VERTEX_COUNT
+
+    def append(self, vertices):
+        "Add packed hull vertices; returns the (start, stop) primitive range they occupy"
+        assert vertices.dtype == IMPOSTER_VERTEX_DTYPE
+        start = len(self)
+        first = self.uploaded_count + self.pending_count
+        strip_count = len(vertices) // HULL_STRIP_LENGTH
+        self.firsts = numpy.concatenate([self.firsts,
+                first + numpy.arange(strip_count, dtype=numpy.int32) * HULL_STRIP_LENGTH])
+        self.counts = numpy.concatenate([self.counts,
+                numpy.full(strip_count, HULL_STRIP_LENGTH, dtype=numpy.int32)])
+        self.pending.append(vertices)
+        self.pending_count += len(vertices)
+        return start, len(self)
+
+    def uploadGL(self):
+        "Send pending vertices to the buffer, growing it first if they do not fit"
+        stride = IMPOSTER_VERTEX_DTYPE.itemsize
+        required = self.uploaded_count + self.pending_count
+        if self.vbo is None or required > self.capacity:
+            while required > self.capacity:
+                self.capacity *= 2
+            vbo = glGenBuffers(1)
+            glBindBuffer(GL_COPY_WRITE_BUFFER, vbo)
+            glBufferData(GL_COPY_WRITE_BUFFER, self.capacity * stride, None, GL_DYNAMIC_DRAW)
+            if self.vbo is not None:
+                if self.uploaded_count > 0:
+                    glBindBuffer(GL_COPY_READ_BUFFER, self.vbo)
+                    glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER,
+                            0, 0, self.uploaded_count * stride)
+                    glBindBuffer(GL_COPY_READ_BUFFER, 0)
+                glDeleteBuffers(1, [self.vbo])
+            glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+            self.vbo = vbo
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for vertices in self.pending:
+            glBufferSubData(GL_ARRAY_BUFFER, self.uploaded_count * stride, vertices.nbytes, vertices)
+            self.uploaded_count += len(vertices)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.pending = []
+        self.pending_count = 0
+
+    def bindGL(self):
+        if self.vbo is None or self.pending_count > 0:
+            self.uploadGL()
+        ImposterVboSet.bindGL(self)
+
+    def deleteGL(self):
+        "Release the buffer and forget every primitive appended so far"
+        ImposterVboSet.deleteGL(self)
+        self.uploaded_count = 0
+        self.pending = []
+        self.pending_count = 0
+        self.firsts = self.firsts[:0]
+        self.counts = self.counts[:0]
+
+
+class SphereVboSet(ImposterVboSet):
+    '''
+    Sphere imposters from arrays of centers (Nx3) and radii (N).
+
+    With cull=True, primitive i of the set is input sphere self.order[i].
+    '''
+    def __init__(self, center, radius, cull=False):
+        center = numpy.asarray(center)
+        radius = numpy.asarray(radius)
+        bvh = None
+        self.order = numpy.arange(len(radius))
+        if cull:
+            bvh = BoundingVolumeHierarchy(*sphere_bounds(center, radius))
+            self.order = bvh.order
+            center = center[self.order]
+            radius = radius[self.order]
+        ImposterVboSet.__init__(self, sphere_hull_vertices(center, radius), bvh)
+
+
+class ConeVboSet(ImposterVboSet):
+    '''
+    Cone imposters from a CONE_DTYPE array, as computed by cone_parameters().
+
+    With cull=True, primitive i of the set is input cone self.order[i].
+    '''
+    def __init__(self, cones, cull=False):
+        bvh = None
+        self.order = numpy.arange(len(cones))
+        if cull:
+            bvh = BoundingVolumeHierarchy(*cone_bounds(cones))
+            self.order = bvh.order
+            cones = cones[self.order]
+        ImposterVboSet.__init__(self, cone_hull_vertices(cones), bvh)
+
+
+# glVertexAttribPointer (type, normalized) of each instance field base type
+INSTANCE_ATTRIBUTE_TYPES = {
+        numpy.dtype(numpy.float32): (GL_FLOAT, GL_FALSE),
+        numpy.dtype(numpy.float16): (GL_HALF_FLOAT, GL_FALSE),
+        numpy.dtype(numpy.int16): (GL_SHORT, GL_TRUE), # -1 to 1, before positionScale
+        numpy.dtype(numpy.uint8): (GL_UNSIGNED_BYTE, GL_TRUE), }
+
+
+class InstancedImposterSet(object):
+    '''
+    Imposters drawn as instances of UNIT_HULL_STRIP, from a buffer of per instance attributes.
+
+    attributes lists (shader attribute name, instances field name) pairs.
+    Without instance_color, the "instanceColor" attribute takes the current
+    glColor, just as gl_Color does in the non instanced shaders.
+    position_origin and position_scale decode 16 bit integer positions, as
+    returned by compact_sphere_instances(). constants maps the names of
+    attributes that this format does not store to the value they take for
+    every instance.
+    '''
+    def __init__(self, instances, attributes, bvh=None, instance_color=False,
+            position_origin=(0.0, 0.0, 0.0), position_scale=(1.0, 1.0, 1.0), constants=None):
+        "If bvh is given, instances must be in its leaf order"
+        self.instances = instances
+        self.attributes = attributes
+        self.constants = constants or {}
+        self.instance_color = instance_color
+        self.position_origin = tuple(float(x) for x in position_origin)
+        self.position_scale = tuple(float(x) for x in position_scale)
+        self.vbo = None
+        self.hull_vbo = None
+        self.bvh = bvh
+        self.culling = bvh is not None
+        self.drawn_count = 0 # primitives submitted by the last drawGL()
+        self._locations = {} # program -> {attribute name: location}
+
+    def __len__(self):
+        "Number of imposter primitives"
+        return len(self.instances)
+
+    def uploadGL(self):
+        if self.vbo is None:
+            self.hull_vbo, self.vbo = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.hull_vbo)
+        glBufferData(GL_ARRAY_BUFFER, UNIT_HULL_STRIP.nbytes, UNIT_HULL_STRIP, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.instances.nbytes, self.instances, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def locationsGL(self):
+        "Attribute locations in the current program, which the caller has bound"
+        program = int(glGetIntegerv(GL_CURRENT_PROGRAM))
+        if program not in self._locations:
+            names = ["hullCorner", "instanceColor"] + [name for name, field in self.attributes]
+            names.extend(self.constants)
+            self._locations[program] = dict((name, glGetAttribLocation(program, name)) for name in names)
+        return self._locations[program]
+
+    def bindGL(self):
+        "Point the hull corner attribute at the unit hull and set the position uniforms; returns attribute locations"
+        if self.vbo is None:
+            self.uploadGL()
+        locations = self.locationsGL()
+        # Every set sets these uniforms, because they outlast the draw in the program
+        program = int(glGetIntegerv(GL_CURRENT_PROGRAM))
+        glUniform3f(glGetUniformLocation(program, "positionOrigin"), *self.position_origin)
+        glUniform3f(glGetUniformLocation(program, "positionScale"), *self.position_scale)
+        glBindBuffer(GL_ARRAY_BUFFER, self.hull_vbo)
+        glEnableVertexAttribArray(locations["hullCorner"])
+        glVertexAttribPointer(locations["hullCorner"], 3, GL_FLOAT, GL_FALSE, 0, None)
+        color = locations["instanceColor"]
+        if color >= 0 and not self.instance_color:
+            glVertexAttrib4fv(color, glGetFloatv(GL_CURRENT_COLOR))
+        for name, value in self.constants.items():
+            if locations[name] >= 0:
+                glVertexAttrib1f(locations[name], value)
+        return locations
+
+    def pointInstancesGL(self, locations, start):
+        "Point the per instance attributes at the instances from index start on"
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        stride = self.instances.dtype.itemsize
+        fields = list(self.attributes)
+        if self.instance_color:
+            fields.append(("instanceColor", "color"))
+        for name, field in fields:
+            location = locations[name]
+            if location < 0:
+                continue # unused by this program
+            dtype, offset = self.instances.dtype.fields[field][0:2]
+            gl_type, normalized = INSTANCE_ATTRIBUTE_TYPES[dtype.base]
+            size = dtype.shape[0] if dtype.shape else 1
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, gl_type, normalized, stride,
+                    ctypes.c_void_p(offset + start * stride))
+            glVertexAttribDivisor(location, 1)
+
+    def unbindGL(self, locations):
+        for name, location in locations.items():
+            if location >= 0:
+                glVertexAttribDivisor(location, 0)
+                glDisableVertexAttribArray(location)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def drawGL(self):
+        "Draw every visible primitive; the caller binds an instanced sphere or cone shader first"
+        if self.culling and self.bvh is not None:
+            planes = frustum_planes(glGetFloatv(GL_MODELVIEW_MATRIX), glGetFloatv(GL_PROJECTION_MATRIX))
+            self.drawRangesGL(*self.bvh.cull(planes))
+        else:
+            self.drawRangesGL([0], [len(self)])
+
+    def drawRangesGL(self, starts, stops):
+        "Draw only the primitives in half open index ranges, one instanced call per range"
+        self.drawn_count = int(numpy.sum(numpy.asarray(stops) - numpy.asarray(starts)))
+        if self.drawn_count == 0:
+            return
+        locations = self.bindGL()
+        for start, stop in zip(starts, stops):
+            if stop > start:
+                self.pointInstancesGL(locations, int(start))
+                glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, len(UNIT_HULL_STRIP), int(stop - start))
+        self.unbindGL(locations)
+
+    def deleteGL(self):
+        if self.vbo is not None:
+            glDeleteBuffers(2, [self.hull_vbo, self.vbo])
+            self.vbo = self.hull_vbo = None
+        self._locations = {}
+
+
+class SphereInstanceSet(InstancedImposterSet):
+    '''
+    Instanced sphere imposters from centers (Nx3), radii (N) and optional colors.
+
+    Draw with sphere_instanced_shader120(). color is one RGB(A) triple or one
+    per sphere; by default spheres take the current glColor.
+    With cull=True, primitive i of the set is input sphere self.order[i].
+    With compact=True, instances are COMPACT_SPHERE_INSTANCE_DTYPE.
+    '''
+    def __init__(self, center, radius, color=None, cull=False, compact=False):
+        center = numpy.asarray(center)
+        radius = numpy.asarray(radius)
+        bvh = None
+        self.order = numpy.arange(len(radius))
+        origin, scale = (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)
+        if compact:
+            instances, origin, scale = compact_sphere_instances(center, radius, color)
+        else:
+            instances = sphere_instances(center, radius, color)
+        if cull:
+            bvh = BoundingVolumeHierarchy(*sphere_bounds(center, radius))
+            self.order = bvh.order
+            instances = instances[self.order]
+        InstancedImposterSet.__init__(self, instances,
+                [("instanceCenter", "center"), ("instanceRadius", "radius")],
+                bvh, color is not None, origin, scale)
+
+
+class ConeInstanceSet(InstancedImposterSet):
+    '''
+    Instanced cone imposters from a CONE_DTYPE array and optional colors.
+
+    Draw with cone_instanced_shader120(). color is one RGB(A) triple or one
+    per cone; by default cones take the current glColor.
+    With cull=True, primitive i of the set is input cone self.order[i].
+    With compact=True, instances are COMPACT_CONE_INSTANCE_DTYPE.
+    '''
+    def __init__(self, cones, color=None, cull=False, compact=False):
+        bvh = None
+        self.order = numpy.arange(len(cones))
+        origin, scale = (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)
+        attributes = [("instanceCenter", "center"), ("instanceRadius", "radius"),
+                ("instanceAxis", "axis"), ("instanceTaper", "taper")]
+        if compact:
+            instances, origin, scale = compact_cone_instances(cones, color)
+            attributes.append(("instanceAxisLength", "axis_length"))
+            constants = None
+        else:
+            instances = cone_instances(cones, color)
+            # Full float instances store the whole half axis in instanceAxis
+            constants = {"instanceAxisLength": 1.0}
+        if cull:
+            bvh = BoundingVolumeHierarchy(*cone_bounds(cones))
+            self.order = bvh.order
+            instances = instances[self.order]
+        InstancedImposterSet.__init__(self, instances, attributes,
+                bvh, color is not None, origin, scale, constants)
+
+
+class LodVboSet(object):
+    "Sphere and cone imposters for all levels of a NeuronLod, drawn at per chain levels"
+    def __init__(self, lod):
+        self.lod = lod
+        xyz = lod.xyz
+        radius = lod.radius
+        self.spheres = ImposterVboSet(sphere_hull_vertices(xyz[lod.sphere_nodes], radius[lod.sphere_nodes]))
+        child, parent = lod.cone_edges[:, 0], lod.cone_edges[:, 1]
+        self.cones = ImposterVboSet(cone_hull_vertices(cone_parameters(
+                xyz[parent], radius[parent], xyz[child], radius[child])))
+        self.pixelError = 1.0 # largest screen space error allowed, in pixels
+        self.levels = None # per chain level chosen by the last selectGL()
+
+    def selectGL(self):
+        "Choose the level of each chain for the current matrices and viewport"
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        self.levels = self.lod.selectLevels(glGetFloatv(GL_MODELVIEW_MATRIX),
+                glGetFloatv(GL_PROJECTION_MATRIX), viewport[3], self.pixelError)
+
+    def drawSpheresGL(self):
+        "Draw the selected spheres; the caller binds sphere_shader first"
+        if self.levels is None:
+            self.selectGL()
+        self.spheres.drawRangesGL(*self.lod.sphereRanges(self.levels))
+
+    def drawConesGL(self):
+        "Draw the selected cones; the caller binds cone_shader first"
+        if self.levels is None:
+            self.selectGL()
+        self.cones.drawRangesGL(*self.lod.coneRanges(self.levels))
+
+    def deleteGL(self):
+        self.spheres.deleteGL()
+        self.cones.deleteGL()
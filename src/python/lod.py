@@ -0,0 +1,302 @@
+'''
+Level of detail for SWC neurons.
+
+The tree is split into chains, the unbranched runs of nodes between key
+nodes (roots, branch points and tips). Each chain is simplified with a
+radius-aware Douglas-Peucker ranking, computed for all chains at once, so
+that level L keeps only the interior nodes needed to stay within
+tolerances[L] of the full resolution skeleton and radii. Key nodes are kept
+at every level, so the branching structure never changes.
+
+Every frame, selectLevels() picks one level per chain from the projected
+size of a pixel at the chain's distance, in a few vectorized operations
+over chains rather than nodes.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+
+from swc import path_sums
+from spatial_index import frustum_planes, expand_ranges
+
+
+MAX_LEVELS = 16
+
+
+def _tree_roots(link):
+    "Root of each node in the forest given by link, with -1 for roots, by pointer jumping"
+    pointer = numpy.where(link >= 0, link, numpy.arange(len(link)))
+    active = numpy.flatnonzero(pointer[pointer] != pointer)
+    while len(active) > 0:
+        pointer[active] = pointer[pointer[active]]
+        active = active[pointer[pointer[active]] != pointer[active]]
+    return pointer
+
+
+def chain_decomposition(parent):
+    '''
+    Split a tree into unbranched chains.
+
+    parent holds row indices, with -1 for roots. Returns (entries, offsets):
+    chain c is the node sequence entries[offsets[c]:offsets[c+1]], from its
+    key node ancestor down to the next key node. Every non-root node appears
+    exactly once as a non-first entry; key nodes also start the chains of
+    their children.
+    '''
+    parent = numpy.asarray(parent, dtype=numpy.int64)
+    n = len(parent)
+    has_parent = parent >= 0
+    child_count = numpy.bincount(parent[has_parent], minlength=n)
+    key = ~has_parent | (child_count != 1)
+    # Cut the tree just below every key node, leaving one path per chain
+    link = parent.copy()
+    link[has_parent & key[numpy.maximum(parent, 0)]] = -1
+    head = _tree_roots(link)
+    position = path_sums(link, numpy.ones(n, dtype=numpy.int64))
+    members = numpy.flatnonzero(has_parent)
+    members = members[numpy.lexsort((position[members], head[members]))]
+    heads = numpy.flatnonzero(has_parent & (link < 0)) # already sorted, like head[members]
+    chain = numpy.searchsorted(heads, head[members])
+    counts = numpy.bincount(chain, minlength=len(heads)) + 1
+    offsets = numpy.zeros(len(heads) + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    entries = numpy.empty(offsets[-1], dtype=numpy.int64)
+    entries[offsets[:-1]] = parent[heads]
+    entries[numpy.arange(len(members)) + chain + 1] = members
+    return entries, offsets
+
+
+def _deviation(point, point_radius, start, start_radius, end, end_radius):
+    '''
+    Distance of each point from the segment start-end, plus the difference
+    between its radius and the interpolated radius there. An upper bound on
+    how far the imposter surface moves when the point is dropped.
+    '''
+    direction = end - start
+    length2 = numpy.einsum('ij,ij->i', direction, direction)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = numpy.einsum('ij,ij->i', point - start, direction) / length2
+    t = numpy.clip(numpy.nan_to_num(t), 0.0, 1.0)
+    offset = point - (start + t[:, None] * direction)
+    radius = start_radius + t * (end_radius - start_radius)
+    return numpy.sqrt(numpy.einsum('ij,ij->i', offset, offset)) + numpy.abs(point_radius - radius)
+
+
+def chain_significance(xyz, radius, entries, offsets):
+    '''
+    Douglas-Peucker significance of every chain entry, infinite at chain ends.
+
+    All chains are refined together, one vectorized pass per recursion depth.
+    Values never exceed the value of the split that exposed them, so that
+    significance > tolerance selects exactly the Douglas-Peucker
+    simplification at that tolerance.
+    '''
+    points = numpy.asarray(xyz, dtype=numpy.float64)[entries]
+    radii = numpy.asarray(radius, dtype=numpy.float64)[entries]
+    result = numpy.full(len(entries), numpy.inf)
+    a = offsets[:-1]
+    b = offsets[1:] - 1
+    bound = numpy.full(len(a), numpy.inf)
+    keep = b - a >= 2
+    a, b, bound = a[keep], b[keep], bound[keep]
+    while len(a) > 0:
+        lengths = b - a - 1
+        inner = expand_ranges(a + 1, b)
+        segment = numpy.repeat(numpy.arange(len(a)), lengths)
+        deviation = _deviation(points[inner], radii[inner],
+                points[a][segment], radii[a][segment], points[b][segment], radii[b][segment])
+        firsts = numpy.zeros(len(a), dtype=numpy.int64)
+        numpy.cumsum(lengths[:-1], out=firsts[1:])
+        worst = numpy.maximum.reduceat(deviation, firsts)
+        # Split each segment at its first point of largest deviation
+        hits = numpy.flatnonzero(deviation == worst[segment])
+        split = inner[hits[numpy.unique(segment[hits], return_index=True)[1]]]
+        value = numpy.minimum(worst, bound)
+        result[split] = value
+        a, b = numpy.concatenate([a, split]), numpy.concatenate([split, b])
+        bound = numpy.concatenate([value, value])
+        keep = b - a >= 2
+        a, b, bound = a[keep], b[keep], bound[keep]
+    return result
+
+
+class NeuronLod(object):
+    "Precomputed simplification levels of one neuron, selectable per chain"
+    def __init__(self, xyz, radius, parent, base_tolerance=None, level_count=None):
+        '''
+        Level 0 is full resolution; level L > 0 is within
+        base_tolerance * 2**(L-1) of it, in model units. base_tolerance
+        defaults to a quarter of the median radius.
+        '''
+        self.xyz = numpy.asarray(xyz, dtype=numpy.float64)
+        self.radius = numpy.asarray(radius, dtype=numpy.float64)
+        parent = numpy.asarray(parent)
+        self.entries, self.offsets = chain_decomposition(parent)
+        self.significance = chain_significance(self.xyz, self.radius, self.entries, self.offsets)
+        self.roots = numpy.flatnonzero(parent < 0)
+        chain_count = len(self.offsets) - 1
+        self.chain = numpy.repeat(numpy.arange(chain_count), numpy.diff(self.offsets))
+        if base_tolerance is None:
+            base_tolerance = 0.25 * numpy.median(self.radius) if len(self.radius) > 0 else 1.0
+            if base_tolerance <= 0:
+                base_tolerance = 1e-3
+        self.base_tolerance = base_tolerance
+        if level_count is None:
+            finite = self.significance[numpy.isfinite(self.significance)]
+            level_count = 1
+            if len(finite) > 0:
+                # Enough levels that the coarsest keeps only key nodes
+                level_count = 2 + int(numpy.ceil(numpy.log2(
+                        max(finite.max(), base_tolerance) / base_tolerance)))
+        level_count = min(level_count, MAX_LEVELS)
+        self.tolerances = numpy.array([0.0] +
+                [base_tolerance * 2.0**(level - 1) for level in range(1, level_count)])
+        self._createBounds()
+        self._createLevels()
+
+    @staticmethod
+    def fromNeuron(neuron, base_tolerance=None, level_count=None):
+        return NeuronLod(neuron.xyz, neuron.radius, neuron.parent, base_tolerance, level_count)
+
+    def __len__(self):
+        "Number of levels"
+        return len(self.tolerances)
+
+    def _createBounds(self):
+        "Bounding sphere of each chain"
+        if len(self.entries) == 0:
+            self.chain_center = numpy.empty((0, 3))
+            self.chain_radius = numpy.empty(0)
+            return
+        points = self.xyz[self.entries]
+        radii = self.radius[self.entries][:, None]
+        lo = numpy.minimum.reduceat(points - radii, self.offsets[:-1], axis=0)
+        hi = numpy.maximum.reduceat(points + radii, self.offsets[:-1], axis=0)
+        self.chain_center = 0.5 * (lo + hi)
+        self.chain_radius = 0.5 * numpy.linalg.norm(hi - lo, axis=1)
+
+    def keptEntries(self, level):
+        "Mask of chain entries present at one level"
+        if level == 0:
+            return numpy.ones(len(self.entries), dtype=bool)
+        return self.significance > self.tolerances[level]
+
+    def _createLevels(self):
+        '''
+        Sphere nodes and cone edges of all levels, grouped by level, then by chain.
+
+        Root spheres come first in sphere_nodes and are drawn at every level.
+        sphere_offsets[L, c] and cone_offsets[L, c] index the first primitive
+        of chain c at level L in sphere_nodes and cone_edges.
+        '''
+        chain_count = len(self.offsets) - 1
+        index = numpy.arange(len(self.entries))
+        first = numpy.zeros(len(self.entries), dtype=bool)
+        first[self.offsets[:-1]] = True
+        last = numpy.zeros(len(self.entries), dtype=bool)
+        last[self.offsets[1:] - 1] = True
+        sphere_nodes = [self.roots]
+        cone_edges = []
+        self.sphere_offsets = numpy.empty((len(self), chain_count + 1), dtype=numpy.int64)
+        self.cone_offsets = numpy.empty((len(self), chain_count + 1), dtype=numpy.int64)
+        sphere_base = len(self.roots)
+        cone_base = 0
+        for level, tolerance in enumerate(self.tolerances):
+            kept = self.keptEntries(level)
+            k = index[kept]
+            same = self.chain[k[1:]] == self.chain[k[:-1]]
+            edges = numpy.empty((same.sum(), 2), dtype=numpy.int64)
+            edges[:, 0] = self.entries[k[1:]][same] # (child, parent), as from SwcNeuron.edges()
+            edges[:, 1] = self.entries[k[:-1]][same]
+            cone_chain = self.chain[k[1:]][same]
+            # Key nodes end exactly one chain each. Interior spheres thinner
+            # than the tolerance are hidden by their cones, to within tolerance.
+            spheres = last | (kept & ~first & (self.radius[self.entries] >= tolerance))
+            sphere_chain = self.chain[spheres]
+            sphere_nodes.append(self.entries[spheres])
+            cone_edges.append(edges)
+            self.sphere_offsets[level, 0] = sphere_base
+            numpy.cumsum(numpy.bincount(sphere_chain, minlength=chain_count),
+                    out=self.sphere_offsets[level, 1:])
+            self.sphere_offsets[level, 1:] += sphere_base
+            self.cone_offsets[level, 0] = cone_base
+            numpy.cumsum(numpy.bincount(cone_chain, minlength=chain_count),
+                    out=self.cone_offsets[level, 1:])
+            self.cone_offsets[level, 1:] += cone_base
+            sphere_base = self.sphere_offsets[level, -1]
+            cone_base = self.cone_offsets[level, -1]
+        self.sphere_nodes = numpy.concatenate(sphere_nodes)
+        self.cone_edges = numpy.concatenate(cone_edges) if cone_edges else numpy.empty((0, 2), dtype=numpy.int64)
+
+    def levelSizes(self):
+        "(sphere count, cone count) of each level, if it were selected for every chain"
+        spheres = self.sphere_offsets[:, -1] - self.sphere_offsets[:, 0] + len(self.roots)
+        cones = self.cone_offsets[:, -1] - self.cone_offsets[:, 0]
+        return list(zip(spheres, cones))
+
+    def selectLevels(self, modelViewMatrix, projectionMatrix, viewportHeight, pixelError=1.0):
+        '''
+        Coarsest level of each chain whose tolerance projects to at most pixelError pixels.
+
+        Matrices are 4x4 in OpenGL column-major order, as returned by
+        glGetFloatv(GL_MODELVIEW_MATRIX). Chains entirely outside the view
+        frustum get level -1.
+        '''
+        modelView = numpy.asarray(modelViewMatrix, dtype=numpy.float64).reshape(4, 4).T
+        projection = numpy.asarray(projectionMatrix, dtype=numpy.float64).reshape(4, 4).T
+        # Model units per eye unit, assuming a uniform scale in modelView
+        scale = numpy.linalg.norm(modelView[0:3, 0])
+        eye = numpy.dot(self.chain_center, modelView[0:3, 0:3].T) + modelView[0:3, 3]
+        if projection[3, 3] == 0: # perspective
+            # Distance to the nearest point of each chain's bounding sphere
+            depth = numpy.maximum(-eye[:, 2] - scale * self.chain_radius, 0.0)
+            eye_per_pixel = 2.0 * depth / (projection[1, 1] * viewportHeight)
+        else:
+            eye_per_pixel = numpy.full(len(eye), 2.0 / (projection[1, 1] * viewportHeight))
+        allowed = pixelError * eye_per_pixel / scale
+        with numpy.errstate(divide='ignore'):
+            levels = numpy.floor(numpy.log2(allowed / self.base_tolerance)) + 1
+        levels = numpy.clip(levels, 0, len(self) - 1).astype(numpy.int64)
+        planes = frustum_planes(modelViewMatrix, projectionMatrix)
+        distance = numpy.dot(self.chain_center, planes[:, 0:3].T) + planes[:, 3]
+        levels[numpy.any(distance < -self.chain_radius[:, None], axis=1)] = -1
+        return levels
+
+    def _ranges(self, offsets, levels, extra):
+        visible = numpy.flatnonzero(levels >= 0)
+        starts = offsets[levels[visible], visible]
+        stops = offsets[levels[visible], visible + 1]
+        if extra > 0:
+            starts = numpy.concatenate([[0], starts])
+            stops = numpy.concatenate([[extra], stops])
+        return starts, stops
+
+    def sphereRanges(self, levels):
+        "(starts, stops) of the spheres in sphere_nodes to draw for per chain levels"
+        return self._ranges(self.sphere_offsets, levels, len(self.roots))
+
+    def coneRanges(self, levels):
+        "(starts, stops) of the cones in cone_edges to draw for per chain levels"
+        return self._ranges(self.cone_offsets, levels, 0)
+
+    def maxDeviation(self, level):
+        '''
+        Largest deviation of any dropped node from the cones of one level.
+
+        This is the simplification error bound check: it never exceeds
+        tolerances[level].
+        '''
+        kept = self.keptEntries(level)
+        index = numpy.arange(len(self.entries))
+        dropped = index[~kept]
+        if len(dropped) == 0:
+            return 0.0
+        # Nearest kept entries before and after each dropped one, always in the same chain
+        before = numpy.maximum.accumulate(numpy.where(kept, index, 0))[dropped]
+        after = numpy.minimum.accumulate(numpy.where(kept, index, len(index))[::-1])[::-1][dropped]
+        points = self.xyz[self.entries]
+        radii = self.radius[self.entries]
+        return _deviation(points[dropped], radii[dropped],
+                points[before], radii[before], points[after], radii[after]).max()
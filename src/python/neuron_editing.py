@@ -0,0 +1,149 @@
+'''
+Editable neuron model for interactive tracing, with incremental redraw.
+
+EditableNeuron holds the node arrays of one SWC tree and records which
+spheres and cones each edit invalidates: moving a node or changing its
+radius affects its own sphere, the cone to its parent and the cones to its
+children; reparenting a node affects only the cone to its parent. Finding
+children uses a child index built once, so the cost of an edit depends on
+the number of neighbors of the edited node, never on the size of the tree.
+
+EditableVboSet draws an EditableNeuron through two ImposterVboSets, with one
+sphere and one cone slot per node, and before each frame recomputes only
+the dirty primitives and uploads them with glBufferSubData.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+
+from imposter_geometry import IMPOSTER_VERTEX_DTYPE, HULL_VERTEX_COUNT
+from imposter_geometry import cone_parameters, sphere_hull_vertices, cone_hull_vertices
+from imposter_vbo import ImposterVboSet
+from spatial_index import merge_ranges
+from tree_topology import child_adjacency
+
+
+class EditableNeuron(object):
+    "One SWC tree whose nodes can be moved, resized and reparented, tracking dirty primitives"
+    def __init__(self, xyz, radius, parent):
+        "parent holds row indices, with -1 for roots, as in SwcNeuron.parent"
+        self.xyz = numpy.array(xyz, dtype=numpy.float64)
+        self.radius = numpy.array(radius, dtype=numpy.float64)
+        self.parent = numpy.array(parent, dtype=numpy.int64)
+        # Children of node i are child_order[child_offsets[i]:child_offsets[i+1]],
+        # as of construction; later reparenting is recorded in self.adopted.
+        self.child_offsets, self.child_order = child_adjacency(self.parent)
+        self.adopted = {} # node -> set of nodes reparented to it since construction
+        self.dirty_spheres = set()
+        self.dirty_cones = set() # indexed by child node; every non-root node has one cone
+
+    @staticmethod
+    def fromNeuron(neuron):
+        return EditableNeuron(neuron.xyz, neuron.radius, neuron.parent)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def children(self, node):
+        "Current children of a node"
+        original = self.child_order[self.child_offsets[node]:self.child_offsets[node + 1]]
+        # Children reparented elsewhere still appear in the index, so check each one
+        result = [int(child) for child in original if self.parent[child] == node]
+        result.extend(child for child in self.adopted.get(node, ()) if self.parent[child] == node)
+        return result
+
+    def _touch(self, node):
+        self.dirty_spheres.add(node)
+        self.dirty_cones.add(node)
+        self.dirty_cones.update(self.children(node))
+
+    def moveNode(self, node, xyz):
+        self.xyz[node] = xyz
+        self._touch(node)
+
+    def setRadius(self, node, radius):
+        self.radius[node] = radius
+        self._touch(node)
+
+    def reparent(self, node, new_parent):
+        "Attach node, and the branch below it, to new_parent, or make it a root if new_parent is -1"
+        ancestor = new_parent
+        while ancestor >= 0:
+            if ancestor == node:
+                raise ValueError("Cannot attach node %d below itself" % node)
+            ancestor = self.parent[ancestor]
+        self.parent[node] = new_parent
+        if new_parent >= 0:
+            self.adopted.setdefault(new_parent, set()).add(node)
+        self.dirty_cones.add(node)
+
+    def takeDirty(self):
+        "Sorted arrays of (sphere, cone) indices changed since the last call, which clears them"
+        spheres = numpy.array(sorted(self.dirty_spheres), dtype=numpy.int64)
+        cones = numpy.array(sorted(self.dirty_cones), dtype=numpy.int64)
+        self.dirty_spheres = set()
+        self.dirty_cones = set()
+        return spheres, cones
+
+    def coneParameters(self, nodes):
+        '''
+        Cone parameters of the edge from each of nodes to its parent, as a
+        CONE_DTYPE array. Roots, and nodes coincident with their parent,
+        have non-finite values.
+        '''
+        nodes = numpy.asarray(nodes, dtype=numpy.int64)
+        parent = self.parent[nodes]
+        # Roots get a cone to themselves, which is non-finite
+        other = numpy.where(parent >= 0, parent, nodes)
+        return cone_parameters(self.xyz[other], self.radius[other], self.xyz[nodes], self.radius[nodes])
+
+
+def _index_ranges(indices):
+    "Half open ranges covering sorted unique indices, with consecutive runs merged"
+    return merge_ranges(indices, indices + 1)
+
+
+class EditableVboSet(object):
+    "Sphere and cone imposters of an EditableNeuron, re-uploading only what edits changed"
+    def __init__(self, neuron):
+        self.neuron = neuron
+        self.spheres = ImposterVboSet(sphere_hull_vertices(neuron.xyz, neuron.radius))
+        self.cones = ImposterVboSet(self._coneVertices(numpy.arange(len(neuron))))
+        neuron.takeDirty() # everything is current
+
+    def _coneVertices(self, nodes):
+        "Hull vertices of the cones of nodes; roots and degenerate cones collapse to a point"
+        cones = self.neuron.coneParameters(nodes)
+        vertices = cone_hull_vertices(cones).reshape(len(nodes), HULL_VERTEX_COUNT)
+        hidden = ~numpy.isfinite(cones['length']) | ~(cones['length'] > 0)
+        vertices[hidden] = numpy.zeros(1, dtype=IMPOSTER_VERTEX_DTYPE)
+        return vertices.reshape(-1)
+
+    def updateGL(self):
+        "Recompute and upload the primitives changed by edits since the last frame"
+        spheres, cones = self.neuron.takeDirty()
+        if len(spheres) > 0:
+            vertices = self.spheres.vertices.reshape(-1, HULL_VERTEX_COUNT)
+            vertices[spheres] = sphere_hull_vertices(
+                    self.neuron.xyz[spheres], self.neuron.radius[spheres]).reshape(-1, HULL_VERTEX_COUNT)
+            self.spheres.updateGL(*_index_ranges(spheres))
+        if len(cones) > 0:
+            vertices = self.cones.vertices.reshape(-1, HULL_VERTEX_COUNT)
+            vertices[cones] = self._coneVertices(cones).reshape(-1, HULL_VERTEX_COUNT)
+            self.cones.updateGL(*_index_ranges(cones))
+
+    def drawSpheresGL(self):
+        "Apply pending edits, then draw the spheres; the caller binds sphere_shader first"
+        self.updateGL()
+        self.spheres.drawGL()
+
+    def drawConesGL(self):
+        "Apply pending edits, then draw the cones; the caller binds cone_shader first"
+        self.updateGL()
+        self.cones.drawGL()
+
+    def deleteGL(self):
+        self.spheres.deleteGL()
+        self.cones.deleteGL()
@@ -0,0 +1,512 @@
+'''
+Geometry shader imposter renderer for whole SWC neurons.
+
+Every node is uploaded once, as one GL_POINTS vertex of position and radius.
+The SpheresGeom330.glsl geometry shader expands each point into a sphere
+imposter hull, and ConesGeom330.glsl expands each parent/child pair of an
+element buffer of GL_LINES into a cone imposter hull. Only core profile
+API calls are used.
+
+Every per node value that nodes can be colored by is uploaded once, in a
+second buffer, alongside the geometry. Changing colorBy only repoints the
+colorValue attribute at another value and sets a few uniforms, so
+recoloring costs the same for any size of neuron.
+
+With depthSort, spheres and cones are drawn nearest first, through a second
+element buffer that holds the point indices of the spheres followed by the
+line indices of the cones, in the order of a DepthSorter for each.
+
+With vertexPulling, no geometry shader runs. The view independent terms of
+every cone (center, half axis, radius and taper) are computed once on the
+host, by cone_parameters(), into a third buffer. SpheresPullVrtx330.glsl
+and ConesPullVrtx330.glsl then draw one instance of a triangle strip per
+sphere or cone, and fetch its parameters from buffer textures over these
+buffers by gl_InstanceID. The sorted element buffer then holds the sphere
+order followed by the cone order, which the vertex shaders read as well.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import ctypes
+
+from OpenGL.GL import *
+import numpy
+
+from imposter_shaders import sphere_shader330, cone_shader330, HULL_STRATEGIES
+from imposter_shaders import conservative_depth_supported
+from imposter_shaders import sphere_pull_shader330, cone_pull_shader330
+from imposter_shaders import SPHERE_PULL_STRIP_LENGTHS, CONE_PULL_STRIP_LENGTH
+from imposter_geometry import cone_parameters
+from depth_sort import DepthSorter
+from node_colors import COLOR_MODES, NODE_COLOR_FIELDS, TYPE_COLORS
+from node_colors import default_colormap, node_color_fields
+
+
+# One vertex per SWC node, as consumed by SpheresVrtx330.glsl and ConesVrtx330.glsl
+NODE_VERTEX_DTYPE = numpy.dtype([
+        ('position', numpy.float32, (3,)),
+        ('radius', numpy.float32), ])
+# Attribute locations, from the layout qualifiers in SpheresVrtx330.glsl and ConesVrtx330.glsl
+NODE_ATTRIBUTE_LOCATIONS = (('position', 0, 3), ('radius', 1, 1))
+COLOR_VALUE_LOCATION = 2 # colorValue, from the buffer of node_color_fields()
+
+# Two RGBA32F texels per cone, as read by ConesPullVrtx330.glsl
+CONE_TEXEL_DTYPE = numpy.dtype([
+        ('center_radius', numpy.float32, (4,)), # centroid, and radius there
+        ('axis_taper', numpy.float32, (4,)), ]) # half axis toward the smaller end, and taper
+# Texture units of the buffer textures of vertexPulling, by sampler name.
+# Units 0 to 2 hold the light probe, typeColors and colormap.
+PULL_TEXTURE_UNITS = (("nodes", 3), ("colorValues", 4), ("coneLines", 5), ("cones", 6),
+        ("drawOrder", 7))
+
+
+def default_light_probe_image(size=64):
+    '''
+    Procedural light probe for image_based_lighting() in imposter_fns330.glsl.
+
+    Returns a size x 2*size x 3 float32 image, with the diffuse probe on the
+    left and the reflection probe on the right, both lit from the direction
+    of the light_rig() light.
+    '''
+    light = numpy.array([-5.0, 3.0, 3.0])
+    light /= numpy.linalg.norm(light)
+    v, u = numpy.mgrid[0:size, 0:size] + 0.5
+    # Invert the normal-to-texture-coordinate mapping used in image_based_lighting()
+    dx = (u / size - 0.5) / 0.49
+    dy = (v / size - 0.5) / -0.98
+    rho = numpy.minimum(numpy.hypot(dx, dy), 1.0)
+    nz = 1.0 - 2.0 * rho
+    nxy = numpy.sqrt(numpy.maximum(0.0, 1.0 - nz*nz))
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        scale = numpy.where(rho > 0, nxy / numpy.hypot(dx, dy), 0.0)
+    normal = numpy.dstack([dx * scale, dy * scale, nz])
+    cosine = numpy.maximum(0.0, normal.dot(light))
+    diffuse = 0.25 + 0.75 * cosine
+    reflect = 0.02 + 0.25 * cosine**20
+    image = numpy.empty((size, 2*size, 3), dtype=numpy.float32)
+    image[:, :size, :] = diffuse[:, :, None]
+    image[:, size:, :] = reflect[:, :, None]
+    return image
+
+
+def cone_texels(xyz, radius, lines):
+    '''
+    CONE_TEXEL_DTYPE parameters of the cone joining the two nodes of each
+    of Nx2 lines, as ConesGeom330.glsl computes them from the same nodes.
+    '''
+    xyz = numpy.asarray(xyz, dtype=numpy.float64)
+    radius = numpy.asarray(radius, dtype=numpy.float64)
+    cones = cone_parameters(xyz[lines[:, 0]], radius[lines[:, 0]], xyz[lines[:, 1]], radius[lines[:, 1]])
+    result = numpy.empty(len(cones), dtype=CONE_TEXEL_DTYPE)
+    result['center_radius'][:, 0:3] = cones['center']
+    result['center_radius'][:, 3] = cones['radius']
+    result['axis_taper'][:, 0:3] = cones['axis']
+    result['axis_taper'][:, 3] = cones['taper']
+    return result
+
+
+def create_light_probe_texture():
+    "2D texture of default_light_probe_image(), for the lightProbe uniform"
+    image = default_light_probe_image()
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB16F, image.shape[1], image.shape[0], 0,
+            GL_RGB, GL_FLOAT, image)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    return texture
+
+
+class NeuronRenderer330(object):
+    "Sphere and cone imposters for one neuron, from one vertex per node"
+    def __init__(self, xyz, radius, edges, color_fields=None):
+        '''
+        xyz and radius hold per node positions and radii.
+        edges is an Nx2 array of (child, parent) node indices, as from SwcNeuron.edges().
+        color_fields holds the per node values of NODE_COLOR_FIELDS, as from
+        node_color_fields(); without it, every value is zero.
+        '''
+        self.nodes = numpy.empty(len(radius), dtype=NODE_VERTEX_DTYPE)
+        self.nodes['position'] = xyz
+        self.nodes['radius'] = radius
+        # One GL_LINES primitive per cone. Order within each line does not
+        # matter, because ConesGeom330.glsl sorts the ends by radius.
+        self.lines = numpy.ascontiguousarray(edges[:, ::-1], dtype=numpy.uint32)
+        self.color = (0.2, 0.5, 0.8, 1.0)
+        if color_fields is None:
+            color_fields = numpy.zeros((len(NODE_COLOR_FIELDS), len(radius)))
+        self.color_fields = numpy.ascontiguousarray(color_fields, dtype=numpy.float32)
+        # "uniform" for self.color, or one of NODE_COLOR_FIELDS
+        self.colorBy = "uniform"
+        # Field values at the two ends of the colormap, by default their full range
+        self.color_ranges = dict((name, self._fieldRange(values))
+                for name, values in zip(NODE_COLOR_FIELDS, self.color_fields))
+        self.colormap = default_colormap()
+        self._bound_field = None # field the colorValue attribute points at
+        self.radiusScale = 1.0
+        self.radiusOffset = 0.0
+        # Sphere imposter hull strategy: "near", "far" or "mid"; see SpheresGeom330.glsl
+        self.hullStrategy = "far"
+        # With conservativeDepth, hidden hull fragments fail the depth test
+        # before the ray-cast, instead of after it. Spheres then always use
+        # the near hull. Needs GL 4.2 or GL_ARB_conservative_depth.
+        self.conservativeDepth = False
+        # With deferred, draw unlit colors and normals into the bound
+        # deferred_shading.GBuffer, which then lights each pixel once
+        self.deferred = False
+        # Draw front to back, so that more hidden fragments fail the depth test
+        self.depthSort = False
+        # With vertexPulling, draw without geometry shaders, from parameters
+        # in buffer textures. Cones are precomputed on the host again only
+        # when radiusScale or radiusOffset change relative to the model view scale.
+        self.vertexPulling = False
+        self.showSpheres = True
+        self.showCones = True
+        self.sphere_sorter = None # DepthSorters, created on first sorted draw
+        self.cone_sorter = None
+        self.sorted_ibo = None
+        self._sorted_pulled = None # vertexPulling of the last upload to sorted_ibo
+        self.cone_vbo = None # CONE_TEXEL_DTYPE, created on first vertexPulling draw
+        self.buffer_textures = None # one per PULL_TEXTURE_UNITS
+        self._cone_radius_key = None # model coordinate radius offset and scale of cone_vbo
+        # one program per (hull strategy, conservativeDepth, deferred), compiled on first use
+        self.sphere_shaders = {}
+        self.cone_shader = None # the default program, compiled by initGL()
+        self.cone_shaders = {} # by (conservativeDepth, deferred), for the other modes
+        self.sphere_pull_shaders = {} # as sphere_shaders, for vertexPulling
+        self.cone_pull_shaders = {} # by (conservativeDepth, deferred), for vertexPulling
+
+    @staticmethod
+    def fromNeuron(neuron):
+        return NeuronRenderer330(neuron.xyz, neuron.radius, neuron.edges(),
+                node_color_fields(neuron))
+
+    @staticmethod
+    def _fieldRange(values):
+        if len(values) == 0:
+            return (0.0, 1.0)
+        return (float(values.min()), float(values.max()))
+
+    def initGL(self):
+        self.cone_shader = cone_shader330()
+        self.vbo, self.ibo, self.color_vbo = glGenBuffers(3)
+        # One vertex array object serves both programs, because attribute
+        # locations are fixed by layout qualifiers in the vertex shaders.
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.nodes.nbytes, self.nodes, GL_STATIC_DRAW)
+        stride = NODE_VERTEX_DTYPE.itemsize
+        for name, location, size in NODE_ATTRIBUTE_LOCATIONS:
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride,
+                    ctypes.c_void_p(NODE_VERTEX_DTYPE.fields[name][1]))
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.color_fields.nbytes, self.color_fields, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(COLOR_VALUE_LOCATION)
+        self._bound_field = None
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.lines.nbytes, self.lines, GL_STATIC_DRAW)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.light_probe = create_light_probe_texture()
+        self.type_colors = self._create1DTexture(TYPE_COLORS, GL_NEAREST)
+        self.colormap_texture = self._create1DTexture(self.colormap, GL_LINEAR)
+
+    def _create1DTexture(self, colors, interpolation):
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_1D, texture)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MIN_FILTER, interpolation)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MAG_FILTER, interpolation)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexImage1D(GL_TEXTURE_1D, 0, GL_RGBA32F, len(colors), 0, GL_RGBA, GL_FLOAT,
+                numpy.ascontiguousarray(colors, dtype=numpy.float32))
+        glBindTexture(GL_TEXTURE_1D, 0)
+        return texture
+
+    def setScalar(self, values, value_range=None):
+        '''
+        Per node values for colorBy = "scalar", mapped onto the colormap over
+        value_range, by default their full range. Uploads one float per node,
+        and no geometry.
+        '''
+        field = NODE_COLOR_FIELDS.index("scalar")
+        self.color_fields[field] = values
+        if value_range is None:
+            value_range = self._fieldRange(self.color_fields[field])
+        self.color_ranges["scalar"] = value_range
+        if self.cone_shader is not None:
+            row = self.color_fields[field]
+            glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+            glBufferSubData(GL_ARRAY_BUFFER, field * row.nbytes, row.nbytes, row)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def setColormap(self, colors):
+        "Replace the colormap with an Mx4 array of RGBA colors, in [0, 1]"
+        self.colormap = numpy.ascontiguousarray(colors, dtype=numpy.float32)
+        if self.cone_shader is not None:
+            glDeleteTextures([self.colormap_texture])
+            self.colormap_texture = self._create1DTexture(self.colormap, GL_LINEAR)
+
+    def _bindColorFieldGL(self):
+        "Point the colorValue attribute at the values of the current colorBy field"
+        field = self.colorBy if self.colorBy in NODE_COLOR_FIELDS else NODE_COLOR_FIELDS[0]
+        if field == self._bound_field:
+            return
+        offset = NODE_COLOR_FIELDS.index(field) * len(self.nodes) * 4 # float32 values
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+        glVertexAttribPointer(COLOR_VALUE_LOCATION, 1, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(offset))
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self._bound_field = field
+
+    def _checkConservativeDepth(self):
+        if self.conservativeDepth and not conservative_depth_supported():
+            raise RuntimeError("conservativeDepth needs GL 4.2 or GL_ARB_conservative_depth")
+
+    def sphereShader(self):
+        "Sphere program for the current hullStrategy, conservativeDepth, deferred and vertexPulling"
+        if self.hullStrategy not in HULL_STRATEGIES:
+            raise ValueError("Unknown hull strategy %r" % (self.hullStrategy,))
+        key = (self.hullStrategy, self.conservativeDepth, self.deferred)
+        shaders, create = self.sphere_shaders, sphere_shader330
+        if self.vertexPulling:
+            shaders, create = self.sphere_pull_shaders, sphere_pull_shader330
+        if key not in shaders:
+            self._checkConservativeDepth()
+            shaders[key] = create(*key)
+        return shaders[key]
+
+    def coneShader(self):
+        "Cone program for the current conservativeDepth, deferred and vertexPulling"
+        key = (self.conservativeDepth, self.deferred)
+        shaders, create = self.cone_shaders, cone_shader330
+        if self.vertexPulling:
+            shaders, create = self.cone_pull_shaders, cone_pull_shader330
+        elif key == (False, False):
+            return self.cone_shader
+        if key not in shaders:
+            self._checkConservativeDepth()
+            shaders[key] = create(*key)
+        return shaders[key]
+
+    def _createSorters(self):
+        self.sphere_sorter = DepthSorter(self.nodes['position'], self.nodes['radius'])
+        ends = self.nodes[self.lines]
+        position = ends['position'].astype(numpy.float64)
+        # Bounding sphere of each cone, about the middle of its axis
+        half_length = 0.5 * numpy.linalg.norm(position[:, 1] - position[:, 0], axis=1)
+        self.cone_sorter = DepthSorter(position.mean(axis=1),
+                half_length + ends['radius'].max(axis=1))
+
+    def _sortGL(self, modelViewMatrix):
+        '''
+        Sort spheres and cones front to back, upload the orders if they
+        changed, and bind the sorted element buffer. With vertexPulling,
+        the buffer holds cone indices in place of their line indices.
+        '''
+        if self.sphere_sorter is None:
+            self._createSorters()
+        changed = self.sphere_sorter.update(modelViewMatrix)
+        changed = self.cone_sorter.update(modelViewMatrix) or changed
+        if self.sorted_ibo is None:
+            self.sorted_ibo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.sorted_ibo)
+        if changed or self._sorted_pulled != self.vertexPulling:
+            cones = self.cone_sorter.order
+            if not self.vertexPulling:
+                cones = self.lines[cones].ravel()
+            indices = numpy.concatenate((self.sphere_sorter.order, cones))
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_DYNAMIC_DRAW)
+            self._sorted_pulled = self.vertexPulling
+
+    def _createBufferTexturesGL(self):
+        "Buffer textures over the node, color, line, cone and sorted buffers, for vertexPulling"
+        limit = int(glGetIntegerv(GL_MAX_TEXTURE_BUFFER_SIZE))
+        if max(self.color_fields.size, 2 * len(self.lines)) > limit:
+            raise RuntimeError("vertexPulling needs more than GL_MAX_TEXTURE_BUFFER_SIZE (%d) texels"
+                    % limit)
+        self.cone_vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.cone_vbo)
+        glBufferData(GL_ARRAY_BUFFER, len(self.lines) * CONE_TEXEL_DTYPE.itemsize, None, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self._cone_radius_key = None
+        if self.sorted_ibo is None:
+            self.sorted_ibo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.sorted_ibo)
+            glBufferData(GL_ARRAY_BUFFER, 4, None, GL_DYNAMIC_DRAW)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            self._sorted_pulled = None
+        self.buffer_textures = glGenTextures(len(PULL_TEXTURE_UNITS))
+        formats = (GL_RGBA32F, GL_R32F, GL_RG32UI, GL_RGBA32F, GL_R32UI)
+        buffers = (self.vbo, self.color_vbo, self.ibo, self.cone_vbo, self.sorted_ibo)
+        for texture, internal, buffer_id in zip(self.buffer_textures, formats, buffers):
+            glBindTexture(GL_TEXTURE_BUFFER, texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, internal, buffer_id)
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+    def _updateConeTexelsGL(self, modelViewMatrix):
+        '''
+        Upload cone_texels() for the current radiusScale and radiusOffset,
+        unless they are unchanged relative to the model view scale.
+        '''
+        # Cones join spheres of radius radiusOffset + radiusScale * radius in
+        # the camera frame, which are smaller in model coordinates by the
+        # scale of the model view matrix. ConesPullVrtx330.glsl scales back.
+        modelView = numpy.asarray(modelViewMatrix, dtype=numpy.float64).reshape(4, 4)
+        scale = numpy.linalg.norm(modelView[0, 0:3])
+        key = (self.radiusOffset / scale, self.radiusScale / scale)
+        if self._cone_radius_key is not None and numpy.allclose(
+                key, self._cone_radius_key, rtol=1e-5, atol=0):
+            return
+        texels = cone_texels(self.nodes['position'], key[0] + key[1] * self.nodes['radius'], self.lines)
+        glBindBuffer(GL_ARRAY_BUFFER, self.cone_vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, texels.nbytes, texels)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self._cone_radius_key = key
+
+    def _setUniforms(self, program, modelViewMatrix, projectionMatrix):
+        glUniformMatrix4fv(glGetUniformLocation(program, "modelViewMatrix"),
+                1, GL_FALSE, numpy.asarray(modelViewMatrix, dtype=numpy.float32))
+        glUniformMatrix4fv(glGetUniformLocation(program, "projectionMatrix"),
+                1, GL_FALSE, numpy.asarray(projectionMatrix, dtype=numpy.float32))
+        glUniform1f(glGetUniformLocation(program, "radiusScale"), self.radiusScale)
+        glUniform1f(glGetUniformLocation(program, "radiusOffset"), self.radiusOffset)
+        glUniform4f(glGetUniformLocation(program, "color"), *self.color)
+        glUniform1i(glGetUniformLocation(program, "lightProbe"), 0)
+        if self.colorBy == "uniform":
+            mode = COLOR_MODES["uniform"]
+        elif self.colorBy == "type":
+            mode = COLOR_MODES["type"]
+        elif self.colorBy in NODE_COLOR_FIELDS:
+            mode = COLOR_MODES["scalar"]
+        else:
+            raise ValueError("Unknown color field %r" % (self.colorBy,))
+        glUniform1i(glGetUniformLocation(program, "colorMode"), mode)
+        if mode == COLOR_MODES["scalar"]:
+            glUniform2f(glGetUniformLocation(program, "colorRange"), *self.color_ranges[self.colorBy])
+        glUniform1i(glGetUniformLocation(program, "typeColors"), 1)
+        glUniform1i(glGetUniformLocation(program, "colormap"), 2)
+
+    def _setPullUniforms(self, program, orderOffset):
+        "Uniforms of the vertexPulling programs; orderOffset is -1 to draw unsorted"
+        for name, unit in PULL_TEXTURE_UNITS:
+            glUniform1i(glGetUniformLocation(program, name), unit)
+        field = self._bound_field # the colorBy row, as for the colorValue attribute
+        glUniform1i(glGetUniformLocation(program, "colorValueOffset"),
+                NODE_COLOR_FIELDS.index(field) * len(self.nodes))
+        glUniform1i(glGetUniformLocation(program, "drawOrderOffset"), orderOffset)
+
+    def drawGL(self, modelViewMatrix, projectionMatrix):
+        '''
+        Draw all spheres, then all cones.
+
+        Matrices are 4x4 in OpenGL column-major order, as returned by
+        glGetFloatv(GL_MODELVIEW_MATRIX).
+        '''
+        if self.cone_shader is None:
+            self.initGL()
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_1D, self.type_colors)
+        glActiveTexture(GL_TEXTURE2)
+        glBindTexture(GL_TEXTURE_1D, self.colormap_texture)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.light_probe)
+        glBindVertexArray(self.vao)
+        self._bindColorFieldGL()
+        if self.vertexPulling:
+            self._drawPulledGL(modelViewMatrix, projectionMatrix)
+        else:
+            self._drawGeometryGL(modelViewMatrix, projectionMatrix)
+        glBindVertexArray(0)
+        glUseProgram(0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        for unit in (GL_TEXTURE2, GL_TEXTURE1):
+            glActiveTexture(unit)
+            glBindTexture(GL_TEXTURE_1D, 0)
+        glActiveTexture(GL_TEXTURE0)
+
+    def _drawGeometryGL(self, modelViewMatrix, projectionMatrix):
+        "Draw points and lines through the geometry shader programs"
+        cone_offset = None
+        if self.depthSort:
+            # The element buffer binding is part of the vertex array state
+            self._sortGL(modelViewMatrix)
+            cone_offset = ctypes.c_void_p(4 * len(self.nodes)) # after the uint32 sphere indices
+
+        if self.showSpheres:
+            sphere_shader = self.sphereShader()
+            glUseProgram(sphere_shader)
+            self._setUniforms(sphere_shader, modelViewMatrix, projectionMatrix)
+            if self.depthSort:
+                glDrawElements(GL_POINTS, len(self.nodes), GL_UNSIGNED_INT, None)
+            else:
+                glDrawArrays(GL_POINTS, 0, len(self.nodes))
+
+        if self.showCones and len(self.lines) > 0:
+            cone_shader = self.coneShader()
+            glUseProgram(cone_shader)
+            self._setUniforms(cone_shader, modelViewMatrix, projectionMatrix)
+            glDrawElements(GL_LINES, self.lines.size, GL_UNSIGNED_INT, cone_offset)
+
+        if self.depthSort:
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+
+    def _drawPulledGL(self, modelViewMatrix, projectionMatrix):
+        "Draw instanced triangle strips through the vertexPulling programs"
+        if self.buffer_textures is None:
+            self._createBufferTexturesGL()
+        sphere_order = cone_order = -1
+        if self.depthSort:
+            self._sortGL(modelViewMatrix)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+            sphere_order, cone_order = 0, len(self.nodes)
+        for (name, unit), texture in zip(PULL_TEXTURE_UNITS, self.buffer_textures):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_BUFFER, texture)
+
+        if self.showSpheres:
+            sphere_shader = self.sphereShader()
+            glUseProgram(sphere_shader)
+            self._setUniforms(sphere_shader, modelViewMatrix, projectionMatrix)
+            self._setPullUniforms(sphere_shader, sphere_order)
+            hull = "near" if self.conservativeDepth else self.hullStrategy
+            glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, SPHERE_PULL_STRIP_LENGTHS[hull], len(self.nodes))
+
+        if self.showCones and len(self.lines) > 0:
+            self._updateConeTexelsGL(modelViewMatrix)
+            cone_shader = self.coneShader()
+            glUseProgram(cone_shader)
+            self._setUniforms(cone_shader, modelViewMatrix, projectionMatrix)
+            self._setPullUniforms(cone_shader, cone_order)
+            glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, CONE_PULL_STRIP_LENGTH, len(self.lines))
+
+        for name, unit in reversed(PULL_TEXTURE_UNITS):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_BUFFER, 0)
+        glActiveTexture(GL_TEXTURE0)
+
+    def deleteGL(self):
+        if self.cone_shader is None:
+            return
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(3, [self.vbo, self.ibo, self.color_vbo])
+        if self.sorted_ibo is not None:
+            glDeleteBuffers(1, [self.sorted_ibo])
+            self.sorted_ibo = None
+        self.sphere_sorter = self.cone_sorter = None
+        self._sorted_pulled = None
+        if self.buffer_textures is not None:
+            glDeleteTextures(self.buffer_textures)
+            glDeleteBuffers(1, [self.cone_vbo])
+            self.buffer_textures = self.cone_vbo = self._cone_radius_key = None
+        glDeleteTextures([self.light_probe, self.type_colors, self.colormap_texture])
+        # Programs are shared through the ShaderManager, so are not deleted here
+        self.sphere_shaders = {}
+        self.cone_shader = None
+        self.cone_shaders = {}
+        self.sphere_pull_shaders = {}
+        self.cone_pull_shaders = {}
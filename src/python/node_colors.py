@@ -0,0 +1,92 @@
+'''
+Per node values and color tables for coloring neurons in the shader.
+
+node_color_fields() computes, once per neuron, every per node value that a
+renderer may color by. Renderers upload all of them together with the
+geometry, and node_color330.glsl turns the selected value into a color,
+either through a table of SWC type colors or through a colormap texture,
+so that changing the coloring never touches the geometry.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+
+from swc import path_sums
+
+
+# Values of the colorMode uniform in node_color330.glsl
+COLOR_MODES = {
+        "uniform": 0, # one color for every node
+        "type": 1, # SWC type, through TYPE_COLORS
+        "scalar": 2, } # any other field, through a colormap
+
+# Per node values available for coloring, in the order node_color_fields() stores them
+NODE_COLOR_FIELDS = (
+        "type", # SWC structure identifier
+        "distance", # path length from the root of the tree
+        "order", # number of branch points between a node and the root
+        "scalar", ) # user supplied, for example from an analysis
+
+# RGBA color of each standard SWC type, indexed by type, as in Vaa3D
+TYPE_COLORS = numpy.array([
+        [1.0, 1.0, 1.0, 1.0], # undefined: white
+        [0.1, 0.1, 0.1, 1.0], # soma: black
+        [1.0, 0.0, 0.0, 1.0], # axon: red
+        [0.0, 0.0, 1.0, 1.0], # basal dendrite: blue
+        [1.0, 0.0, 1.0, 1.0], # apical dendrite: magenta
+        [0.0, 1.0, 1.0, 1.0], # fork point: cyan
+        [1.0, 1.0, 0.0, 1.0], # end point: yellow
+        [0.0, 1.0, 0.0, 1.0], # custom: green
+        ], dtype=numpy.float32)
+
+# Anchor colors of the default colormap, evenly spaced (matplotlib's viridis)
+_VIRIDIS = numpy.array([
+        [0.267, 0.005, 0.329],
+        [0.229, 0.322, 0.546],
+        [0.128, 0.567, 0.551],
+        [0.369, 0.789, 0.383],
+        [0.993, 0.906, 0.144], ])
+
+
+def default_colormap(size=256):
+    "size x 4 float32 RGBA colormap, interpolated from a few anchors of viridis"
+    t = numpy.linspace(0.0, 1.0, size)
+    anchors = numpy.linspace(0.0, 1.0, len(_VIRIDIS))
+    result = numpy.ones((size, 4), dtype=numpy.float32)
+    for channel in range(3):
+        result[:, channel] = numpy.interp(t, anchors, _VIRIDIS[:, channel])
+    return result
+
+
+def path_distance(xyz, parent):
+    "Length of the path from each node to the root of its tree"
+    parent = numpy.asarray(parent)
+    xyz = numpy.asarray(xyz, dtype=numpy.float64)
+    has_parent = parent >= 0
+    step = numpy.zeros(len(parent))
+    step[has_parent] = numpy.linalg.norm(xyz[has_parent] - xyz[parent[has_parent]], axis=1)
+    return path_sums(parent, step)
+
+
+def branch_order(parent):
+    "Number of branch points strictly between each node and the root of its tree, root excluded"
+    parent = numpy.asarray(parent)
+    has_parent = parent >= 0
+    child_count = numpy.bincount(parent[has_parent], minlength=len(parent))
+    # A node starts a new branch when its parent has more than one child
+    starts_branch = numpy.zeros(len(parent), dtype=numpy.int64)
+    starts_branch[has_parent] = child_count[parent[has_parent]] > 1
+    return path_sums(parent, starts_branch)
+
+
+def node_color_fields(neuron, scalar=None):
+    "len(NODE_COLOR_FIELDS) x N float32 array of per node values of an SwcNeuron"
+    result = numpy.zeros((len(NODE_COLOR_FIELDS), len(neuron)), dtype=numpy.float32)
+    result[0] = neuron.type
+    result[1] = path_distance(neuron.xyz, neuron.parent)
+    result[2] = branch_order(neuron.parent)
+    if scalar is not None:
+        result[3] = scalar
+    return result
@@ -0,0 +1,113 @@
+'''
+Windowless OpenGL contexts, for rendering and timing without a display or GPU.
+
+Uses Mesa through EGL (surfaceless platform) by default, or OSMesa when
+PYOPENGL_PLATFORM=osmesa is set. Either way Mesa falls back to the llvmpipe
+software rasterizer when no GPU is present.
+
+NOTE: PyOpenGL chooses its platform when OpenGL is first imported, so this
+module must be imported before OpenGL.GL, or PYOPENGL_PLATFORM must be set
+in the environment.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import ctypes
+import os
+
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+if os.environ["PYOPENGL_PLATFORM"] == "egl":
+    os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+from OpenGL.GL import *
+from OpenGL import arrays
+import numpy
+
+
+class OffscreenContext(object):
+    "OpenGL context rendering into a framebuffer object, with no window"
+    def __init__(self, width=640, height=480):
+        self.width = width
+        self.height = height
+        self.platform = os.environ["PYOPENGL_PLATFORM"]
+        if self.platform == "osmesa":
+            self._createOsMesa()
+        else:
+            self._createEgl()
+        self._createFramebuffer()
+
+    def _createEgl(self):
+        from OpenGL import EGL
+        self._egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("Could not initialize EGL display")
+        attributes = (EGL.EGLint * 5)(
+                EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count))
+        if count.value < 1:
+            raise RuntimeError("No desktop OpenGL EGL configuration available")
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        if not self.context:
+            raise RuntimeError("Could not create EGL context")
+        # Surfaceless: all rendering goes to our own framebuffer object
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context)
+
+    def _createOsMesa(self):
+        from OpenGL import osmesa
+        self._osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("Could not create OSMesa context")
+        # OSMesa needs a client-side color buffer, even though we draw into an FBO
+        self._osmesaBuffer = arrays.GLubyteArray.zeros((self.height, self.width, 4))
+        osmesa.OSMesaMakeCurrent(self.context, self._osmesaBuffer, GL_UNSIGNED_BYTE,
+                self.width, self.height)
+
+    def _createFramebuffer(self):
+        self.framebuffer = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        self.colorBuffer, self.depthBuffer = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.colorBuffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, self.width, self.height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.colorBuffer)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depthBuffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, self.width, self.height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depthBuffer)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Offscreen framebuffer incomplete: 0x%x" % status)
+        glViewport(0, 0, self.width, self.height)
+
+    def renderer(self):
+        "GL_RENDERER string, e.g. to confirm that llvmpipe is in use"
+        return glGetString(GL_RENDERER).decode()
+
+    def readPixels(self):
+        "Current color buffer contents, as a height x width x 4 uint8 array, top row first"
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffer)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
+        image = numpy.frombuffer(data, dtype=numpy.uint8).reshape(self.height, self.width, 4)
+        return image[::-1]
+
+    def finish(self):
+        "Block until all issued commands have completed, so that timings are meaningful"
+        glFinish()
+
+    def destroy(self):
+        glDeleteRenderbuffers(2, [self.colorBuffer, self.depthBuffer])
+        glDeleteFramebuffers(1, [self.framebuffer])
+        if self.platform == "osmesa":
+            self._osmesa.OSMesaDestroyContext(self.context)
+        else:
+            EGL = self._egl
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
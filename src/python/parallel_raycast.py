@@ -0,0 +1,145 @@
+'''
+Tile-parallel headless rendering of imposters on a multiprocessing pool.
+
+The parent process transforms and bins all primitives into screen tiles
+once, exactly as CpuImposterRenderer does, and places every primitive array,
+the tile bins and the depth, normal and color buffers in shared memory.
+Worker processes map those arrays without copying, and each ray casts whole
+tiles, most expensive first. Tiles never overlap, so each worker depth
+tests straight into its own pixels of the shared buffers, and the finished
+buffers are already the composited image.
+
+Example:
+    python parallel_raycast.py --processes 64 neuron.swc thumbnail.png
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import ctypes
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import time
+
+import numpy
+
+from cpu_raycast import CpuImposterRenderer, RaycastImage, DEFAULT_MAX_PAIRS
+from cpu_raycast import fit_camera, write_png
+
+
+PARALLEL_TILE_SIZE = 32 # smaller than DEFAULT_TILE_SIZE, for load balance
+
+_CTYPES = {
+        numpy.dtype(numpy.float64): ctypes.c_double,
+        numpy.dtype(numpy.int64): ctypes.c_int64, }
+
+
+def share_array(array):
+    "Copy an array into new shared memory; returns a picklable (raw array, dtype, shape) handle"
+    array = numpy.asarray(array)
+    dtype = numpy.dtype(numpy.float64) if array.dtype.kind == 'f' else numpy.dtype(numpy.int64)
+    raw = RawArray(_CTYPES[dtype], max(1, array.size))
+    shared_view((raw, dtype.str, array.shape))[...] = array
+    return (raw, dtype.str, array.shape)
+
+
+def shared_view(handle):
+    "NumPy view of shared memory from share_array(), without copying"
+    raw, dtype, shape = handle
+    count = int(numpy.prod(shape)) if len(shape) > 0 else 1
+    return numpy.frombuffer(raw, dtype=dtype, count=count).reshape(shape)
+
+
+def _share_scene(scene):
+    return [dict((key, share_array(value) if isinstance(value, numpy.ndarray) else value)
+            for key, value in primitives.items()) for primitives in scene]
+
+
+def _map_scene(shared_scene):
+    return [dict((key, shared_view(value) if isinstance(value, tuple) else value)
+            for key, value in primitives.items()) for primitives in shared_scene]
+
+
+def _map_image(width, height, shared_buffers):
+    image = RaycastImage(width, height)
+    image.depth, image.normal, image.color = [shared_view(handle) for handle in shared_buffers]
+    return image
+
+
+# State of each worker process, set once by _init_worker()
+_worker = {}
+
+
+def _init_worker(settings, shared_scene, shared_buffers):
+    width, height, tile_size, max_pairs, modelViewMatrix, projectionMatrix = settings
+    renderer = CpuImposterRenderer(width, height, tile_size, max_pairs)
+    renderer.setCamera(modelViewMatrix, projectionMatrix)
+    _worker['renderer'] = renderer
+    _worker['scene'] = _map_scene(shared_scene)
+    _worker['image'] = _map_image(width, height, shared_buffers)
+
+
+def _render_tile(tile_index):
+    return _worker['renderer'].renderTile(_worker['image'], tile_index, _worker['scene'])
+
+
+class ParallelImposterRenderer(CpuImposterRenderer):
+    "CpuImposterRenderer that ray casts tiles on a pool of worker processes"
+    def __init__(self, width, height, processes=None, tile_size=PARALLEL_TILE_SIZE,
+            max_pairs=DEFAULT_MAX_PAIRS):
+        CpuImposterRenderer.__init__(self, width, height, tile_size, max_pairs)
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+
+    def render(self):
+        "Ray cast every tile in parallel, returning a RaycastImage"
+        if self.processes <= 1:
+            return CpuImposterRenderer.render(self)
+        scene = self.prepare()
+        image = RaycastImage(self.width, self.height, self.background)
+        shared_buffers = [share_array(buffer) for buffer in (image.depth, image.normal, image.color)]
+        image = _map_image(self.width, self.height, shared_buffers)
+        # Largest tiles first, so that no worker starts a long tile last
+        costs = [self.tileCost(scene, tile_index) for tile_index in range(len(self.tiles()))]
+        order = [int(i) for i in numpy.argsort(costs, kind='mergesort')[::-1] if costs[i] > 0]
+        settings = (self.width, self.height, self.tile_size, self.max_pairs,
+                self.modelViewMatrix, self.projectionMatrix)
+        pool = multiprocessing.Pool(self.processes, _init_worker,
+                (settings, _share_scene(scene), shared_buffers))
+        self.pair_count = 0
+        try:
+            for pair_count in pool.imap_unordered(_render_tile, order):
+                self.pair_count += pair_count
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return image
+
+
+def main():
+    from swc import load_swc
+    parser = argparse.ArgumentParser(
+            description="Render an SWC file to a PNG thumbnail on all cores, without a GPU")
+    parser.add_argument("swc_file")
+    parser.add_argument("png_file")
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+    t0 = time.time()
+    neuron = load_swc(args.swc_file)
+    renderer = ParallelImposterRenderer(args.size, args.size, args.processes)
+    renderer.addNeuron(neuron)
+    fit_camera(renderer, neuron.xyz, neuron.radius)
+    image = renderer.render()
+    write_png(args.png_file, image.rgba8())
+    print("%s: %d nodes, %d processes, %.2f s" % (
+            args.png_file, len(neuron), renderer.processes, time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
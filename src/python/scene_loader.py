@@ -0,0 +1,195 @@
+'''
+Background loading of many SWC files into one shared set of imposter buffers.
+
+SceneLoader parses files on a multiprocessing pool, through the swc_cache
+sidecars, so that worker processes do the text parsing and cone parameter
+computation while the main process keeps drawing. Each poll() picks up the
+neurons that have finished, in whatever order they finish, and appends
+their hull vertices to two GrowingVboSets shared by the whole scene. The
+first frame can therefore be drawn at once, and neurons appear as they
+arrive instead of after the slowest file.
+
+All neurons are placed with the same transform, chosen from the first
+neuron to arrive unless given, so that neurons from one brain keep their
+relative positions.
+
+Example:
+    python scene_loader.py --processes 8 *.swc
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import argparse
+import multiprocessing
+import time
+
+import numpy
+
+from swc_cache import load_swc_cached
+from imposter_geometry import neuron_cone_parameters, transform_cones
+from imposter_geometry import sphere_hull_vertices, cone_hull_vertices
+from imposter_vbo import GrowingVboSet
+
+
+def neuron_fit(neuron):
+    "Center and scale factor to shrink a neuron to fit near the origin"
+    lo = (neuron.xyz - neuron.radius[:, None]).min(axis=0)
+    hi = (neuron.xyz + neuron.radius[:, None]).max(axis=0)
+    scale = 4.0 / max(numpy.linalg.norm(hi - lo), 1e-6)
+    return 0.5 * (lo + hi), scale
+
+
+def _load_neuron(job):
+    "Worker side: parse one file and compute its cone parameters"
+    index, file_name = job
+    try:
+        neuron = load_swc_cached(file_name)
+        # Cones travel back with the neuron, so the main process skips them.
+        # Memory mapped arrays are copied when pickled, so send plain arrays.
+        edges, cones = neuron_cone_parameters(neuron)
+        neuron.nodes = numpy.array(neuron.nodes)
+        neuron.edge_cones = (numpy.array(edges), numpy.array(cones))
+        return index, neuron, None
+    except Exception as exc:
+        return index, None, "%s: %s" % (file_name, exc)
+
+
+class SceneLoader(object):
+    "Loads SWC files in parallel, adding each neuron to shared sphere and cone buffers as it arrives"
+    def __init__(self, file_names, processes=None, center=None, scale=None):
+        '''
+        processes is the size of the worker pool, by default one per core;
+        with processes=0 each poll() loads one file in the calling process.
+        center and scale place every neuron, as in neuron_fit(); by
+        default they are taken from the first neuron loaded.
+        '''
+        self.file_names = list(file_names)
+        self.center = center
+        self.scale = scale
+        self.spheres = GrowingVboSet()
+        self.cones = GrowingVboSet()
+        self.neurons = [None] * len(self.file_names) # in file order, None until loaded
+        self.sphere_ranges = [None] * len(self.file_names) # (start, stop) within self.spheres
+        self.cone_ranges = [None] * len(self.file_names)
+        self.errors = [] # one message per file that failed to load
+        self.arrival_order = [] # file indices, in the order their neurons were added
+        self.start_time = time.time()
+        self.first_arrival_time = None # seconds from start to the first neuron
+        jobs = list(enumerate(self.file_names))
+        self.pool = None
+        self.results = None
+        self.serial_jobs = jobs # files still to load in poll(), without a pool
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes > 0 and len(jobs) > 0:
+            self.pool = multiprocessing.Pool(min(processes, len(jobs)))
+            # One file per task, so that results stream back as each one finishes
+            self.results = self.pool.imap_unordered(_load_neuron, jobs, 1)
+            self.serial_jobs = []
+
+    def __len__(self):
+        "Number of files, loaded or not"
+        return len(self.file_names)
+
+    def done(self):
+        "True once every file has either been added or failed"
+        return len(self.arrival_order) + len(self.errors) == len(self.file_names)
+
+    def _next(self, timeout):
+        if self.pool is None:
+            return _load_neuron(self.serial_jobs.pop(0))
+        try:
+            return self.results.next(timeout)
+        except multiprocessing.TimeoutError:
+            return None
+
+    def poll(self, limit=None, timeout=0):
+        '''
+        Add neurons whose loading has finished, without waiting for others.
+
+        Adds at most limit neurons, so that a caller drawing frames can cap
+        the work done per frame. timeout is how long to wait for the first
+        result, in seconds, or None to wait until one arrives. Returns the
+        file indices of the neurons added.
+        '''
+        added = []
+        while not self.done() and (limit is None or len(added) < limit):
+            result = self._next(timeout if len(added) == 0 else 0)
+            if result is None:
+                break
+            index, neuron, error = result
+            if error is not None:
+                self.errors.append(error)
+                continue
+            self.addNeuron(index, neuron)
+            added.append(index)
+        if self.done():
+            self.close()
+        return added
+
+    def wait(self):
+        "Block until every file has been loaded"
+        while not self.done():
+            self.poll(timeout=None)
+
+    def addNeuron(self, index, neuron):
+        "Append the imposters of one loaded neuron to the shared buffers"
+        if self.first_arrival_time is None:
+            self.first_arrival_time = time.time() - self.start_time
+        if self.center is None or self.scale is None:
+            self.center, self.scale = neuron_fit(neuron)
+        xyz = (neuron.xyz - self.center) * self.scale
+        edges, cones = neuron_cone_parameters(neuron)
+        cones = transform_cones(cones, self.center, self.scale)
+        self.sphere_ranges[index] = self.spheres.append(
+                sphere_hull_vertices(xyz, neuron.radius * self.scale))
+        self.cone_ranges[index] = self.cones.append(cone_hull_vertices(cones))
+        self.neurons[index] = neuron
+        self.arrival_order.append(index)
+
+    def loadedNeurons(self):
+        "Neurons added so far, in the order they arrived"
+        return [self.neurons[index] for index in self.arrival_order]
+
+    def drawSpheresGL(self):
+        "Draw the spheres of all neurons added so far; the caller binds sphere_shader first"
+        self.spheres.drawGL()
+
+    def drawConesGL(self):
+        "Draw the cones of all neurons added so far; the caller binds cone_shader first"
+        self.cones.drawGL()
+
+    def close(self):
+        "Stop the worker processes"
+        if self.pool is not None:
+            if self.done():
+                self.pool.close()
+            else:
+                self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def deleteGL(self):
+        self.spheres.deleteGL()
+        self.cones.deleteGL()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Measure time to first neuron and total time to load many SWC files")
+    parser.add_argument("swc_files", nargs="+")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+    loader = SceneLoader(args.swc_files, args.processes)
+    loader.wait()
+    total = time.time() - loader.start_time
+    print("%d neurons, %d spheres, %d cones; first neuron after %.3f s, all after %.3f s" % (
+            len(loader.arrival_order), len(loader.spheres), len(loader.cones),
+            loader.first_arrival_time or 0.0, total))
+    for error in loader.errors:
+        print(error)
+
+
+if __name__ == "__main__":
+    main()
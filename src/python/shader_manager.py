@@ -0,0 +1,209 @@
+'''
+Shader source and program caching.
+
+ShaderManager reads each GLSL file once, expands #include "file.glsl"
+directives, compiles each distinct source once per shader stage so that
+shared function files such as imposter_fns120.glsl are attached to many
+programs as the same shader object, and keeps linked program binaries on
+disk so that later launches skip compilation entirely.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import ctypes
+import hashlib
+import os
+import re
+import struct
+
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+from OpenGL.raw.GL.VERSION.GL_4_1 import glGetProgramBinary as raw_glGetProgramBinary
+from OpenGL.raw.GL.VERSION.GL_4_1 import glProgramBinary as raw_glProgramBinary
+import numpy
+
+
+GLSL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "glsl")
+
+_INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s+"([^"]+)"\s*$', re.MULTILINE)
+_VERSION_PATTERN = re.compile(r'^\s*#\s*version\b.*$', re.MULTILINE)
+
+_STAGE_NAMES = {
+        GL_VERTEX_SHADER: "vertex",
+        GL_GEOMETRY_SHADER: "geometry",
+        GL_FRAGMENT_SHADER: "fragment", }
+
+
+def default_cache_dir():
+    "Directory for program binaries, overridable with SWCIMPOSTERS_SHADER_CACHE"
+    path = os.environ.get("SWCIMPOSTERS_SHADER_CACHE")
+    if path is not None:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "swcimposters", "programs")
+
+
+def insert_defines(source, defines):
+    "Add #define lines for each (name, value) in defines, just after the #version line"
+    if not defines:
+        return source
+    lines = ["#define %s %s" % (name, value) for name, value in sorted(defines.items())]
+    head, newline, tail = source.partition("\n")
+    if not head.startswith("#version"):
+        return "\n".join(lines) + "\n" + source
+    return head + "\n" + "\n".join(lines) + "\n" + tail
+
+
+def _hash(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ShaderManager(object):
+    "Per-context cache of GLSL sources, compiled shader objects and linked programs"
+    def __init__(self, glsl_path=GLSL_PATH, cache_dir=None, use_binary_cache=True):
+        self.glsl_path = glsl_path
+        if cache_dir is None and use_binary_cache:
+            cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+        self._sources = {} # file name -> expanded text
+        self._shaders = {} # (source hash, stage) -> shader object
+        self._programs = {} # program key -> program object
+        self._driver = None
+        # Counters, for checking how much work startup really did
+        self.compile_count = 0
+        self.link_count = 0
+        self.binary_load_count = 0
+
+    def source(self, file_name):
+        "Contents of a GLSL file, with #include directives expanded; read from disk only once"
+        if file_name not in self._sources:
+            self._sources[file_name] = self._expandIncludes(file_name, [])
+        return self._sources[file_name]
+
+    def _expandIncludes(self, file_name, stack):
+        if file_name in stack:
+            raise ValueError("Recursive #include of %s via %s" % (file_name, " -> ".join(stack)))
+        with open(os.path.join(self.glsl_path, file_name), "r") as glsl_file:
+            text = glsl_file.read()
+        def include(match):
+            included = self._expandIncludes(match.group(1), stack + [file_name])
+            # Only the outermost file may declare a #version
+            return _VERSION_PATTERN.sub("", included, count=1)
+        return _INCLUDE_PATTERN.sub(include, text)
+
+    def shader(self, source, stage):
+        "Compiled shader object for one stage; identical sources are compiled only once"
+        key = (_hash(source), stage)
+        if key not in self._shaders:
+            self._shaders[key] = shaders.compileShader(source, stage)
+            self.compile_count += 1
+        return self._shaders[key]
+
+    def driver(self):
+        "Identifies the OpenGL implementation that program binaries are valid for"
+        if self._driver is None:
+            self._driver = "|".join(glGetString(name).decode() for name in (
+                    GL_VENDOR, GL_RENDERER, GL_VERSION, GL_SHADING_LANGUAGE_VERSION))
+        return self._driver
+
+    def program(self, stages):
+        '''
+        Linked program for a sequence of (source text, stage) pairs.
+
+        Returns a cached program if one exists for the same sources in this
+        context, otherwise loads the program binary from the disk cache, and
+        only compiles and links if neither is available.
+        '''
+        stages = tuple(stages)
+        key = _hash(self.driver(), *[_hash(source, stage) for source, stage in stages])
+        if key in self._programs:
+            return self._programs[key]
+        program = self._loadBinary(key)
+        if program is None:
+            program = self._link(stages)
+            self._saveBinary(key, program)
+        self._programs[key] = program
+        return program
+
+    def programFromFiles(self, stages, defines=None):
+        "Linked program for a sequence of (file name, stage) pairs, with optional #defines"
+        return self.program([(insert_defines(self.source(file_name), defines), stage)
+                for file_name, stage in stages])
+
+    def _link(self, stages):
+        program = glCreateProgram()
+        for source, stage in stages:
+            glAttachShader(program, self.shader(source, stage))
+        if self.cache_dir is not None:
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glLinkProgram(program)
+        self.link_count += 1
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            log = glGetProgramInfoLog(program)
+            glDeleteProgram(program)
+            raise shaders.ShaderLinkError("Link failure (%s): %s" % (
+                    ", ".join(_STAGE_NAMES.get(stage, str(stage)) for source, stage in stages), log))
+        return program
+
+    def _binaryPath(self, key):
+        return os.path.join(self.cache_dir, key + ".bin")
+
+    def _loadBinary(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._binaryPath(key), "rb") as binary_file:
+                data = binary_file.read()
+        except (IOError, OSError):
+            return None
+        if len(data) < 4:
+            return None
+        binary_format = struct.unpack("<I", data[:4])[0]
+        binary = numpy.frombuffer(data, dtype=numpy.uint8, offset=4)
+        program = glCreateProgram()
+        raw_glProgramBinary(program, binary_format,
+                binary.ctypes.data_as(ctypes.c_void_p), len(binary))
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            # Driver rejected the binary, e.g. after an update; rebuild from source
+            glDeleteProgram(program)
+            return None
+        self.binary_load_count += 1
+        return program
+
+    def _saveBinary(self, key, program):
+        if self.cache_dir is None:
+            return
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if length <= 0:
+            return # driver does not support program binaries
+        binary = numpy.zeros(length, dtype=numpy.uint8)
+        written = ctypes.c_int(0)
+        binary_format = ctypes.c_uint(0)
+        raw_glGetProgramBinary(program, length, ctypes.byref(written),
+                ctypes.byref(binary_format), binary.ctypes.data_as(ctypes.c_void_p))
+        if written.value <= 0:
+            return
+        path = self._binaryPath(key)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # Write then rename, so concurrent launches never read a partial file
+            temp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(temp_path, "wb") as binary_file:
+                binary_file.write(struct.pack("<I", binary_format.value))
+                binary_file.write(binary[:written.value].tobytes())
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            pass # the cache is only an optimization
+
+    def clear(self):
+        "Forget all GL objects, e.g. after the context they belong to is destroyed"
+        self._shaders = {}
+        self._programs = {}
@@ -0,0 +1,205 @@
+'''
+Bounding volume hierarchy over imposter primitives, for view frustum culling.
+
+Primitives are sorted along a Morton (Z-order) curve of their bounding box
+centers and grouped into leaves of leaf_size consecutive primitives. A
+complete binary tree of axis aligned boxes is then built bottom up, one
+vectorized pass per level. Renderers store their primitives in the sorted
+order, so that every visible leaf is a contiguous range of the vertex
+buffer, and culling produces a short list of ranges to draw.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+
+
+DEFAULT_LEAF_SIZE = 64 # primitives per leaf
+MORTON_BITS = 10 # per axis, for a 30 bit sort key
+
+
+def frustum_planes(modelViewMatrix, projectionMatrix):
+    '''
+    The six planes of the view frustum, in model coordinates, as a 6x4 array.
+
+    Matrices are 4x4 in OpenGL column-major order, as returned by
+    glGetFloatv(GL_MODELVIEW_MATRIX). Each row (a, b, c, d) is normalized so
+    that a*x + b*y + c*z + d is the signed distance of a point inside the
+    frustum from that plane.
+    '''
+    modelView = numpy.asarray(modelViewMatrix, dtype=numpy.float64).reshape(4, 4)
+    projection = numpy.asarray(projectionMatrix, dtype=numpy.float64).reshape(4, 4)
+    # Arrays from OpenGL are transposed, so this is the transpose of projection * modelView
+    clip = numpy.dot(modelView, projection).T
+    planes = numpy.array([
+            clip[3] + clip[0], # left
+            clip[3] - clip[0], # right
+            clip[3] + clip[1], # bottom
+            clip[3] - clip[1], # top
+            clip[3] + clip[2], # near
+            clip[3] - clip[2], ]) # far
+    return planes / numpy.linalg.norm(planes[:, 0:3], axis=1)[:, None]
+
+
+def _spread_bits(x):
+    "Insert two zero bits between each of the low ten bits of x"
+    x = x.astype(numpy.uint32) & 0x3ff
+    x = (x | (x << 16)) & 0x030000ff
+    x = (x | (x << 8)) & 0x0300f00f
+    x = (x | (x << 4)) & 0x030c30c3
+    x = (x | (x << 2)) & 0x09249249
+    return x
+
+
+def morton_codes(points, lo=None, hi=None):
+    '''
+    30 bit Z-order curve keys for Nx3 points, quantized within the box (lo, hi).
+
+    The box defaults to the bounds of the finite points. Points with a
+    non-finite coordinate, such as the centers of degenerate cones, get key 0.
+    '''
+    points = numpy.asarray(points, dtype=numpy.float64)
+    finite = numpy.all(numpy.isfinite(points), axis=1)
+    bounded = points[finite] if numpy.any(finite) else numpy.zeros((1, 3))
+    if lo is None:
+        lo = bounded.min(axis=0)
+    if hi is None:
+        hi = bounded.max(axis=0)
+    extent = numpy.maximum(numpy.asarray(hi) - lo, 1e-30)
+    cells = (1 << MORTON_BITS) - 1
+    q = numpy.clip((points - lo) / extent * cells, 0, cells)
+    q[~finite] = 0
+    return (_spread_bits(q[:, 0]) << 2) | (_spread_bits(q[:, 1]) << 1) | _spread_bits(q[:, 2])
+
+
+class BoundingVolumeHierarchy(object):
+    "Complete binary tree of axis aligned boxes over primitives in Morton order"
+    def __init__(self, lo, hi, leaf_size=DEFAULT_LEAF_SIZE):
+        '''
+        lo and hi are Nx3 arrays of primitive bounding box corners, for
+        example from sphere_bounds() or cone_bounds().
+
+        After construction, self.order holds the permutation that sorts the
+        primitives into leaf order; primitive ranges returned by cull()
+        index into lo[self.order].
+
+        Primitives with a non-finite bound, such as cones between nested
+        spheres from cone_parameters(), would spread NaN boxes up to the
+        root. They are kept out of the tree instead, at the end of the leaf
+        order from self.tree_size on, and cull() always returns them.
+        '''
+        lo = numpy.asarray(lo, dtype=numpy.float64)
+        hi = numpy.asarray(hi, dtype=numpy.float64)
+        self.leaf_size = leaf_size
+        self.size = len(lo)
+        finite = numpy.all(numpy.isfinite(lo) & numpy.isfinite(hi), axis=1)
+        codes = numpy.zeros(self.size, dtype=numpy.uint32)
+        codes[finite] = morton_codes(0.5 * (lo[finite] + hi[finite]))
+        self.order = numpy.lexsort((codes, ~finite))
+        self.tree_size = int(numpy.count_nonzero(finite))
+        if self.tree_size == 0:
+            self.levels = []
+            return
+        lo = lo[self.order[:self.tree_size]]
+        hi = hi[self.order[:self.tree_size]]
+        starts = numpy.arange(0, self.tree_size, leaf_size)
+        leaf_lo = numpy.minimum.reduceat(lo, starts, axis=0)
+        leaf_hi = numpy.maximum.reduceat(hi, starts, axis=0)
+        # Pad to a power of two leaves, repeating the last leaf box; the
+        # padding leaves hold no primitives, so they never produce draws.
+        self.depth = int(numpy.ceil(numpy.log2(len(starts)))) if len(starts) > 1 else 0
+        padding = (1 << self.depth) - len(starts)
+        if padding > 0:
+            leaf_lo = numpy.concatenate([leaf_lo, numpy.repeat(leaf_lo[-1:], padding, axis=0)])
+            leaf_hi = numpy.concatenate([leaf_hi, numpy.repeat(leaf_hi[-1:], padding, axis=0)])
+        # levels[0] is the root, levels[depth] the leaves; children of node i are 2i and 2i+1
+        self.levels = [(leaf_lo, leaf_hi)]
+        while len(self.levels[0][0]) > 1:
+            child_lo, child_hi = self.levels[0]
+            self.levels.insert(0, (
+                    numpy.minimum(child_lo[0::2], child_lo[1::2]),
+                    numpy.maximum(child_hi[0::2], child_hi[1::2])))
+
+    def __len__(self):
+        return self.size
+
+    def cull(self, planes, margin=0.0):
+        '''
+        Primitive ranges whose leaf boxes intersect the convex volume bounded by planes.
+
+        planes is a Px4 array of normalized planes, as from frustum_planes().
+        margin grows every box, for example to allow for radii enlarged in a
+        shader. Returns sorted (starts, stops) arrays of primitive indices in
+        leaf order, with adjacent ranges merged.
+        '''
+        if self.size == 0:
+            empty = numpy.empty(0, dtype=numpy.int64)
+            return empty, empty
+        planes = numpy.asarray(planes, dtype=numpy.float64)
+        normals = planes[:, 0:3]
+        extent_weights = numpy.abs(normals).T
+        # leaf index ranges, one pair of arrays per tree level
+        accepted_lo = [numpy.empty(0, dtype=numpy.int64)]
+        accepted_hi = [numpy.empty(0, dtype=numpy.int64)]
+        nodes = numpy.zeros(1, dtype=numpy.int64)
+        for level, (level_lo, level_hi) in enumerate(self.levels):
+            if len(nodes) == 0:
+                break
+            center = 0.5 * (level_lo[nodes] + level_hi[nodes])
+            half = 0.5 * (level_hi[nodes] - level_lo[nodes]) + margin
+            distance = numpy.dot(center, normals.T) + planes[:, 3]
+            reach = numpy.dot(half, extent_weights)
+            outside = numpy.any(distance < -reach, axis=1)
+            inside = numpy.all(distance >= reach, axis=1)
+            leaves_per_node = 1 << (self.depth - level)
+            if level == self.depth:
+                done = ~outside
+            else:
+                done = inside
+            accepted_lo.append(nodes[done] * leaves_per_node)
+            accepted_hi.append((nodes[done] + 1) * leaves_per_node)
+            split = nodes[~(outside | done)]
+            nodes = numpy.empty(2 * len(split), dtype=numpy.int64)
+            nodes[0::2] = 2 * split
+            nodes[1::2] = 2 * split + 1
+        leaf_lo = numpy.concatenate(accepted_lo)
+        leaf_hi = numpy.concatenate(accepted_hi)
+        starts = numpy.minimum(leaf_lo * self.leaf_size, self.tree_size)
+        stops = numpy.minimum(leaf_hi * self.leaf_size, self.tree_size)
+        # Primitives outside the tree cannot be culled, so are always drawn
+        return merge_ranges(numpy.append(starts, self.tree_size), numpy.append(stops, self.size))
+
+
+def merge_ranges(starts, stops):
+    "Sort half open ranges and merge those that touch or overlap, dropping empty ones"
+    keep = stops > starts
+    starts = starts[keep]
+    stops = stops[keep]
+    if len(starts) == 0:
+        return starts, stops
+    order = numpy.argsort(starts, kind='mergesort')
+    starts = starts[order]
+    stops = numpy.maximum.accumulate(stops[order])
+    # A new run begins wherever a range starts after every earlier range has stopped
+    new_run = numpy.ones(len(starts), dtype=bool)
+    new_run[1:] = starts[1:] > stops[:-1]
+    run_starts = numpy.flatnonzero(new_run)
+    run_stops = numpy.append(run_starts[1:], len(starts)) - 1
+    return starts[run_starts], stops[run_stops]
+
+
+def expand_ranges(starts, stops):
+    "Concatenation of numpy.arange(start, stop) for every range, without a Python loop"
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    # Each element is one more than the previous, except at range boundaries
+    steps = numpy.ones(total, dtype=numpy.int64)
+    nonempty = lengths > 0
+    first = starts[nonempty]
+    steps[0] = first[0]
+    ends = numpy.cumsum(lengths[nonempty])[:-1]
+    steps[ends] = first[1:] - (stops[nonempty][:-1] - 1)
+    return numpy.cumsum(steps)
@@ -0,0 +1,262 @@
+'''
+Streaming loader for SWC neuron reconstruction files.
+
+SWC files are parsed straight into contiguous NumPy structured arrays, one
+row per node, without creating any per-node Python objects. Files larger
+than memory can be processed piece by piece with iter_swc_chunks().
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import itertools
+import warnings
+
+import numpy
+
+
+# One row per SWC node. "parent" holds the row index of the parent node
+# (-1 for roots) in arrays returned by load_swc(), but the raw SWC parent
+# *id* in chunks yielded by iter_swc_chunks(), because the id-to-row mapping
+# is only known once the whole file has been read.
+SWC_NODE_DTYPE = numpy.dtype([
+        ('id', numpy.int32),
+        ('type', numpy.int32),
+        ('xyz', numpy.float32, (3,)),
+        ('radius', numpy.float32),
+        ('parent', numpy.int32), ])
+
+# Standard SWC structure identifiers, from the SWC specification
+SWC_TYPE_NAMES = {
+        0: "undefined",
+        1: "soma",
+        2: "axon",
+        3: "basal dendrite",
+        4: "apical dendrite",
+        5: "fork point",
+        6: "end point",
+        7: "custom", }
+
+
+DEFAULT_CHUNK_SIZE = 1 << 18 # nodes per chunk in streaming mode
+
+
+class SwcHeader(dict):
+    "Key/value pairs parsed from the '#' comment lines at the top of an SWC file"
+    def __init__(self):
+        dict.__init__(self)
+        self.comments = []
+
+    def parseLine(self, line):
+        text = line.strip().lstrip("#").strip()
+        self.comments.append(text)
+        # Some writers run two keys together on one line, for example
+        # "# SOMA_AREA# SHINKAGE_CORRECTION 1.0 1.0 1.0"
+        for field in text.split("#"):
+            tokens = field.split()
+            if len(tokens) == 0:
+                continue
+            key = tokens[0]
+            if key != key.upper() or not key.replace("_", "").replace("/", "").isalpha():
+                continue # free form comment, not a header field
+            self[key] = " ".join(tokens[1:])
+
+    def vector(self, key, default=(1.0, 1.0, 1.0)):
+        "Three-float header value, such as SCALE, or default if absent or malformed"
+        try:
+            values = [float(v) for v in self[key].split()]
+        except (KeyError, ValueError):
+            return default
+        if len(values) != 3:
+            return default
+        return tuple(values)
+
+    @property
+    def scale(self):
+        return self.vector("SCALE")
+
+    @property
+    def shrinkageCorrection(self):
+        return self.vector("SHINKAGE_CORRECTION")
+
+    def coordinateScale(self):
+        "Combined per-axis factor to convert stored coordinates to physical units"
+        return tuple(a*b for a, b in zip(self.scale, self.shrinkageCorrection))
+
+
+class SwcNeuron(object):
+    "All nodes of one SWC file, stored as a NumPy structured array of SWC_NODE_DTYPE"
+    def __init__(self, nodes, header=None, file_name=None):
+        self.nodes = nodes
+        self.header = header if header is not None else SwcHeader()
+        self.file_name = file_name
+        # (edges, cones) precomputed by swc_cache, or None
+        self.edge_cones = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def xyz(self):
+        return self.nodes['xyz']
+
+    @property
+    def radius(self):
+        return self.nodes['radius']
+
+    @property
+    def parent(self):
+        return self.nodes['parent']
+
+    @property
+    def type(self):
+        return self.nodes['type']
+
+    def edges(self):
+        "(child, parent) row index pairs for every non-root node, as an Nx2 array"
+        child = numpy.flatnonzero(self.nodes['parent'] >= 0)
+        result = numpy.empty((len(child), 2), dtype=numpy.int32)
+        result[:, 0] = child
+        result[:, 1] = self.nodes['parent'][child]
+        return result
+
+
+def _read_header(swc_file, header):
+    "Consume leading comment lines; returns the first data line, or None"
+    for line in swc_file:
+        stripped = line.strip()
+        if len(stripped) == 0:
+            continue
+        if stripped.startswith("#"):
+            header.parseLine(stripped)
+            continue
+        return line
+    return None
+
+
+def _parse_rows(lines):
+    "Convert a list of SWC text lines into a structured array, in one vectorized pass"
+    with warnings.catch_warnings():
+        # loadtxt warns about input containing only comments or blank lines
+        warnings.simplefilter("ignore", UserWarning)
+        table = numpy.loadtxt(lines, dtype=numpy.float64, comments="#",
+                usecols=(0, 1, 2, 3, 4, 5, 6), ndmin=2)
+    result = numpy.empty(len(table), dtype=SWC_NODE_DTYPE)
+    result['id'] = table[:, 0]
+    result['type'] = table[:, 1]
+    result['xyz'] = table[:, 2:5]
+    result['radius'] = table[:, 5]
+    result['parent'] = table[:, 6]
+    return result
+
+
+def iter_swc_chunks(file_name, chunk_size=DEFAULT_CHUNK_SIZE, header=None, apply_scale=True):
+    '''
+    Stream an SWC file as a sequence of structured arrays of at most chunk_size nodes.
+
+    The "parent" field of each chunk holds raw SWC parent ids; see resolve_parents().
+    If header is an SwcHeader instance, it is filled in before the first chunk is yielded.
+    '''
+    if header is None:
+        header = SwcHeader()
+    with open(file_name, "r") as swc_file:
+        first_line = _read_header(swc_file, header)
+        if first_line is None:
+            return
+        scale = numpy.array(header.coordinateScale(), dtype=numpy.float32)
+        apply_scale = apply_scale and not numpy.all(scale == 1.0)
+        lines = itertools.chain([first_line], swc_file)
+        while True:
+            block = list(itertools.islice(lines, chunk_size))
+            if len(block) == 0:
+                break
+            chunk = _parse_rows(block)
+            if len(chunk) == 0:
+                continue
+            if apply_scale:
+                chunk['xyz'] *= scale
+            yield chunk
+
+
+def resolve_parents(ids, parent_ids):
+    "Convert SWC parent ids to row indices into ids, with -1 for roots and dangling parents"
+    ids = numpy.asarray(ids)
+    parent_ids = numpy.asarray(parent_ids)
+    n = len(ids)
+    # Fast path: ids are the usual consecutive 1..N
+    if n > 0 and ids[0] == 1 and ids[-1] == n and numpy.all(numpy.diff(ids) == 1):
+        result = parent_ids.astype(numpy.int32) - 1
+        result[(parent_ids < 1) | (parent_ids > n)] = -1
+        return result
+    order = numpy.argsort(ids, kind='mergesort')
+    sorted_ids = ids[order]
+    slot = numpy.searchsorted(sorted_ids, parent_ids)
+    slot = numpy.minimum(slot, max(n - 1, 0))
+    result = numpy.full(len(parent_ids), -1, dtype=numpy.int32)
+    if n == 0:
+        return result
+    found = (sorted_ids[slot] == parent_ids) & (parent_ids >= 0)
+    result[found] = order[slot[found]]
+    return result
+
+
+def load_swc(file_name, chunk_size=DEFAULT_CHUNK_SIZE, apply_scale=True):
+    "Read an entire SWC file into an SwcNeuron, with parent ids resolved to row indices"
+    header = SwcHeader()
+    chunks = list(iter_swc_chunks(file_name, chunk_size, header, apply_scale))
+    if len(chunks) == 0:
+        nodes = numpy.empty(0, dtype=SWC_NODE_DTYPE)
+    elif len(chunks) == 1:
+        nodes = chunks[0]
+    else:
+        nodes = numpy.concatenate(chunks)
+    del chunks
+    nodes['parent'] = resolve_parents(nodes['id'], nodes['parent'])
+    return SwcNeuron(nodes, header, file_name)
+
+
+def write_swc(neuron, file_name, apply_scale=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Write an SwcNeuron as an SWC text file, readable by load_swc().
+
+    Header comments are written first. Parent row indices are converted
+    back to SWC ids. With apply_scale, coordinates are taken to be scaled by
+    the header, as load_swc() leaves them, and are divided back.
+    '''
+    nodes = neuron.nodes
+    xyz_scale = numpy.ones(3)
+    if apply_scale:
+        xyz_scale = numpy.array(neuron.header.coordinateScale())
+    with open(file_name, "w") as swc_file:
+        for comment in neuron.header.comments:
+            swc_file.write("# %s\n" % comment)
+        for start in range(0, len(nodes), chunk_size):
+            chunk = nodes[start:start + chunk_size]
+            table = numpy.empty((len(chunk), 7), dtype=numpy.float64)
+            table[:, 0] = chunk['id']
+            table[:, 1] = chunk['type']
+            table[:, 2:5] = chunk['xyz'] / xyz_scale
+            table[:, 5] = chunk['radius']
+            parent = chunk['parent']
+            table[:, 6] = numpy.where(parent >= 0, nodes['id'][numpy.maximum(parent, 0)], -1)
+            numpy.savetxt(swc_file, table, fmt="%d %d %.7g %.7g %.7g %.7g %d")
+
+
+def path_sums(parent, values):
+    '''
+    Sum of values over each node and all of its ancestors.
+
+    parent holds row indices, with -1 for roots. Uses pointer jumping, so the
+    cost is O(N log depth) in a few vectorized passes, and nodes may appear
+    in any order.
+    '''
+    total = numpy.array(values, copy=True)
+    ancestor = numpy.array(parent, dtype=numpy.int64, copy=True)
+    active = numpy.flatnonzero(ancestor >= 0)
+    while len(active) > 0:
+        # Right hand sides are evaluated before assignment, so every node
+        # jumps using the values from the previous round.
+        total[active] += total[ancestor[active]]
+        ancestor[active] = ancestor[ancestor[active]]
+        active = active[ancestor[active] >= 0]
+    return total
@@ -0,0 +1,199 @@
+'''
+Binary sidecar cache of parsed SWC neurons, opened by memory mapping.
+
+The first load_swc_cached() of "neuron.swc" parses the text as usual and
+writes "neuron.swc.swcbin" beside it, holding the node array, the
+(child, parent) edge topology and the cone parameters of every edge. Later
+loads map that file with numpy.memmap instead of parsing, so they take
+milliseconds whatever the size of the neuron, and pages are only read from
+disk when the arrays are touched.
+
+File layout, all little-endian:
+    8 bytes   CACHE_MAGIC
+    4 bytes   uint32 length of the JSON header that follows
+    JSON      format version, source file size and mtime, SWC header
+              comments, and the dtype, shape and byte offset of each array
+    arrays    each starting on a CACHE_ALIGNMENT byte boundary
+
+A cache is stale, and silently rebuilt, whenever the size or modification
+time of the SWC file differs from those recorded in it.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy
+
+from swc import SWC_NODE_DTYPE, SwcHeader, SwcNeuron, load_swc, DEFAULT_CHUNK_SIZE
+from imposter_geometry import CONE_DTYPE, neuron_cone_parameters
+
+
+CACHE_MAGIC = b"SWCIMPC\x01"
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".swcbin"
+CACHE_ALIGNMENT = 64 # bytes; one cache line, and enough for any SIMD load
+
+# Arrays stored in each cache file, in file order
+_ARRAY_DTYPES = [
+        ('nodes', SWC_NODE_DTYPE),
+        ('edges', numpy.dtype('<i4')),
+        ('cones', CONE_DTYPE), ]
+
+
+def cache_path(file_name):
+    "Sidecar cache file name for an SWC file"
+    return file_name + CACHE_SUFFIX
+
+
+def _source_key(file_name):
+    "Identifies one version of an SWC file, without reading it"
+    status = os.stat(file_name)
+    return {'size': status.st_size, 'mtime': status.st_mtime}
+
+
+def _aligned(offset):
+    return (offset + CACHE_ALIGNMENT - 1) // CACHE_ALIGNMENT * CACHE_ALIGNMENT
+
+
+def write_swc_cache(neuron, file_name, apply_scale=True, path=None):
+    '''
+    Write the cache of a parsed SwcNeuron loaded from file_name.
+
+    The file is written under a temporary name and then renamed, so that
+    concurrent readers never see a partial cache.
+    '''
+    if path is None:
+        path = cache_path(file_name)
+    edges, cones = neuron_cone_parameters(neuron)
+    arrays = {'nodes': neuron.nodes, 'edges': edges, 'cones': cones}
+    header = {
+            'version': CACHE_VERSION,
+            'source': _source_key(file_name),
+            'apply_scale': bool(apply_scale),
+            'comments': neuron.header.comments,
+            'arrays': {}, }
+    # Offsets depend on the header length, which depends on the offsets;
+    # laying out arrays from a generous fixed header size breaks the cycle.
+    offset = CACHE_ALIGNMENT * 64
+    for name, dtype in _ARRAY_DTYPES:
+        array = numpy.ascontiguousarray(arrays[name], dtype=dtype)
+        arrays[name] = array
+        header['arrays'][name] = {
+                'dtype': str(dtype.descr),
+                'shape': list(array.shape),
+                'offset': offset, }
+        offset = _aligned(offset + array.nbytes)
+    text = json.dumps(header, sort_keys=True).encode("utf-8")
+    data_start = min(entry['offset'] for entry in header['arrays'].values())
+    if len(CACHE_MAGIC) + 4 + len(text) > data_start:
+        # Very long comment headers: shift every array down past the header
+        shift = _aligned(len(CACHE_MAGIC) + 4 + len(text) + 256) - data_start
+        for entry in header['arrays'].values():
+            entry['offset'] += shift
+        text = json.dumps(header, sort_keys=True).encode("utf-8")
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp_path, "wb") as cache_file:
+        cache_file.write(CACHE_MAGIC)
+        cache_file.write(struct.pack("<I", len(text)))
+        cache_file.write(text)
+        for name, dtype in _ARRAY_DTYPES:
+            cache_file.seek(header['arrays'][name]['offset'])
+            cache_file.write(arrays[name].tobytes())
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path) # rename does not replace files on Windows
+    os.rename(temp_path, path)
+
+
+def read_swc_cache(file_name, apply_scale=True, path=None):
+    '''
+    Memory map the cache of an SWC file, returning an SwcNeuron or None.
+
+    Returns None if the cache is missing, unreadable, from another format
+    version or apply_scale setting, or older than the SWC file. The nodes of
+    the returned neuron are a read-only numpy.memmap, and its edge_cones
+    attribute holds the cached (edges, cones) arrays.
+    '''
+    if path is None:
+        path = cache_path(file_name)
+    try:
+        with open(path, "rb") as cache_file:
+            prefix = cache_file.read(len(CACHE_MAGIC) + 4)
+            if len(prefix) < len(CACHE_MAGIC) + 4 or not prefix.startswith(CACHE_MAGIC):
+                return None
+            length = struct.unpack("<I", prefix[len(CACHE_MAGIC):])[0]
+            header = json.loads(cache_file.read(length).decode("utf-8"))
+        if header.get('version') != CACHE_VERSION:
+            return None
+        if header.get('apply_scale') != bool(apply_scale):
+            return None
+        if header.get('source') != _source_key(file_name):
+            return None
+        arrays = {}
+        mapping = None
+        for name, dtype in _ARRAY_DTYPES:
+            entry = header['arrays'][name]
+            if entry['dtype'] != str(dtype.descr):
+                return None
+            shape = tuple(entry['shape'])
+            count = int(numpy.prod(shape))
+            if count == 0:
+                arrays[name] = numpy.empty(shape, dtype=dtype)
+                continue
+            if mapping is None:
+                mapping = numpy.memmap(path, dtype=numpy.uint8, mode='r')
+            end = entry['offset'] + count * dtype.itemsize
+            if end > len(mapping):
+                return None # truncated file
+            arrays[name] = mapping[entry['offset']:end].view(dtype).reshape(shape)
+    except (IOError, OSError, ValueError, KeyError, TypeError, struct.error):
+        return None
+    swc_header = SwcHeader()
+    for comment in header['comments']:
+        swc_header.parseLine(comment)
+    neuron = SwcNeuron(arrays['nodes'], swc_header, file_name)
+    neuron.edge_cones = (arrays['edges'], arrays['cones'])
+    return neuron
+
+
+def load_swc_cached(file_name, chunk_size=DEFAULT_CHUNK_SIZE, apply_scale=True, write=True):
+    '''
+    Same as load_swc(), but from the sidecar cache when it is up to date.
+
+    Otherwise parses the SWC file and, if write is true, creates the cache
+    for next time. A cache that cannot be written, for example beside a
+    read-only file, is not an error.
+    '''
+    neuron = read_swc_cache(file_name, apply_scale)
+    if neuron is not None:
+        return neuron
+    neuron = load_swc(file_name, chunk_size, apply_scale)
+    if write:
+        try:
+            write_swc_cache(neuron, file_name, apply_scale)
+        except (IOError, OSError):
+            pass # the cache is only an optimization
+    return neuron
+
+
+def main():
+    "Build or refresh the cache of each SWC file named on the command line"
+    for file_name in sys.argv[1:]:
+        t0 = time.time()
+        neuron = load_swc(file_name)
+        t1 = time.time()
+        write_swc_cache(neuron, file_name)
+        t2 = time.time()
+        neuron = read_swc_cache(file_name)
+        t3 = time.time()
+        print("%s: %d nodes, parsed in %.3f s, cached in %.3f s, mapped in %.4f s" % (
+                cache_path(file_name), len(neuron), t1 - t0, t2 - t1, t3 - t2))
+
+
+if __name__ == "__main__":
+    main()
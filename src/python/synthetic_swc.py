@@ -0,0 +1,129 @@
+'''
+Synthetic SWC neurons, for benchmarks.
+
+random_neuron() grows a dense tangle, one random step per node.
+branching_neuron() grows a tree of straight-ish branches that split a
+fixed number of ways, closer to the shape of a traced arbor. Both are
+vectorized, so trees of ten million nodes take seconds, and both take
+one of RADIUS_DISTRIBUTIONS for the node radii.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+
+from swc import SWC_NODE_DTYPE, SwcNeuron, path_sums
+
+
+# Values of the radius_distribution argument of the generators
+RADIUS_DISTRIBUTIONS = (
+        "uniform", # uniform within radius_range
+        "lognormal", # log-normal around the geometric mean of radius_range, clipped to it
+        "taper", ) # largest at the root, shrinking with path length from it, with a little jitter
+
+
+def random_radii(rng, xyz, parent, radius_range=(0.2, 0.5), distribution="uniform"):
+    "Radius of each node of a tree, within radius_range, from one of RADIUS_DISTRIBUTIONS"
+    lo, hi = radius_range
+    count = len(parent)
+    if distribution == "uniform":
+        return rng.uniform(lo, hi, count)
+    if distribution == "lognormal":
+        # About 95% of samples fall within the range before clipping
+        sigma = max(numpy.log(hi / lo) / 4.0, 1e-6)
+        return numpy.clip(rng.lognormal(numpy.log(numpy.sqrt(lo * hi)), sigma, count), lo, hi)
+    if distribution == "taper":
+        has_parent = parent >= 0
+        step = numpy.zeros(count)
+        step[has_parent] = numpy.linalg.norm(xyz[has_parent] - xyz[parent[has_parent]], axis=1)
+        distance = path_sums(parent, step)
+        fraction = distance / max(distance.max(), 1e-6)
+        jitter = rng.uniform(0.9, 1.1, count)
+        return numpy.clip((hi - (hi - lo) * fraction) * jitter, lo, hi)
+    raise ValueError("Unknown radius distribution %r; expected one of %s" % (
+            distribution, ", ".join(RADIUS_DISTRIBUTIONS)))
+
+
+def _neuron(xyz, radius, parent):
+    "SwcNeuron of basal dendrite nodes, with a soma at row 0"
+    nodes = numpy.empty(len(parent), dtype=SWC_NODE_DTYPE)
+    nodes['id'] = numpy.arange(len(parent)) + 1
+    nodes['type'] = 3 # basal dendrite
+    nodes['type'][0] = 1 # soma
+    nodes['xyz'] = xyz
+    nodes['radius'] = radius
+    nodes['parent'] = parent
+    return SwcNeuron(nodes)
+
+
+def random_neuron(node_count, branch_probability=0.05, step_length=1.0,
+        radius_range=(0.2, 0.5), seed=None, radius_distribution="uniform"):
+    '''
+    Random branching tree, grown as a random walk from a soma at the origin.
+
+    Each node continues from the previous node, except that with
+    probability branch_probability it instead starts a new branch from a
+    random earlier node. Short steps in random directions make a dense,
+    tangled arbor with a lot of overdraw.
+    '''
+    rng = numpy.random.RandomState(seed)
+    index = numpy.arange(node_count)
+    parent = index - 1
+    branches = rng.random_sample(node_count) < branch_probability
+    branches[0:2] = False
+    parent[branches] = (rng.random_sample(branches.sum()) * index[branches]).astype(parent.dtype)
+    direction = rng.normal(size=(node_count, 3))
+    direction *= step_length / numpy.linalg.norm(direction, axis=1)[:, None]
+    direction[0] = 0
+    xyz = path_sums(parent, direction)
+    radius = random_radii(rng, xyz, parent, radius_range, radius_distribution)
+    radius[0] = radius_range[1]
+    return _neuron(xyz, radius, parent)
+
+
+def branching_neuron(node_count, branch_factor=2, segment_length=20, step_length=1.0,
+        spread=0.6, radius_range=(0.2, 2.0), seed=None, radius_distribution="taper"):
+    '''
+    Tree of unbranched segments of segment_length nodes, each ending in
+    branch_factor child segments, grown breadth first from a soma at the origin.
+
+    Each segment heads in the direction of its parent segment, turned by a
+    random amount that grows with spread, and its nodes wobble slightly
+    about that heading. The tree stops at node_count nodes, so the last
+    level is usually incomplete.
+    '''
+    if branch_factor < 1 or segment_length < 1:
+        raise ValueError("branch_factor and segment_length must be at least 1")
+    rng = numpy.random.RandomState(seed)
+    segment_count = (node_count + segment_length - 1) // segment_length
+    # Breadth first numbering: the children of segment s are
+    # branch_factor * s + 1 ... branch_factor * s + branch_factor
+    segment = numpy.arange(segment_count)
+    segment_parent = (segment - 1) // branch_factor
+    heading = numpy.empty((segment_count, 3))
+    heading[0] = rng.normal(size=3)
+    level_start, level_stop = 0, 1
+    while level_stop < segment_count:
+        children = numpy.arange(level_stop, min(segment_count,
+                level_stop + (level_stop - level_start) * branch_factor))
+        heading[children] = (heading[segment_parent[children]]
+                + spread * rng.normal(size=(len(children), 3)))
+        heading[children] /= numpy.linalg.norm(heading[children], axis=1)[:, None]
+        level_start, level_stop = level_stop, children[-1] + 1
+    heading /= numpy.linalg.norm(heading, axis=1)[:, None]
+
+    index = numpy.arange(node_count)
+    node_segment = index // segment_length
+    parent = index - 1
+    # The first node of each segment hangs from the last node of its parent segment
+    first = index[index % segment_length == 0]
+    parent[first] = segment_parent[node_segment[first]] * segment_length + segment_length - 1
+    parent[0] = -1
+    step = heading[node_segment] + 0.2 * rng.normal(size=(node_count, 3))
+    step *= step_length / numpy.linalg.norm(step, axis=1)[:, None]
+    step[0] = 0
+    xyz = path_sums(parent, step)
+    radius = random_radii(rng, xyz, parent, radius_range, radius_distribution)
+    radius[0] = radius_range[1]
+    return _neuron(xyz, radius, parent)
@@ -0,0 +1,99 @@
+'''
+Tests of the batched cone segment geometry in imposter_geometry.py against
+the scalar arithmetic of ConeSegment.
+
+Run with pytest from this directory.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import math
+
+import numpy
+import pytest
+
+from imposter_geometry import cone_parameters, neuron_cone_parameters, cone_bounds
+from synthetic_swc import random_neuron
+
+
+def scalar_cone(cs1, rs1, cs2, rs2):
+    "Cone parameters of one sphere pair, step by step as in ConeSegment.__init__, with plain floats"
+    if rs2 < rs1:
+        rs1, rs2 = rs2, rs1
+        cs1, cs2 = cs2, cs1
+    d = math.sqrt(sum((a - b)**2 for a, b in zip(cs1, cs2)))
+    aHat = [(a - b) / d for a, b in zip(cs1, cs2)]
+    sinAlpha = (rs2 - rs1) / d
+    cosAlpha = math.sqrt(1 - sinAlpha*sinAlpha)
+    r1 = cosAlpha * rs1
+    r2 = cosAlpha * rs2
+    c1 = [c + a * sinAlpha * rs1 for c, a in zip(cs1, aHat)]
+    c2 = [c + a * sinAlpha * rs2 for c, a in zip(cs2, aHat)]
+    axis = [(a - b) / 2.0 for a, b in zip(c1, c2)]
+    length = math.sqrt(sum(a*a for a in axis)) * 2.0
+    return {
+            'center': [(a + b) / 2.0 for a, b in zip(c1, c2)],
+            'axis': axis,
+            'length': length,
+            'taper': (r2 - r1) / length,
+            'radius': (r1 + r2) / 2.0,
+            'r1': r1,
+            'r2': r2, }
+
+
+def separated_pairs(count, seed):
+    "Random sphere pairs with neither sphere inside the other, in either radius order"
+    rng = numpy.random.RandomState(seed)
+    center1 = rng.uniform(-50.0, 50.0, (count, 3))
+    radius1 = rng.lognormal(0.0, 1.0, count)
+    radius2 = rng.lognormal(0.0, 1.0, count)
+    direction = rng.normal(size=(count, 3))
+    direction /= numpy.linalg.norm(direction, axis=1)[:, None]
+    # Center distance ranges from just beyond |r1 - r2| to far apart
+    distance = numpy.abs(radius1 - radius2) + rng.uniform(1e-3, 20.0, count)
+    center2 = center1 + direction * distance[:, None]
+    return center1, radius1, center2, radius2
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_scalar_cone_segment(seed):
+    center1, radius1, center2, radius2 = separated_pairs(2000, seed)
+    cones = cone_parameters(center1, radius1, center2, radius2)
+    assert numpy.all(cones['r2'] >= cones['r1'])
+    for i in range(len(cones)):
+        expected = scalar_cone(center1[i].tolist(), radius1[i], center2[i].tolist(), radius2[i])
+        for field, value in expected.items():
+            scale = max(1.0, numpy.max(numpy.abs(value)))
+            assert numpy.allclose(cones[i][field], value, rtol=0, atol=1e-12 * scale), field
+
+
+def test_neuron_cones_join_parent_to_child():
+    neuron = random_neuron(500, seed=4)
+    edges, cones = neuron_cone_parameters(neuron)
+    assert len(edges) == len(cones) == len(neuron) - 1
+    xyz = neuron.xyz.tolist()
+    radius = neuron.radius.tolist()
+    for (child, parent), cone in zip(edges, cones):
+        expected = scalar_cone(xyz[parent], radius[parent], xyz[child], radius[child])
+        assert numpy.allclose(cone['center'], expected['center'], rtol=0, atol=1e-9)
+        assert numpy.allclose(cone['axis'], expected['axis'], rtol=0, atol=1e-9)
+        assert numpy.isclose(cone['taper'], expected['taper'], rtol=0, atol=1e-9)
+
+
+def test_nested_spheres_yield_nan():
+    # One sphere inside the other, and coincident centers, have no joining
+    # cone; ConeSegment raises for these, while cone_parameters() gives NaN
+    # radii and bounds, which BoundingVolumeHierarchy keeps out of its tree
+    center1 = numpy.zeros((3, 3))
+    center2 = numpy.array([[1.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+    radius1 = numpy.array([5.0, 1.0, 1.0])
+    radius2 = numpy.array([1.0, 2.0, 1.0])
+    with numpy.errstate(all='raise'):
+        cones = cone_parameters(center1, radius1, center2, radius2)
+    for field in ('taper', 'radius', 'r1', 'r2'):
+        assert numpy.all(numpy.isnan(cones[field])), field
+    lo, hi = cone_bounds(cones)
+    assert numpy.all(numpy.isnan(lo)) and numpy.all(numpy.isnan(hi))
+    with pytest.raises((ValueError, ZeroDivisionError)):
+        scalar_cone(center1[0].tolist(), radius1[0], center2[0].tolist(), radius2[0])
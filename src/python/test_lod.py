@@ -0,0 +1,81 @@
+'''
+Tests of the level of detail simplification in lod.py, on seeded synthetic neurons.
+
+Run with pytest from this directory.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+import pytest
+
+from lod import NeuronLod
+from synthetic_swc import random_neuron, branching_neuron
+
+
+NEURONS = [
+        ("random", lambda: random_neuron(20000, seed=0)),
+        ("random_lognormal", lambda: random_neuron(5000, seed=3, radius_distribution="lognormal")),
+        ("branching", lambda: branching_neuron(20000, seed=1)),
+        ("branching_wide", lambda: branching_neuron(5000, branch_factor=3, segment_length=7, seed=2)), ]
+
+
+@pytest.fixture(scope="module", params=NEURONS, ids=[name for name, make in NEURONS])
+def neuron_lod(request):
+    neuron = request.param[1]()
+    return neuron, NeuronLod.fromNeuron(neuron)
+
+
+def key_nodes(parent):
+    "Roots, branch points and tips of a tree"
+    has_parent = parent >= 0
+    child_count = numpy.bincount(parent[has_parent], minlength=len(parent))
+    return numpy.flatnonzero(~has_parent | (child_count != 1))
+
+
+def test_levels_coarsen(neuron_lod):
+    neuron, lod = neuron_lod
+    assert len(lod) > 2
+    assert lod.tolerances[0] == 0
+    assert numpy.all(numpy.diff(lod.tolerances) > 0)
+    sizes = lod.levelSizes()
+    assert sizes[0] == (len(neuron), len(neuron.edges()))
+    # Each level keeps a subset of the nodes of the level before
+    for level in range(1, len(lod)):
+        assert numpy.all(lod.keptEntries(level) <= lod.keptEntries(level - 1))
+
+
+def test_deviation_within_tolerance(neuron_lod):
+    neuron, lod = neuron_lod
+    assert lod.maxDeviation(0) == 0
+    for level in range(1, len(lod)):
+        assert lod.maxDeviation(level) <= lod.tolerances[level]
+
+
+def test_key_nodes_kept_at_every_level(neuron_lod):
+    neuron, lod = neuron_lod
+    keys = key_nodes(neuron.parent)
+    for level in range(len(lod)):
+        kept = numpy.unique(lod.entries[lod.keptEntries(level)])
+        assert numpy.all(numpy.isin(keys, kept))
+        start, stop = lod.sphere_offsets[level, 0], lod.sphere_offsets[level, -1]
+        spheres = numpy.concatenate([lod.roots, lod.sphere_nodes[start:stop]])
+        assert numpy.all(numpy.isin(keys, spheres))
+
+
+def test_coarsest_level_keeps_only_key_nodes(neuron_lod):
+    neuron, lod = neuron_lod
+    kept = numpy.unique(lod.entries[lod.keptEntries(len(lod) - 1)])
+    assert numpy.array_equal(kept, key_nodes(neuron.parent))
+
+
+def test_cones_join_kept_nodes_of_one_chain(neuron_lod):
+    neuron, lod = neuron_lod
+    for level in range(len(lod)):
+        start, stop = lod.cone_offsets[level, 0], lod.cone_offsets[level, -1]
+        edges = lod.cone_edges[start:stop]
+        # Every node but the roots still hangs from exactly one cone
+        assert len(edges) == len(numpy.unique(edges[:, 0]))
+        assert len(numpy.unique(numpy.concatenate([edges[:, 0], lod.roots]))) == \
+                len(numpy.unique(lod.entries[lod.keptEntries(level)]))
@@ -0,0 +1,71 @@
+'''
+Tests of the bounding volume hierarchy in spatial_index.py, on seeded synthetic neurons.
+
+Run with pytest from this directory.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+import pytest
+
+from imposter_geometry import neuron_cone_parameters, cone_bounds
+from spatial_index import BoundingVolumeHierarchy, DEFAULT_LEAF_SIZE, morton_codes, expand_ranges
+from synthetic_swc import random_neuron
+
+
+def box_planes(center, half_width):
+    "Inward facing planes of an axis aligned cube, as frustum_planes() returns them"
+    planes = numpy.zeros((6, 4))
+    for axis in range(3):
+        planes[2 * axis, axis] = 1.0
+        planes[2 * axis, 3] = half_width - center[axis]
+        planes[2 * axis + 1, axis] = -1.0
+        planes[2 * axis + 1, 3] = half_width + center[axis]
+    return planes
+
+
+def culled_cones(neuron, planes):
+    "Input indices of the cones that the hierarchy draws, and the cone bounds"
+    edges, cones = neuron_cone_parameters(neuron)
+    lo, hi = cone_bounds(cones)
+    bvh = BoundingVolumeHierarchy(lo, hi)
+    return bvh.order[expand_ranges(*bvh.cull(planes))], lo, hi
+
+
+def test_morton_codes_ignore_non_finite_points():
+    points = numpy.array([[0.0, 0.0, 0.0], [1.0, 2.0, 3.0], [0.5, 1.0, 1.5]])
+    with_nan = numpy.concatenate([points, [[numpy.nan, 0.0, 0.0], [numpy.inf, 1.0, 1.0]]])
+    with numpy.errstate(all='raise'):
+        codes = morton_codes(with_nan)
+    assert numpy.array_equal(codes[:3], morton_codes(points))
+    assert numpy.all(codes[3:] == 0)
+
+
+@pytest.mark.filterwarnings("error")
+def test_enclosing_soma_does_not_defeat_culling():
+    neuron = random_neuron(20000, seed=1)
+    planes = box_planes(neuron.xyz[len(neuron) // 2], 1.0)
+    plain_drawn, lo, hi = culled_cones(neuron, planes)
+    # A soma that swallows its neighbors gives their cones non-finite bounds
+    neuron.nodes['radius'][0] = 5.0
+    neuron.edge_cones = None
+    drawn, lo, hi = culled_cones(neuron, planes)
+    degenerate = ~numpy.all(numpy.isfinite(lo) & numpy.isfinite(hi), axis=1)
+    assert 0 < numpy.count_nonzero(degenerate) < 10
+    assert len(plain_drawn) < len(lo) // 10
+    assert len(drawn) <= len(plain_drawn) + numpy.count_nonzero(degenerate) + 2 * DEFAULT_LEAF_SIZE
+    # Degenerate cones are always drawn, and culling stays conservative
+    assert numpy.all(numpy.isin(numpy.flatnonzero(degenerate), drawn))
+    box_lo = neuron.xyz[len(neuron) // 2] - 1.0
+    box_hi = neuron.xyz[len(neuron) // 2] + 1.0
+    touching = ~degenerate & numpy.all((hi >= box_lo) & (lo <= box_hi), axis=1)
+    assert numpy.all(numpy.isin(numpy.flatnonzero(touching), drawn))
+
+
+def test_all_bounds_non_finite():
+    lo = numpy.full((5, 3), numpy.nan)
+    bvh = BoundingVolumeHierarchy(lo, lo)
+    starts, stops = bvh.cull(box_planes([0.0, 0.0, 0.0], 1.0))
+    assert list(zip(starts, stops)) == [(0, 5)]
@@ -0,0 +1,198 @@
+'''
+Tests of the slotted Vec3 and the batched functions in vecmath.py against
+the list-backed Vec3 they replaced.
+
+Run with pytest from this directory.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import math
+
+import numpy
+import pytest
+
+from vecmath import Vec3, as_array, dots, norms, normalized, crosses
+
+
+class ListVec3(object):
+    "The original list-backed Vec3 of the viewer, with / also working on Python 3"
+    def __init__(self, data):
+        assert len(data) == 3
+        self._data = data
+
+    def cross(self, rhs):
+        return ListVec3([
+            self[1]*rhs[2] - self[2]*rhs[1],
+            self[2]*rhs[0] - self[0]*rhs[2],
+            self[0]*rhs[1] - self[1]*rhs[0], ])
+
+    def dot(self, other):
+        return sum([a*b for a, b in zip(self, other)])
+
+    def norm(self):
+        return math.sqrt(self.normSquared())
+
+    def normSquared(self):
+        return self.dot(self)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __add__(self, other):
+        return ListVec3( [l+r for l,r in zip(self, other)] )
+
+    def __radd__(self, other):
+        return ListVec3( [r+l for l,r in zip(self, other)] )
+
+    def __sub__(self, other):
+        return ListVec3( [l-r for l,r in zip(self, other)] )
+
+    def __rsub__(self, other):
+        return ListVec3( [r-l for l,r in zip(self, other)] )
+
+    def __mul__(self, other):
+        return ListVec3( [l*other for l in self] )
+
+    def __rmul__(self, other):
+        return ListVec3( [other*l for l in self] )
+
+    def __div__(self, other):
+        return ListVec3( [l/other for l in self] )
+
+    __truediv__ = __div__
+
+
+class ListSphere(object):
+    def __init__(self, center, radius):
+        self.center = center
+        self.radius = radius
+
+
+class ListConeSegment(object):
+    "The original ConeSegment arithmetic, on ListVec3"
+    def __init__(self, sphere1, sphere2):
+        cs1 = ListVec3(sphere1.center)
+        cs2 = ListVec3(sphere2.center)
+        rs1 = sphere1.radius
+        rs2 = sphere2.radius
+        if rs2 < rs1:
+            rs1, rs2 = rs2, rs1
+            cs1, cs2 = cs2, cs1
+        d = (cs2 - cs1).norm()
+        sinAlpha = (rs2 - rs1) / d;
+        cosAlpha = math.sqrt(1 - sinAlpha*sinAlpha)
+        r1 = cosAlpha * rs1
+        r2 = cosAlpha * rs2
+        aHat = (cs1 - cs2) / d
+        dC1 = sinAlpha * rs1 * aHat
+        dC2 = sinAlpha * rs2 * aHat
+        c1 = cs1 + dC1
+        c2 = cs2 + dC2
+        self.axis = (c1 - c2) / 2.0
+        self.length = self.axis.norm() * 2.0
+        self.center = (c1 + c2) / 2.0
+        self.taper = (r2 - r1) / self.length
+        self.radius = (r1 + r2) / 2.0
+        self.r1 = r1
+        self.r2 = r2
+
+
+def random_vectors(count, seed):
+    rng = numpy.random.RandomState(seed)
+    return rng.uniform(-10.0, 10.0, (count, 3)).tolist(), rng.uniform(-5.0, 5.0, count).tolist()
+
+
+def same(new, old):
+    "Exact equality of the components of a Vec3 and a ListVec3"
+    assert isinstance(new, Vec3)
+    return list(new) == list(old._data)
+
+
+def test_operators_match_list_vec3():
+    vectors, scalars = random_vectors(200, 0)
+    for a, b, s in zip(vectors, vectors[1:], scalars):
+        new, old = Vec3(a), ListVec3(a)
+        assert same(new + b, old + b)
+        assert same(b + new, b + old)
+        assert same(new - b, old - b)
+        assert same(b - new, b - old)
+        assert same(new * s, old * s)
+        assert same(s * new, s * old)
+        assert same(new / s, old / s)
+        assert same(new.__div__(s), old.__div__(s))
+        assert same(new.cross(b), old.cross(b))
+        assert new.dot(b) == old.dot(b)
+        assert new.normSquared() == old.normSquared()
+        assert new.norm() == old.norm()
+        assert same(new.normalized(), old / old.norm())
+        assert same(-new, -1 * old)
+        assert list(new) == a and new[0:2] == a[0:2] and new[-1] == a[2]
+
+
+def test_in_place_operators_match_list_vec3():
+    vectors, scalars = random_vectors(200, 1)
+    for a, b, s in zip(vectors, vectors[1:], scalars):
+        old = ListVec3(a)
+        for operate, expected in (
+                (lambda v: v.__iadd__(b), old + b),
+                (lambda v: v.__isub__(b), old - b),
+                (lambda v: v.__imul__(s), old * s),
+                (lambda v: v.__itruediv__(s), old / s),
+                (lambda v: v.__idiv__(s), old / s),
+                (lambda v: v.addScaled(b, s), old + s * ListVec3(b)), ):
+            new = Vec3(a)
+            result = operate(new)
+            assert result is new
+            assert same(new, expected)
+        # The augmented assignment statements reach the same methods
+        new = Vec3(a)
+        new += b
+        new -= Vec3(b)
+        new *= s
+        new /= s
+        assert same(new, (old + b - b) * s / s)
+
+
+def test_batched_functions_match_list_vec3():
+    vectors, scalars = random_vectors(500, 2)
+    a = as_array(Vec3(v) for v in vectors)
+    b = numpy.roll(a, 1, axis=0)
+    assert numpy.array_equal(a, numpy.array(vectors))
+    olds = [ListVec3(v) for v in vectors]
+    rolled = [ListVec3(v) for v in b.tolist()]
+    assert numpy.allclose(dots(a, b), [x.dot(y) for x, y in zip(olds, rolled)], rtol=1e-14, atol=0)
+    assert numpy.allclose(norms(a), [x.norm() for x in olds], rtol=1e-15, atol=0)
+    assert numpy.allclose(normalized(a), [(x / x.norm())._data for x in olds], rtol=1e-15, atol=1e-15)
+    assert numpy.allclose(crosses(a, b), [x.cross(y)._data for x, y in zip(olds, rolled)],
+            rtol=1e-14, atol=1e-12)
+    axis = [0.0, 0.0, 1.0]
+    assert numpy.array_equal(crosses(a, axis), [x.cross(axis)._data for x in olds])
+
+
+def test_cone_segment_matches_list_vec3():
+    imposter_immediate = pytest.importorskip("imposter_immediate") # needs PyOpenGL
+    # The cone of the viewer demo scene, then random separated sphere pairs
+    pairs = [(([0, 1.1, 0], 0.9), ([1.2, 1.5, 0], 0.5))]
+    rng = numpy.random.RandomState(3)
+    for i in range(500):
+        radius1, radius2 = rng.lognormal(0.0, 1.0, 2).tolist()
+        center1 = rng.uniform(-20.0, 20.0, 3)
+        direction = rng.normal(size=3)
+        distance = abs(radius1 - radius2) + rng.uniform(1e-3, 10.0)
+        center2 = center1 + direction / numpy.linalg.norm(direction) * distance
+        pairs.append(((center1.tolist(), radius1), (center2.tolist(), radius2)))
+    for (center1, radius1), (center2, radius2) in pairs:
+        new = imposter_immediate.ConeSegment(
+                imposter_immediate.Sphere(center1, radius1), imposter_immediate.Sphere(center2, radius2))
+        old = ListConeSegment(ListSphere(center1, radius1), ListSphere(center2, radius2))
+        assert same(new.axis, old.axis)
+        assert same(new.center, old.center)
+        for field in ('length', 'taper', 'radius', 'r1', 'r2'):
+            assert getattr(new, field) == getattr(old, field), field
+        # The spheres keep their centers, which are copied before updating in place
+        assert new.sphere1.center == center1 and new.sphere2.center == center2
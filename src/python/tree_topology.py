@@ -0,0 +1,208 @@
+'''
+Topology of SWC trees: child lists, depth first order and subtree ranges.
+
+SWC files store each tree as parent pointers, which say who the parent of
+a node is but not who its children are, or which nodes lie below it.
+TreeTopology derives both from the parent array alone. Unbranched runs of
+nodes are found by pointer jumping, in O(N log L) for runs of up to L
+nodes, and the tree of runs is then walked one branching level at a time,
+with a few vectorized operations per level, so a long unbranched axon
+costs no more than a short one:
+
+    child_offsets, child_order  CSR child lists; the children of node i are
+                                child_order[child_offsets[i]:child_offsets[i+1]]
+    preorder                    nodes in depth first pre-order, each node
+                                followed at once by all of its descendants
+    position                    index of each node within preorder
+    subtree_size                nodes in the subtree of each node, itself included
+
+preorder_neuron() renumbers an SwcNeuron, and its cached cones, into that
+order. The subtree of node i of the result is then rows
+[i, i + subtree_size[i]), and its cones, in the edge order of
+SwcNeuron.edges(), are the range coneRange(i), so hiding, highlighting or
+recoloring a branch is a single range of the draw buffers, as drawn by
+ImposterVboSet.drawRangesGL(). Nodes near each other in the tree are also
+near each other in memory, which helps the per node geometry passes.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import numpy
+
+from swc import SwcNeuron
+from spatial_index import expand_ranges
+
+
+def child_adjacency(parent):
+    '''
+    CSR child lists of a forest, as (child_offsets, child_order).
+
+    parent holds row indices, with -1 for roots. The children of node i
+    are child_order[child_offsets[i]:child_offsets[i+1]], in row order.
+    SWC files list most nodes just after their parent, so the stable sort
+    runs over long presorted stretches, in close to linear time.
+    '''
+    parent = numpy.asarray(parent, dtype=numpy.int64)
+    has_parent = parent >= 0
+    child_order = numpy.flatnonzero(has_parent)[
+            numpy.argsort(parent[has_parent], kind='mergesort')]
+    child_offsets = numpy.zeros(len(parent) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(parent[has_parent], minlength=len(parent)),
+            out=child_offsets[1:])
+    return child_offsets, child_order
+
+
+def _ancestor_sums(link, values):
+    '''
+    (sums, roots): the sum of values over each node and all of its
+    ancestors in the forest given by link, with -1 for roots, and the root
+    each node reaches. Uses pointer jumping, as swc.path_sums() does, but
+    raises ValueError if the links contain a cycle.
+    '''
+    total = numpy.array(values, copy=True)
+    ancestor = numpy.array(link, dtype=numpy.int64, copy=True)
+    root = numpy.arange(len(ancestor))
+    active = numpy.flatnonzero(ancestor >= 0)
+    jump = 1
+    while len(active) > 0:
+        if jump > len(ancestor):
+            raise ValueError("Parent links contain a cycle")
+        # Right hand sides use the values of the previous round, as in path_sums()
+        total[active] += total[ancestor[active]]
+        root[active] = root[ancestor[active]]
+        ancestor[active] = ancestor[ancestor[active]]
+        active = active[ancestor[active] >= 0]
+        jump *= 2
+    return total, root
+
+
+def _level_children(tails, child_offsets, child_order):
+    "Children of each of tails, grouped in the order of tails, and the size of each group"
+    counts = child_offsets[tails + 1] - child_offsets[tails]
+    return child_order[expand_ranges(child_offsets[tails], child_offsets[tails + 1])], counts
+
+
+class TreeTopology(object):
+    "Child lists, depth first order and subtree sizes of the forest given by parent row indices"
+    def __init__(self, parent):
+        "parent holds row indices, with -1 for roots, as in SwcNeuron.parent"
+        self.parent = numpy.array(parent, dtype=numpy.int64)
+        n = len(self.parent)
+        self.child_offsets, self.child_order = child_adjacency(self.parent)
+        self.roots = numpy.flatnonzero(self.parent < 0)
+        # Unbranched runs, each a head followed by only children, are
+        # consecutive in pre-order, so the tree is walked one run at a time
+        child_count = numpy.diff(self.child_offsets)
+        has_parent = self.parent >= 0
+        head_mask = ~has_parent
+        head_mask[has_parent] = child_count[self.parent[has_parent]] != 1
+        offset, head = _ancestor_sums(numpy.where(head_mask, -1, self.parent),
+                numpy.ones(n, dtype=numpy.int64))
+        offset -= 1
+        run_length = numpy.bincount(head, minlength=n)
+        # The last node of each run has no child or several; the runs below
+        # a run start at the children of that node
+        tails = numpy.flatnonzero(child_count != 1)
+        tail = numpy.empty(n, dtype=numpy.int64)
+        tail[head[tails]] = tails
+        levels = [self.roots] # of run heads, in breadth first order
+        counts = []
+        while len(levels[-1]) > 0:
+            children, level_counts = _level_children(tail[levels[-1]], self.child_offsets, self.child_order)
+            levels.append(children)
+            counts.append(level_counts)
+        levels.pop()
+        if sum(int(run_length[level].sum()) for level in levels) != n:
+            raise ValueError("Parent links contain a cycle")
+        # Sizes of the subtrees below run heads, deepest level first, each
+        # head adding up the group of heads below its run
+        size = run_length.copy()
+        for level, children, level_counts in reversed(list(zip(levels, levels[1:], counts))):
+            sums = numpy.zeros(len(children) + 1, dtype=numpy.int64)
+            numpy.cumsum(size[children], out=sums[1:])
+            stops = numpy.cumsum(level_counts)
+            size[level] += sums[stops] - sums[stops - level_counts]
+        # Pre-order positions of run heads, top level first: each follows
+        # the run above it and the subtrees of the siblings before it
+        position = numpy.zeros(n, dtype=numpy.int64)
+        depth = numpy.zeros(n, dtype=numpy.int64)
+        root_sizes = size[self.roots]
+        position[self.roots] = numpy.cumsum(root_sizes) - root_sizes
+        for level, children, level_counts in zip(levels, levels[1:], counts):
+            depth[children] = numpy.repeat(depth[level] + run_length[level], level_counts)
+            sums = numpy.zeros(len(children) + 1, dtype=numpy.int64)
+            numpy.cumsum(size[children], out=sums[1:])
+            group_start = sums[numpy.cumsum(level_counts) - level_counts]
+            position[children] = sums[:-1] + numpy.repeat(
+                    position[level] + run_length[level] - group_start, level_counts)
+        self.position = position[head] + offset
+        self.subtree_size = size[head] - offset
+        self.depth = depth[head] + offset # edges from the root
+        self.preorder = numpy.empty(n, dtype=numpy.int64)
+        self.preorder[self.position] = numpy.arange(n)
+        # Roots at or before each pre-order position, which have no cone
+        self._roots_through = numpy.cumsum(self.parent[self.preorder] < 0)
+
+    @staticmethod
+    def fromNeuron(neuron):
+        return TreeTopology(neuron.parent)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def children(self, node):
+        "Children of a node, in row order"
+        return self.child_order[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def subtreeRange(self, node):
+        "Half open (start, stop) of the subtree of node within preorder"
+        start = int(self.position[node])
+        return start, start + int(self.subtree_size[node])
+
+    def subtreeNodes(self, node):
+        "Rows of node and all of its descendants, in pre-order"
+        start, stop = self.subtreeRange(node)
+        return self.preorder[start:stop]
+
+    def coneRange(self, node):
+        '''
+        Half open (start, stop) of the cones of the subtree of node, in the
+        cone order of preorder_neuron(). These are the cones to the parents
+        of the subtree nodes, so include the cone above node itself.
+        '''
+        start, stop = self.subtreeRange(node)
+        # Every node in pre-order but the roots has one cone
+        roots_before = int(self._roots_through[start - 1]) if start > 0 else 0
+        return start - roots_before, stop - int(self._roots_through[stop - 1])
+
+    def coneIndices(self, nodes):
+        "Index, in the cone order of preorder_neuron(), of the cone from each non-root node to its parent"
+        position = self.position[numpy.asarray(nodes, dtype=numpy.int64)]
+        return position - self._roots_through[position]
+
+
+def preorder_neuron(neuron, topology=None):
+    '''
+    Copy of an SwcNeuron with its nodes in depth first pre-order, and the
+    TreeTopology of the copy.
+
+    Parent links are renumbered to match, while node ids keep their values.
+    Cones cached by swc_cache are reordered along with the nodes, so the
+    copy need not compute them again.
+    '''
+    if topology is None:
+        topology = TreeTopology.fromNeuron(neuron)
+    nodes = numpy.array(neuron.nodes[topology.preorder])
+    parent = nodes['parent']
+    nodes['parent'] = numpy.where(parent >= 0, topology.position[numpy.maximum(parent, 0)], -1)
+    result = SwcNeuron(nodes, neuron.header, neuron.file_name)
+    if neuron.edge_cones is not None:
+        edges, cones = neuron.edge_cones
+        target = topology.coneIndices(edges[:, 0])
+        new_edges = numpy.empty((len(edges), 2), dtype=numpy.int32)
+        new_edges[target] = topology.position[edges]
+        new_cones = numpy.empty(len(cones), dtype=cones.dtype)
+        new_cones[target] = cones
+        result.edge_cones = (new_edges, new_cones)
+    return result, TreeTopology.fromNeuron(result)
@@ -0,0 +1,172 @@
+'''
+Three component vector math, one vector at a time or many at once.
+
+Vec3 stores its components in __slots__ rather than in a list, so a vector
+is a single small object. Its operators still return new vectors, but the
+in-place operators and addScaled() update a vector without allocating,
+for inner loops such as the hull corners of ConeSegment. It works with /
+on both Python 2 and 3, and accepts plain sequences wherever it accepts a
+vector.
+
+For bulk work the functions at the end of this module apply the same
+operations to Nx3 NumPy arrays, one vector per row; imposter_geometry uses
+them to compute whole neurons at once.
+'''
+
+# Use is subject to Janelia Farm Research Campus Software Copyright 1.1
+# license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
+
+import math
+
+import numpy
+
+
+class Vec3(object):
+    "Mutable three component vector"
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        "Vec3(x, y, z), or Vec3(sequence) for any sequence of three numbers"
+        if hasattr(x, '__len__'):
+            x, y, z = x
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def copy(self):
+        return Vec3(self.x, self.y, self.z)
+
+    def set(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+        return self
+
+    def cross(self, rhs):
+        return Vec3(
+            self.y*rhs[2] - self.z*rhs[1],
+            self.z*rhs[0] - self.x*rhs[2],
+            self.x*rhs[1] - self.y*rhs[0])
+
+    def dot(self, other):
+        return self.x*other[0] + self.y*other[1] + self.z*other[2]
+
+    def norm(self):
+        return math.sqrt(self.normSquared())
+
+    def normSquared(self):
+        return self.x*self.x + self.y*self.y + self.z*self.z
+
+    def normalized(self):
+        return self / self.norm()
+
+    def addScaled(self, other, scale):
+        "self += scale * other, in place"
+        self.x += other[0] * scale
+        self.y += other[1] * scale
+        self.z += other[2] * scale
+        return self
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+        yield self.z
+
+    def __getitem__(self, key):
+        if key == 0 or key == -3:
+            return self.x
+        if key == 1 or key == -2:
+            return self.y
+        if key == 2 or key == -1:
+            return self.z
+        if isinstance(key, slice):
+            return [self.x, self.y, self.z][key]
+        raise IndexError("Vec3 index out of range")
+
+    def __setitem__(self, key, value):
+        setattr(self, self.__slots__[key], value)
+
+    def __repr__(self):
+        return "Vec3(%r, %r, %r)" % (self.x, self.y, self.z)
+
+    def __neg__(self):
+        return Vec3(-self.x, -self.y, -self.z)
+
+    def __add__(self, other):
+        return Vec3(self.x + other[0], self.y + other[1], self.z + other[2])
+
+    def __radd__(self, other):
+        return Vec3(other[0] + self.x, other[1] + self.y, other[2] + self.z)
+
+    def __sub__(self, other):
+        return Vec3(self.x - other[0], self.y - other[1], self.z - other[2])
+
+    def __rsub__(self, other):
+        return Vec3(other[0] - self.x, other[1] - self.y, other[2] - self.z)
+
+    def __mul__(self, other):
+        return Vec3(self.x * other, self.y * other, self.z * other)
+
+    def __rmul__(self, other):
+        return Vec3(other * self.x, other * self.y, other * self.z)
+
+    def __truediv__(self, other):
+        return Vec3(self.x / other, self.y / other, self.z / other)
+
+    __div__ = __truediv__ # Python 2
+
+    def __iadd__(self, other):
+        self.x += other[0]
+        self.y += other[1]
+        self.z += other[2]
+        return self
+
+    def __isub__(self, other):
+        self.x -= other[0]
+        self.y -= other[1]
+        self.z -= other[2]
+        return self
+
+    def __imul__(self, other):
+        self.x *= other
+        self.y *= other
+        self.z *= other
+        return self
+
+    def __itruediv__(self, other):
+        self.x /= other
+        self.y /= other
+        self.z /= other
+        return self
+
+    __idiv__ = __itruediv__ # Python 2
+
+
+# Batched versions, for Nx3 arrays of vectors
+
+def as_array(vectors):
+    "Nx3 float64 array from a sequence of Vec3s or of three number sequences"
+    return numpy.array([tuple(v) for v in vectors], dtype=numpy.float64).reshape(-1, 3)
+
+
+def dots(a, b):
+    "Dot product of each row of a with the same row of b"
+    return numpy.einsum('ij,ij->i', a, b)
+
+
+def norms(v):
+    "Length of each row"
+    return numpy.sqrt(dots(v, v))
+
+
+def normalized(v):
+    "Each row divided by its length"
+    return v / norms(v)[:, None]
+
+
+def crosses(a, b):
+    "Cross product of each row of a with the same row of b, or with one vector b"
+    return numpy.cross(a, b)
@@ -7,225 +7,41 @@
 # Use is subject to Janelia Farm Research Campus Software Copyright 1.1
 # license terms ( http://license.janelia.org/license/jfrc_copyright_1_1.html ).
  
+import sys
+# --frames renders without a window, through offscreen, which must choose
+# the GL platform before OpenGL is first imported
+if __name__ == "__main__" and "--frames" in sys.argv:
+    import offscreen
+
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
 from OpenGL.GL import shaders
-import sys
+import argparse
 import os
 import math
 
+import numpy
+
+from imposter_geometry import cone_parameters, neuron_cone_parameters, transform_cones
+from imposter_geometry import HULL_VERTEX_COUNT, UNIT_HULL_STRIP
+from imposter_shaders import sphere_shader120, cone_shader120, shader_manager
+from imposter_shaders import sphere_instanced_shader120, cone_instanced_shader120
+from imposter_shaders import conservative_depth_supported
+from imposter_vbo import SphereVboSet, ConeVboSet, LodVboSet, SphereInstanceSet, ConeInstanceSet
+from lod import NeuronLod
+from neuron_renderer330 import NeuronRenderer330
+from deferred_shading import GBuffer
+from scene_loader import SceneLoader, neuron_fit
+from brick_pager import BrickPager, DEFAULT_BUDGET
+from frame_stats import FrameStats
+from imposter_immediate import Sphere, ConeSegment
+
 # Some api in the chain is translating the keystrokes to this octal string
 # so instead of saying: ESCAPE = 27, we use the following.
 ESCAPE = '\033'
 
 
-class Vec3():
-    def __init__(self, data):
-        assert len(data) == 3
-        self._data = data
-
-    def cross(self, rhs):
-        return Vec3([
-            self[1]*rhs[2] - self[2]*rhs[1],
-            self[2]*rhs[0] - self[0]*rhs[2],
-            self[0]*rhs[1] - self[1]*rhs[0], ])
-        
-    def dot(self, other):
-        return sum([a*b for a, b in zip(self, other)])
-    
-    def norm(self):
-        return math.sqrt(self.normSquared())
-    
-    def normSquared(self):
-        return self.dot(self)
-    
-    def __len__(self):
-        return len(self._data)
-    
-    def __getitem__(self, key):
-        return self._data[key]
-    
-    def __setitem__(self, key, value):
-        self._data[key] = value
-    
-    def __add__(self, other):
-        return Vec3( [l+r for l,r in zip(self, other)] )
-    
-    def __radd__(self, other):
-        return Vec3( [r+l for l,r in zip(self, other)] )
-    
-    def __sub__(self, other):
-        return Vec3( [l-r for l,r in zip(self, other)] )
-    
-    def __rsub__(self, other):
-        return Vec3( [r-l for l,r in zip(self, other)] )
-    
-    def __mul__(self, other):
-        return Vec3( [l*other for l in self] )
-
-    def __rmul__(self, other):
-        return Vec3( [other*l for l in self] )
-    
-    def __div__(self, other):
-        return Vec3( [l/other for l in self] )
-    
-
-class ConeSegment():
-    # Cone segment that exactly joins two spheres
-    def __init__(self, sphere1, sphere2):
-        self.sphere1 = sphere1
-        self.sphere2 = sphere2
-        cs1 = Vec3(sphere1.center)
-        cs2 = Vec3(sphere2.center)
-        rs1 = sphere1.radius
-        rs2 = sphere2.radius
-        # Swap so r2 is always the largest
-        if rs2 < rs1:
-            rs1, rs2 = rs2, rs1
-            cs1, cs2 = cs2, cs1
-        # Shift cone parts to fit radius offset
-        d = (cs2 - cs1).norm() # distance between sphere centers
-        # half cone angle, to just touch each sphere
-        sinAlpha = (rs2 - rs1) / d;
-        cosAlpha = math.sqrt(1 - sinAlpha*sinAlpha)
-        # Actual cone terminal radii might be smaller than sphere radii
-        r1 = cosAlpha * rs1
-        r2 = cosAlpha * rs2
-        # Cone termini might not lie at sphere centers
-        aHat = (cs1 - cs2) / d
-        dC1 = sinAlpha * rs1 * aHat
-        dC2 = sinAlpha * rs2 * aHat
-        # Cone termini
-        c1 = cs1 + dC1
-        c2 = cs2 + dC2
-        # Final cone parameters
-        self.axis = (c1 - c2) / 2.0
-        self.length = self.axis.norm() * 2.0
-        self.center = (c1 + c2) / 2.0
-        self.taper = (r2 - r1) / self.length
-        self.radius = (r1 + r2) / 2.0
-        self.r1 = r1
-        self.r2 = r2
-
-    def generateBoundingGeometryImmediate(self):
-        "This method should be developed into a host imposter geometry example"
-        # TODO - correct this shape for cone
-        
-        # Compute principal axes of bounding geometry
-        d = self.axis.norm()
-        xHat = self.axis / d # X along cone axis
-        # Y along any orthogonal axis
-        # To avoid numerical problems, try two different ways to create first orthogonal vector
-        yHat1 = xHat.cross([1.0, 0.0, 0.0])
-        yHat2 = xHat.cross([0.0, 0.0, 1.0])
-        if yHat1.normSquared() >= yHat2.normSquared():
-            yHat = yHat1
-        else:
-            yHat = yHat2
-        yHat = yHat / yHat.norm()
-        zHat = xHat.cross(yHat) # Third and final axis is simple
-        
-        # Draw bounding box geometry, three faces at a time
-        # Bottom front top
-        x = self.center[0]
-        y = self.center[1]
-        z = self.center[2]
-        glBegin(GL_TRIANGLE_STRIP)
-        for corner in [
-                    [-1, -1, -1], [1, -1, -1], [-1, -1, 1], [1, -1, 1], # bottom 
-                    [-1, 1, 1], [1, 1, 1], # front
-                    [-1, 1, -1], [1, 1, -1], # top
-                     ]:
-            # Encode imposter geometry offset from sphere center into normal attribute
-            # X axis points toward smaller end of cone
-            if corner[0] > 0:
-                r = self.r1 # smaller end
-            else:
-                r = self.r2 # larger end
-            p = (   corner[0] * xHat * d
-                  + corner[1] * yHat * r
-                  + corner[2] * zHat * r )
-            glNormal3f(p[0], p[1], p[2])
-            # Position attribute always contains cone centroid and central radius
-            glVertex4f(x, y, z, self.radius)
-            # Encode additional parameters, cone axis and taper, in 
-            glTexCoord4f(self.axis[0], self.axis[1], self.axis[2], self.taper)
-        glEnd()
-        # left back right
-        glBegin(GL_TRIANGLE_STRIP)
-        for corner in [
-                    [-1, -1, 1], [-1, 1, 1], [-1, -1, -1], [-1, 1, -1], # left 
-                    [1, -1, -1], [1, 1, -1], # back 
-                    [1, -1, 1], [1, 1, 1] # right,
-                     ]:
-            # Encode imposter geometry offset from sphere center into normal attribute
-            # X axis points toward smaller end of cone
-            if corner[0] > 0:
-                r = self.r1 # smaller end
-            else:
-                r = self.r2 # larger end
-            p = (   corner[0] * xHat * d
-                  + corner[1] * yHat * r
-                  + corner[2] * zHat * r )
-            # Encode additional parameters, cone axis and taper, in texture coordinate
-            glTexCoord4f(self.axis[0], self.axis[1], self.axis[2], self.taper)
-            # Encode geometry offset from cone centroid in normal vector
-            glNormal3f(p[0], p[1], p[2])
-            # Position attribute always contains cone centroid and central radius
-            glVertex4f(x, y, z, self.radius)        
-        glEnd()
-
-
-class Sphere():
-    "Class representing a sphere to be rendered"
-    def __init__(self, center, radius):
-        self.center = center
-        self.radius = radius
-
-    def generateBoundingGeometryImmediate(self):
-        "This method should be developed into a host imposter geometry example"
-        # Draw bounding cube geometry, three faces at a time
-        # Bottom front top
-        x = self.center[0]
-        y = self.center[1]
-        z = self.center[2]
-        glBegin(GL_TRIANGLE_STRIP)
-        for corner in [
-                    [-1, -1, -1], [1, -1, -1], [-1, -1, 1], [1, -1, 1], # bottom 
-                    [-1, 1, 1], [1, 1, 1], # front
-                    [-1, 1, -1], [1, 1, -1], # top
-                     ]:
-            # Encode imposter geometry offset from sphere center into normal attribute
-            glNormal3f(corner[0]*self.radius, corner[1]*self.radius, corner[2]*self.radius)
-            # Position attribute always contains sphere center and radius
-            glVertex4f(x, y, z, self.radius)        
-        glEnd()
-        # left back right
-        glBegin(GL_TRIANGLE_STRIP)
-        for corner in [
-                    [-1, -1, 1], [-1, 1, 1], [-1, -1, -1], [-1, 1, -1], # left 
-                    [1, -1, -1], [1, 1, -1], # back 
-                    [1, -1, 1], [1, 1, 1] # right,
-                     ]:
-            # Encode imposter geometry offset from sphere center into normal attribute
-            glNormal3f(corner[0]*self.radius, corner[1]*self.radius, corner[2]*self.radius)
-            # Position attribute always contains sphere center and radius
-            glVertex4f(x, y, z, self.radius)        
-        glEnd()
-
-
-class SphereSet(list):
-    def __init__(self):
-        list.__init__(self)
-        self.mode = "imposters"
-
-    def drawGL(self):
-        # shaders.glUseProgram(self.sphere_shader)
-        for sphere in self:
-            sphere.generateBoundingGeometryImmediate()
-
-
 class SimpleImposterViewer:
         def __init__(self):
             # Rotation angle for animation
@@ -234,6 +50,25 @@ class SimpleImposterViewer:
             self.window = 0
             self.ambientOnly = False
             self.diffuseOnly = False
+            # How to draw neurons from SWC files: "scene" (all neurons in shared
+            # GLSL 1.20 buffers, shown as they load), "vbo" (GLSL 1.20, one culled
+            # set per neuron), "instanced" (GLSL 1.20, one shared unit hull), "lod"
+            # (simplified GLSL 1.20), "330" (geometry shaders) or "bricks" (instanced,
+            # paged in from brick_pager files)
+            self.neuronRenderMode = "scene"
+            # Store the instanced and brick paths in 16 bit integer positions and half float radii
+            self.compactInstances = False
+            # Directory of brick_pager.write_bricks() files, and bytes of them kept resident
+            self.brickDirectory = None
+            self.brickBudget = DEFAULT_BUDGET
+            self.brick_pager = None
+            # Light the 330 path once per pixel, from a G-buffer
+            self.deferredShading = False
+            self.gbuffer = GBuffer()
+            # Frame time profiling, created with the GL context
+            self.stats = None
+            self.showStats = False # draw the profiling overlay
+            self.headless = None # OffscreenContext when drawing without a window
             
         # A general OpenGL initialization function.  Sets all of the initial parameters. 
         def InitGL(self, Width, Height):                # We call this right after our OpenGL window is created.
@@ -276,16 +111,15 @@ class SimpleImposterViewer:
                 glMaterialfv(GL_FRONT, GL_SPECULAR, GLfloat_4(0.8, 0.8, 0.8, 1.0) )
                 glMaterialf(GL_FRONT, GL_SHININESS, 100.0) # max is 128 on cyberbear
             
-            source_path = os.path.dirname(os.path.abspath(__file__))
-            # Read utility functions from file
-            with open (os.path.join(source_path, "../glsl/imposter_fns_frag120.glsl"), "r") as myfile:
-                frag_fns_str = myfile.read()
-            with open (os.path.join(source_path, "../glsl/imposter_fns120.glsl"), "r") as myfile:
-                glsl_fns_str = myfile.read()
+            # Shared sources are read and compiled once, and linked programs
+            # are reloaded from the program binary cache on later launches
+            manager = shader_manager()
+            frag_fns_str = manager.source("imposter_fns_frag120.glsl")
+            glsl_fns_str = manager.source("imposter_fns120.glsl")
                 
             # Create a test shader for debugging, which just colors everything green.
-            self.green_shader = shaders.compileProgram(
-                shaders.compileShader(
+            self.green_shader = manager.program([
+                (
                         """
                         #version 120
                         
@@ -293,8 +127,8 @@ class SimpleImposterViewer:
                             gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
                         }
                         """, GL_VERTEX_SHADER), 
-                shaders.compileShader(frag_fns_str, GL_FRAGMENT_SHADER),
-                shaders.compileShader(
+                (frag_fns_str, GL_FRAGMENT_SHADER),
+                (
                         """
                         #version 120
                         
@@ -303,12 +137,12 @@ class SimpleImposterViewer:
                         void main() { 
                             set_green_color();
                         }
-                        """, GL_FRAGMENT_SHADER)
-            )
+                        """, GL_FRAGMENT_SHADER),
+            ])
 
             # Create another shader that illuminates standard mesh geometry with             
-            self.light_rig_shader = shaders.compileProgram(
-                shaders.compileShader(
+            self.light_rig_shader = manager.program([
+                (
                         """
                         #version 120
                         
@@ -323,8 +157,8 @@ class SimpleImposterViewer:
                             surface_color = gl_Color.rgb;
                         }
                         """, GL_VERTEX_SHADER), 
-                shaders.compileShader(glsl_fns_str, GL_FRAGMENT_SHADER),
-                shaders.compileShader(
+                (glsl_fns_str, GL_FRAGMENT_SHADER),
+                (
                         """
                         #version 120
                         
@@ -340,183 +174,15 @@ class SimpleImposterViewer:
                                 light_rig(pos1, normalize(normal), surface_color),
                                 1);
                         }
-                        """, GL_FRAGMENT_SHADER)
-            )
-
-            # Create shader for sphere imposters        
-            self.sphere_shader = shaders.compileProgram(
-                shaders.compileShader(glsl_fns_str, GL_VERTEX_SHADER),
-                shaders.compileShader(
-                        """
-                        #version 120
-                        
-                        varying vec4 pos1;
-                        varying vec4 surface_color;
-                        
-                        varying float radius;
-                        varying vec2 pc_c2;
-                        varying vec3 center;
-                        
-                        // defined in imposter_fns120.glsl
-                        vec2 sphere_linear_coeffs(vec3 center, float radius, vec3 pos);
-
-                        void main() {
-                            // imposter geometry is sum of sphere center and normal
-                            vec4 pos_local = vec4(gl_Vertex.xyz + gl_Normal.xyz, 1);
-                            radius = gl_Vertex.w;
-                            
-                            pos1 = gl_ModelViewMatrix * pos_local;
-                            gl_Position = gl_ProjectionMatrix * pos1;
-                            surface_color = gl_Color.rgba;
-                            
-                            // TODO - hard coding sphere parameters for the moment...
-                            // radius = 1.0; // TODO - test non-1.0 values
-                            vec4 c = gl_ModelViewMatrix * vec4(gl_Vertex.xyz, 1);
-                            center = c.xyz/c.w;
-                            pc_c2 = sphere_linear_coeffs(center, radius, pos1.xyz/pos1.w);
-                        }
-                        """, GL_VERTEX_SHADER), 
-                shaders.compileShader(glsl_fns_str, GL_FRAGMENT_SHADER),
-                shaders.compileShader(
-                        """
-                        #version 120
-
-                        varying vec4 pos1;
-                        varying vec4 surface_color;
-                        varying float radius;
-                        varying vec3 center;
-                        varying vec2 pc_c2;
-                        
-                        // defined in imposter_fns120.glsl
-                        vec2 sphere_nonlinear_coeffs(vec3 pos, vec2 pc_c2);
-                        vec3 sphere_surface_from_coeffs(vec3 pos, vec2 pc_c2, vec2 a2_d);
-                        vec3 light_rig(vec4 pos, vec3 normal, vec3 color);
-                        float fragDepthFromEyeXyz(vec3 eyeXyz);
-                        
-                        void main() {
-                            vec3 pos = pos1.xyz/pos1.w;
-                            vec2 a2_d = sphere_nonlinear_coeffs(pos, pc_c2);
-                            if (a2_d.y <= 0)
-                                discard; // Point does not intersect sphere
-                            vec3 s = sphere_surface_from_coeffs(pos, pc_c2, a2_d);
-                            vec3 normal = 1.0 / radius * (s - center);
-                            gl_FragColor = vec4(
-                                light_rig(vec4(s, 1), normal, surface_color.rgb),
-                                1);
-                            gl_FragDepth = fragDepthFromEyeXyz(s);
-                        }
-                        """, GL_FRAGMENT_SHADER)
-            )
-            
-            # Create shader for cone imposters        
-            self.cone_shader = shaders.compileProgram(
-                shaders.compileShader(glsl_fns_str, GL_VERTEX_SHADER),
-                shaders.compileShader(
-                        """
-                        #version 120
-                        
-                        varying vec3 pos;
-                        varying vec4 surface_color;
-                        
-                        // primary cone parameters
-                        varying float radius;
-                        varying vec3 center;
-                        varying float taper;
-                        varying float halfConeLength; // For truncating ends
-                        varying vec3 aHat; // unit cone axis
-                        
-                        // derived linear ray casting parameters, best computed in vertex/geometry shader
-                        varying float tAP, qe_c, qe_half_b;
-                        varying vec3 qe_undot_half_a;
-                        varying float normalScale;
-                        
-                        // function prototypes from imposter_fns120.glsl
-                        void cone_linear_coeffs(vec3 center, float radius, vec3 axis, float taper, vec3 pos,
-                            out float tAP, out float qe_c, out float qe_half_b, out vec3 qe_undot_half_a);
-
-                        void main() {
-                            // imposter geometry is sum of sphere center and normal
-                            vec4 pos_local = vec4(gl_Vertex.xyz + gl_Normal.xyz, 1);
-                            radius = gl_Vertex.w;
-                            
-                            vec4 pos1 = gl_ModelViewMatrix * pos_local;
-                            gl_Position = gl_ProjectionMatrix * pos1;
-                            surface_color = gl_Color.rgba;
-
-                            vec4 c = gl_ModelViewMatrix * vec4(gl_Vertex.xyz, 1);
-                            center = c.xyz/c.w;
-                            
-                            // Cone axis and taper are shoehorned into the texture coordinate
-                            vec3 axis = (gl_ModelViewMatrix * vec4(gl_MultiTexCoord0.xyz, 0)).xyz;
-                            halfConeLength = length(axis);
-                            taper = gl_MultiTexCoord0.w;
-                            
-                            pos = pos1.xyz/pos1.w;
-                            cone_linear_coeffs(center, radius, axis, taper, pos, 
-                                tAP, qe_c, qe_half_b, qe_undot_half_a);
-
-                            aHat = normalize(axis);
-                            normalScale  = 1.0 / sqrt(1.0 + taper*taper);
-                        }
-                        """, GL_VERTEX_SHADER), 
-                shaders.compileShader(glsl_fns_str, GL_FRAGMENT_SHADER),
-                shaders.compileShader(
-                        """
-                        #version 120
-
-                        varying vec3 pos;
-                        varying vec4 surface_color;
-                        
-                        // primary cone parameters
-                        varying float radius;
-                        varying vec3 center;
-                        varying float taper;
-                        varying float halfConeLength; // For truncating ends
-                        varying vec3 aHat; // unit cone axis
-                        
-                        // derived linear ray casting parameters, best computed in vertex/geometry shader
-                        varying float tAP, qe_c, qe_half_b;
-                        varying vec3 qe_undot_half_a;
-                        varying float normalScale;
-                        
-                        // prototypes defined in imposter_fns120.glsl
-                        bool cone_imposter_frag(
-                                in vec3 surface_color,
-                                in vec3 pos, // location of imposter geometry fragment
-                                in vec3 aHat, // unit cone axis
-                                in float halfConeLength,
-                                in vec3 center,
-                                in float taper,
-                                in float tAP,
-                                in float qe_c,
-                                in float qe_half_b,
-                                in vec3 qe_undot_half_a, 
-                                in float normalScale,
-                                out vec4 fragColor,
-                                out float fragDepth);
-                        
-                        void main() {
-
-                            if ( ! cone_imposter_frag(
-                                    surface_color.rgb,
-                                    pos,
-                                    aHat,
-                                    halfConeLength,
-                                    center,
-                                    taper,
-                                    tAP,
-                                    qe_c,
-                                    qe_half_b,
-                                    qe_undot_half_a,
-                                    normalScale,
-                                    gl_FragColor,
-                                    gl_FragDepth) ) 
-                            {
-                                discard;
-                            }
-                        }
-                        """, GL_FRAGMENT_SHADER)
-            )
+                        """, GL_FRAGMENT_SHADER),
+            ])
+
+            # Create shaders for sphere and cone imposters
+            self.sphere_shader = sphere_shader120()
+            self.cone_shader = cone_shader120()
+            self.sphere_instanced_shader = sphere_instanced_shader120()
+            self.cone_instanced_shader = cone_instanced_shader120()
+            self.stats = FrameStats(history=self.statsHistory)
             
             
         # The function called when our window is resized (which shouldn't happen if you enable fullscreen, below)
@@ -532,6 +198,7 @@ class SimpleImposterViewer:
         
         # The main drawing function. 
         def DrawGLScene(self):
+            self.stats.beginFrame()
             
             glEnable( GL_LIGHTING ) 
             glEnable(GL_LIGHT1)
@@ -546,51 +213,229 @@ class SimpleImposterViewer:
             
             
             
-            # Leftmost sphere is shaded using the fixed function pipeline
-            glTranslatef(-1.6,0.0,0);             # Move Left
-            # drawTriangle()
-            glColor3f(0.8, 0.5, 0.2)
-            shaders.glUseProgram(0)
-            glutSolidSphere(1.0, 20, 20)
-            shaders.glUseProgram(0)
-
-            # Middle sphere is an imposter            
-            glTranslatef( 1.6,0.0,0);
-            # Move Right
-            glColor3f(0.2, 0.5, 0.8)
-            self.renderSphereImposterImmediate(Sphere( [0, -0.2, 0], 1.1) )
-
-            glColor3f(0.1, 0.7, 0.1)
-            self.renderSphereImposterImmediate(Sphere( [-0.5, -1.2, 0], 0.8) )
-
-            sph1 = Sphere([0, 1.1, 0], 0.9)
-            sph2 = Sphere([1.2, 1.5, 0], 0.5)
-            self.renderSphereImposterImmediate(sph1)
-            self.renderSphereImposterImmediate(sph2)
-            cone = ConeSegment(sph1, sph2)
-            self.renderConeImposterImmediate(cone)
+            with self.stats.measure("demo"):
+                # Leftmost sphere is shaded using the fixed function pipeline
+                glTranslatef(-1.6,0.0,0);             # Move Left
+                # drawTriangle()
+                glColor3f(0.8, 0.5, 0.2)
+                shaders.glUseProgram(0)
+                self.solidSphere()
+                shaders.glUseProgram(0)
+
+                # Middle sphere is an imposter            
+                glTranslatef( 1.6,0.0,0);
+                # Move Right
+                glColor3f(0.2, 0.5, 0.8)
+                self.renderSphereImposterImmediate(Sphere( [0, -0.2, 0], 1.1) )
+
+                glColor3f(0.1, 0.7, 0.1)
+                self.renderSphereImposterImmediate(Sphere( [-0.5, -1.2, 0], 0.8) )
+
+                sph1 = Sphere([0, 1.1, 0], 0.9)
+                sph2 = Sphere([1.2, 1.5, 0], 0.5)
+                self.renderSphereImposterImmediate(sph1)
+                self.renderSphereImposterImmediate(sph2)
+                cone = ConeSegment(sph1, sph2)
+                self.renderConeImposterImmediate(cone)
             
-            shaders.glUseProgram(self.sphere_shader)
-            self.imposter_spheres.drawGL()
+                shaders.glUseProgram(self.sphere_shader)
+                self.imposter_spheres.drawGL()
             
-            shaders.glUseProgram(self.cone_shader)
-            self.imposter_cones.drawGL()
+                shaders.glUseProgram(self.cone_shader)
+                self.imposter_cones.drawGL()
+            
+            self.renderNeurons()
 
             # Right sphere is a standard mesh, shaded with GLSL
-            glTranslatef( 1.6, 0.0, 0);             # Move Right
-            glColor3f(0.2, 0.8, 0.5)
-            # TODO - use as imposter
-            shaders.glUseProgram(self.light_rig_shader)
-            glColor3f(0.8, 0.5, 0.2)
-            glutSolidSphere(1.0, 20, 20)
-            # drawTriangle()
-            shaders.glUseProgram(0)
+            with self.stats.measure("demo"):
+                glTranslatef( 1.6, 0.0, 0);             # Move Right
+                glColor3f(0.2, 0.8, 0.5)
+                # TODO - use as imposter
+                shaders.glUseProgram(self.light_rig_shader)
+                glColor3f(0.8, 0.5, 0.2)
+                self.solidSphere()
+                # drawTriangle()
+                shaders.glUseProgram(0)
             
+            if self.showStats:
+                with self.stats.measure("overlay"):
+                    self.drawStatsOverlay()
+            self.stats.endFrame()
             #  since this is double buffered, swap the buffers to display what just got drawn. 
-            glutSwapBuffers()
+            if self.headless is None:
+                glutSwapBuffers()
             self.yrot += 1.00
             # print self.yrot
         
+        def solidSphere(self):
+            "Unit mesh sphere; GLUT shapes need a GLUT window, so draw with GLU when headless"
+            if self.headless is None:
+                glutSolidSphere(1.0, 20, 20)
+            else:
+                gluSphere(self.quadric, 1.0, 20, 20)
+        
+        def drawStatsOverlay(self):
+            "Rolling frame statistics, as text in the top left corner of the window"
+            if self.headless is not None:
+                return # no GLUT fonts without a window
+            glPushAttrib(GL_ENABLE_BIT | GL_CURRENT_BIT)
+            glDisable(GL_LIGHTING)
+            glDisable(GL_DEPTH_TEST)
+            glColor3f(1.0, 1.0, 0.6)
+            height = glGetIntegerv(GL_VIEWPORT)[3]
+            for row, line in enumerate(self.stats.overlayLines()):
+                glWindowPos2i(8, height - 16 * (row + 1))
+                for character in line:
+                    glutBitmapCharacter(GLUT_BITMAP_8_BY_13, ord(character))
+            glPopAttrib()
+        
+        def countDrawn(self, name, sets, vertices_per_primitive):
+            "Record the imposters and vertices submitted by the last drawGL() of each set"
+            for drawn in sets:
+                self.stats.count(name, drawn.drawn_count,
+                        drawn.drawn_count * vertices_per_primitive)
+        
+        def neuronFit(self, neuron):
+            "Center and scale factor to shrink a neuron to fit near the origin"
+            return neuron_fit(neuron)
+        
+        def createNeuronImposters(self, neuron):
+            "Sphere and cone VBO sets for one neuron, shrunk to fit near the origin"
+            center, scale = self.neuronFit(neuron)
+            xyz = (neuron.xyz - center) * scale
+            radius = neuron.radius * scale
+            # Cones scale with the neuron, so cached parameters can be reused
+            edges, cones = neuron_cone_parameters(neuron)
+            cones = transform_cones(cones, center, scale)
+            # Large neurons are mostly off screen when zoomed in, so cull them
+            return SphereVboSet(xyz, radius, cull=True), ConeVboSet(cones, cull=True)
+        
+        def createNeuronInstances(self, neuron):
+            "Instanced sphere and cone sets for one neuron, shrunk to fit near the origin"
+            center, scale = self.neuronFit(neuron)
+            edges, cones = neuron_cone_parameters(neuron)
+            return (SphereInstanceSet((neuron.xyz - center) * scale, neuron.radius * scale,
+                            cull=True, compact=self.compactInstances),
+                    ConeInstanceSet(transform_cones(cones, center, scale),
+                            cull=True, compact=self.compactInstances))
+        
+        def createNeuronLod(self, neuron):
+            "Simplified imposters for one neuron, shrunk to fit near the origin"
+            center, scale = self.neuronFit(neuron)
+            return LodVboSet(NeuronLod((neuron.xyz - center) * scale,
+                    neuron.radius * scale, neuron.parent))
+        
+        def pollScene(self):
+            "Take neurons that finished loading since the last frame, at most one per frame"
+            for index in self.scene_loader.poll(limit=1):
+                self.neurons.append(self.scene_loader.neurons[index])
+            for error in self.scene_loader.errors[self.reported_error_count:]:
+                print "Could not load", error
+            self.reported_error_count = len(self.scene_loader.errors)
+        
+        def perNeuron(self, objects, create):
+            "Extend a list of per neuron objects with create(neuron) for newly loaded neurons"
+            for neuron in self.neurons[len(objects):]:
+                objects.append(create(neuron))
+            return objects
+        
+        def renderNeurons(self):
+            with self.stats.measure("load"):
+                self.pollScene()
+            if self.neuronRenderMode == "scene":
+                with self.stats.measure("spheres"):
+                    shaders.glUseProgram(self.sphere_shader)
+                    self.scene_loader.drawSpheresGL()
+                with self.stats.measure("cones"):
+                    shaders.glUseProgram(self.cone_shader)
+                    self.scene_loader.drawConesGL()
+                self.countDrawn("spheres", [self.scene_loader.spheres], HULL_VERTEX_COUNT)
+                self.countDrawn("cones", [self.scene_loader.cones], HULL_VERTEX_COUNT)
+            elif self.neuronRenderMode == "330":
+                renderers = self.perNeuron(self.neuron_renderers330, NeuronRenderer330.fromNeuron)
+                # Geometry shaders draw spheres and cones of each neuron in one call
+                with self.stats.measure("neurons330"):
+                    if self.deferredShading:
+                        self.gbuffer.beginGL()
+                    for neuron, renderer in zip(self.neurons, renderers):
+                        # Shrink the neuron with the model view matrix, and its radii to match
+                        center, scale = self.neuronFit(neuron)
+                        glPushMatrix()
+                        glScalef(scale, scale, scale)
+                        glTranslatef(-center[0], -center[1], -center[2])
+                        renderer.radiusScale = scale
+                        renderer.deferred = self.deferredShading
+                        renderer.drawGL(glGetFloatv(GL_MODELVIEW_MATRIX),
+                                glGetFloatv(GL_PROJECTION_MATRIX))
+                        glPopMatrix()
+                    if self.deferredShading:
+                        self.gbuffer.endGL()
+                if self.deferredShading:
+                    with self.stats.measure("lighting"):
+                        self.gbuffer.resolveGL(glGetFloatv(GL_PROJECTION_MATRIX))
+                for renderer in renderers:
+                    # One point per sphere and two indices per cone
+                    self.stats.count("neurons330", len(renderer.nodes) + len(renderer.lines) // 2,
+                            len(renderer.nodes) + renderer.lines.size)
+            elif self.neuronRenderMode == "instanced":
+                self.perNeuron(self.neuron_instances, self.createNeuronInstances)
+                with self.stats.measure("spheres"):
+                    shaders.glUseProgram(self.sphere_instanced_shader)
+                    for spheres, cones in self.neuron_instances:
+                        spheres.drawGL()
+                with self.stats.measure("cones"):
+                    shaders.glUseProgram(self.cone_instanced_shader)
+                    for spheres, cones in self.neuron_instances:
+                        cones.drawGL()
+                self.countDrawn("spheres", [spheres for spheres, cones in self.neuron_instances],
+                        len(UNIT_HULL_STRIP))
+                self.countDrawn("cones", [cones for spheres, cones in self.neuron_instances],
+                        len(UNIT_HULL_STRIP))
+            elif self.neuronRenderMode == "bricks":
+                # Draws whatever is resident; missing bricks arrive in later frames
+                with self.stats.measure("load"):
+                    self.brick_pager.updateGL(glGetFloatv(GL_MODELVIEW_MATRIX),
+                            glGetFloatv(GL_PROJECTION_MATRIX))
+                with self.stats.measure("spheres"):
+                    shaders.glUseProgram(self.sphere_instanced_shader)
+                    self.brick_pager.drawSpheresGL()
+                with self.stats.measure("cones"):
+                    shaders.glUseProgram(self.cone_instanced_shader)
+                    self.brick_pager.drawConesGL()
+                bricks = self.brick_pager.visibleSets()
+                self.countDrawn("spheres", [spheres for spheres, cones in bricks], len(UNIT_HULL_STRIP))
+                self.countDrawn("cones", [cones for spheres, cones in bricks], len(UNIT_HULL_STRIP))
+            elif self.neuronRenderMode == "lod":
+                self.perNeuron(self.neuron_lods, self.createNeuronLod)
+                with self.stats.measure("lod select"):
+                    for lod in self.neuron_lods:
+                        lod.selectGL()
+                with self.stats.measure("spheres"):
+                    shaders.glUseProgram(self.sphere_shader)
+                    for lod in self.neuron_lods:
+                        lod.drawSpheresGL()
+                with self.stats.measure("cones"):
+                    shaders.glUseProgram(self.cone_shader)
+                    for lod in self.neuron_lods:
+                        lod.drawConesGL()
+                self.countDrawn("spheres", [lod.spheres for lod in self.neuron_lods], HULL_VERTEX_COUNT)
+                self.countDrawn("cones", [lod.cones for lod in self.neuron_lods], HULL_VERTEX_COUNT)
+            else:
+                self.perNeuron(self.neuron_imposters, self.createNeuronImposters)
+                with self.stats.measure("spheres"):
+                    shaders.glUseProgram(self.sphere_shader)
+                    for spheres, cones in self.neuron_imposters:
+                        spheres.drawGL()
+                with self.stats.measure("cones"):
+                    shaders.glUseProgram(self.cone_shader)
+                    for spheres, cones in self.neuron_imposters:
+                        cones.drawGL()
+                self.countDrawn("spheres", [spheres for spheres, cones in self.neuron_imposters],
+                        HULL_VERTEX_COUNT)
+                self.countDrawn("cones", [cones for spheres, cones in self.neuron_imposters],
+                        HULL_VERTEX_COUNT)
+            shaders.glUseProgram(0)
+        
         def renderConeImposterImmediate(self, cone):
             shaders.glUseProgram(self.cone_shader)
             cone.generateBoundingGeometryImmediate()
@@ -603,24 +448,152 @@ class SimpleImposterViewer:
         def keyPressed(self, *args):
             # If escape is pressed, kill everything.
             if args[0] == ESCAPE:
+                self.writeReport()
                 sys.exit()
                 pass
+            # "m" toggles between neuron render paths
+            elif args[0] == 'm':
+                modes = ["scene", "vbo", "instanced", "lod", "330"]
+                if self.brick_pager is not None:
+                    modes.append("bricks")
+                self.neuronRenderMode = modes[
+                        (modes.index(self.neuronRenderMode) + 1) % len(modes)]
+                print "Neuron render mode:", self.neuronRenderMode
+            # "h" cycles through sphere imposter hull strategies of the 330 path
+            elif args[0] == 'h':
+                strategies = ["far", "near", "mid"]
+                for renderer in self.neuron_renderers330:
+                    renderer.hullStrategy = strategies[
+                            (strategies.index(renderer.hullStrategy) + 1) % len(strategies)]
+                    print "Sphere hull strategy:", renderer.hullStrategy
+            # "z" toggles early depth testing of the 330 path, with conservative depth
+            elif args[0] == 'z':
+                if not conservative_depth_supported():
+                    print "Conservative depth needs GL 4.2 or GL_ARB_conservative_depth"
+                    return
+                for renderer in self.neuron_renderers330:
+                    renderer.conservativeDepth = not renderer.conservativeDepth
+                    print "Conservative depth:", renderer.conservativeDepth
+            # "o" toggles front to back ordering of the 330 path
+            elif args[0] == 'o':
+                for renderer in self.neuron_renderers330:
+                    renderer.depthSort = not renderer.depthSort
+                    print "Front to back order:", renderer.depthSort
+            # "v" toggles vertex pulling, without geometry shaders, in the 330 path
+            elif args[0] == 'v':
+                for renderer in self.neuron_renderers330:
+                    renderer.vertexPulling = not renderer.vertexPulling
+                    print "Vertex pulling:", renderer.vertexPulling
+            # "g" toggles deferred shading of the 330 path
+            elif args[0] == 'g':
+                self.deferredShading = not self.deferredShading
+                print "Deferred shading:", self.deferredShading
+            # "k" cycles the per node coloring of the 330 path
+            elif args[0] == 'k':
+                schemes = ["uniform", "type", "distance", "order"]
+                for renderer in self.neuron_renderers330:
+                    renderer.colorBy = schemes[
+                            (schemes.index(renderer.colorBy) + 1) % len(schemes)]
+                    print "Color by:", renderer.colorBy
+            # "c" toggles view frustum culling of the VBO and instanced paths
+            elif args[0] == 'c':
+                for spheres, cones in self.neuron_imposters + self.neuron_instances:
+                    spheres.culling = cones.culling = not spheres.culling
+                    print "Frustum culling:", spheres.culling
+            # "f" toggles the frame statistics overlay
+            elif args[0] == 'f':
+                self.showStats = not self.showStats
+            # "p" prints frame statistics of recent frames
+            elif args[0] == 'p':
+                self.stats.finishGL()
+                print self.stats.report()
+                self.printBrickStats()
         
-        def show(self, files):
+        def printBrickStats(self):
+            "Cache counters of the brick path, if it has a brick directory"
+            if self.brick_pager is not None:
+                stats = self.brick_pager.stats()
+                print "Bricks: %d of %d resident, %.1f of %.1f MB; %d hits, %d misses, %d evictions" % (
+                        stats['resident_bricks'], stats['bricks'], stats['resident_bytes'] / 1e6,
+                        stats['budget'] / 1e6, stats['hits'], stats['misses'], stats['evictions'])
+        
+        def writeReport(self):
+            "Print and save frame statistics, as requested on the command line"
+            self.stats.finishGL()
+            if self.report:
+                print self.stats.report()
+                self.printBrickStats()
+            if self.jsonFile is not None:
+                self.stats.writeJson(self.jsonFile)
+        
+        def runHeadless(self, frames, width=640, height=480):
+            "Draw frames into an offscreen framebuffer, with every neuron loaded first"
+            self.headless = offscreen.OffscreenContext(width, height)
+            self.quadric = gluNewQuadric()
+            self.InitGL(width, height)
+            self.ReSizeGLScene(width, height)
+            # Time the complete scene, not the loading
+            self.scene_loader.wait()
+            self.neurons = self.scene_loader.loadedNeurons()
+            self.pollScene() # report files that failed to load
+            self.DrawGLScene() # upload buffers and compile shaders before timing
+            if self.brick_pager is not None:
+                # Bricks of the first view, all resident before timing
+                self.brick_pager.wait()
+                self.brick_pager.uploadGL()
+                self.DrawGLScene()
+            self.headless.finish()
+            self.stats.reset()
+            for frame in range(frames):
+                self.DrawGLScene()
+                self.headless.finish()
+            self.writeReport()
+            self.stats.deleteGL()
+            if self.brick_pager is not None:
+                self.brick_pager.deleteGL()
+                self.brick_pager.close()
+            self.headless.destroy()
+        
+        def show(self, files, frames=None, mode="scene", report=False, jsonFile=None):
+            '''
+            Open a window, or with frames, draw that many frames without one.
+            report prints a summary of frame statistics at exit, and jsonFile
+            names a file to write them to.
+            '''
+            self.neuronRenderMode = mode
+            self.report = report
+            self.jsonFile = jsonFile
+            # Headless runs keep every frame, for the regression report
+            self.statsHistory = None if frames is not None else 240
             # Maybe read swc file from command line
             if len(files) > 0:
                 self.swc_files = files
             else:
                 self.swc_files = None
-
-            s1 = Sphere([0, 2.1, 0], 0.9)
-            s2 = Sphere([1.2, 2.5, 0], 0.5)
-            self.imposter_spheres = SphereSet()
-            self.imposter_spheres.append(s1)
-            self.imposter_spheres.append(s2)
-            
-            self.imposter_cones = SphereSet()
-            self.imposter_cones.append(ConeSegment(s1, s2))            
+            # Files load in worker processes, started before the window so that
+            # they do not inherit a GL context; renderNeurons() picks them up
+            self.scene_loader = SceneLoader(self.swc_files or [])
+            if self.brickDirectory is not None:
+                # The loading thread starts at once, and reads bricks as frames ask for them
+                self.brick_pager = BrickPager(self.brickDirectory, self.brickBudget,
+                        compact=self.compactInstances)
+            self.neurons = []
+            self.reported_error_count = 0
+
+            # Sphere and cone imposters drawn from vertex buffer objects
+            centers = numpy.array([[0, 2.1, 0], [1.2, 2.5, 0]])
+            radii = numpy.array([0.9, 0.5])
+            self.imposter_spheres = SphereVboSet(centers, radii)
+            self.imposter_cones = ConeVboSet(cone_parameters(
+                    centers[0:1], radii[0:1], centers[1:2], radii[1:2]))
+            # Per neuron objects of the other render modes, created when first drawn
+            self.neuron_imposters = []
+            self.neuron_instances = []
+            self.neuron_renderers330 = []
+            self.neuron_lods = []
+            if frames is not None:
+                self.runHeadless(frames)
+                return
 
             # pass arguments to init
             glutInit()
@@ -671,11 +644,43 @@ class SimpleImposterViewer:
 
 # Print message to console, and kick off the main to get it rolling.
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Draw sphere and cone imposters of SWC neurons")
+    parser.add_argument("swc_files", nargs="*")
+    parser.add_argument("--mode", default="scene", choices=["scene", "vbo", "instanced", "lod", "330", "bricks"],
+            help="neuron render mode, as cycled by the 'm' key")
+    parser.add_argument("--frames", type=int,
+            help="draw this many frames offscreen, without a window, then exit")
+    parser.add_argument("--report", action="store_true",
+            help="print frame time statistics at exit")
+    parser.add_argument("--json", help="write frame time statistics to this file at exit")
+    parser.add_argument("--deferred", action="store_true",
+            help="start with deferred shading of the 330 mode, as toggled by the 'g' key")
+    parser.add_argument("--compact", action="store_true",
+            help="store the instanced and bricks modes in 16 bit positions and half float radii")
+    parser.add_argument("--bricks",
+            help="directory written by brick_pager.py, drawn in the bricks mode")
+    parser.add_argument("--brick-budget", type=float, default=DEFAULT_BUDGET / float(1 << 20),
+            help="megabytes of bricks kept resident")
+    args = parser.parse_args()
+    if args.mode == "bricks" and args.bricks is None:
+        parser.error("the bricks mode needs --bricks")
+    if args.frames is not None:
+        v = SimpleImposterViewer()
+        v.deferredShading = args.deferred
+        v.compactInstances = args.compact
+        v.brickDirectory = args.bricks
+        v.brickBudget = int(args.brick_budget * (1 << 20))
+        v.show(args.swc_files, args.frames, args.mode, args.report, args.json)
+        sys.exit()
     try:
         ## your code, typically one function call
-        print "Hit ESC key to quit."
+        print "Hit ESC key to quit, 'm' to switch neuron render mode, 'h' to change sphere hull, 'z' to toggle early depth, 'o' to toggle front to back order, 'v' to toggle vertex pulling, 'g' to toggle deferred shading, 'c' to toggle culling, 'k' to change 330 coloring, 'f' to show frame statistics, 'p' to print them."
         v = SimpleImposterViewer()
-        v.show(sys.argv[1:]) 
+        v.deferredShading = args.deferred
+        v.compactInstances = args.compact
+        v.brickDirectory = args.bricks
+        v.brickBudget = int(args.brick_budget * (1 << 20))
+        v.show(args.swc_files, mode=args.mode, report=args.report, jsonFile=args.json) 
     except:
         print sys.exc_info()[0]
         print traceback.format_exc()